@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hmac
 import json
 import os
 from dataclasses import dataclass
@@ -8,12 +9,34 @@ from typing import List, Dict, Any
 from flask import Flask, jsonify, render_template, request, redirect, url_for, session
 
 from services.qa_engine import QAEngine, AnswerResult
-from services.gamification import GamificationEngine
+from services.gamification import GamificationEngine, UnknownUser
+from services.progress_store import MemoryProgressStore, SQLiteProgressStore
 from services.course_manager import CourseManager
 from services.coding_challenges import CodingChallenges
+from services.grading_queue import GradingQueue, QueueFull, SQLiteJobStore
 from services.resume_analyzer import ResumeAnalyzer
 from services.interview_prep import InterviewPrep
 
+MAX_BATCH_QUESTIONS = 1000
+MAX_SUBMISSION_WAIT = 30.0
+MAX_LEADERBOARD_LIMIT = 100
+MAX_LEADERBOARD_RADIUS = 25
+
+
+def _serialize_answer(result: AnswerResult) -> Dict[str, Any]:
+    return {
+        "answer": result.answer,
+        "subject": result.subject,
+        "confidence": result.confidence,
+        "sources": [
+            {
+                "question": s.question,
+                "subject": s.subject,
+                "score": s.score,
+            } for s in result.sources
+        ]
+    }
+
 def create_app() -> Flask:
     app = Flask(
         __name__,
@@ -21,13 +44,51 @@ def create_app() -> Flask:
         template_folder="templates",
     )
     app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+    app.config["ADMIN_TOKEN"] = os.environ.get("ADMIN_TOKEN")
 
     # Initialize services
-    dataset_path = os.path.join(os.path.dirname(__file__), "data", "qa_dataset.json")
-    app.qa_engine = QAEngine(dataset_path=dataset_path)
-    app.gamification = GamificationEngine()
+    dataset_path = os.environ.get(
+        "QA_DATASET_PATH", os.path.join(os.path.dirname(__file__), "data", "qa_dataset.json")
+    )
+    index_dir = os.environ.get(
+        "QA_INDEX_DIR", os.path.join(os.path.dirname(__file__), "data", "qa_index")
+    )
+    app.qa_engine = QAEngine(
+        dataset_path=dataset_path,
+        index_dir=index_dir,
+        retrieval=os.environ.get("QA_RETRIEVAL", "exact"),
+        ann_probe=int(os.environ.get("QA_ANN_PROBE", 8)),
+        shard_workers=int(os.environ.get("QA_SHARD_WORKERS", 0)),
+        features=os.environ.get("QA_FEATURES", "tfidf"),
+        compact_interval=float(os.environ.get("QA_COMPACT_INTERVAL", 60.0)),
+    )
+    progress_db = os.environ.get("PROGRESS_DB", os.path.join(os.path.dirname(__file__), "data", "progress.db"))
+    if os.environ.get("PROGRESS_STORE", "sqlite") == "memory":
+        progress_store = MemoryProgressStore()
+        job_store = None
+    else:
+        progress_store = SQLiteProgressStore(
+            progress_db,
+            flush_interval=float(os.environ.get("PROGRESS_FLUSH_INTERVAL", 1.0)),
+        )
+        # Grading jobs share the progress database so any worker can answer a poll
+        job_store = SQLiteJobStore(progress_db)
+    app.gamification = GamificationEngine(store=progress_store)
     app.course_manager = CourseManager()
-    app.coding_challenges = CodingChallenges()
+    app.coding_challenges = CodingChallenges(
+        challenges_dir=os.environ.get("CHALLENGES_DIR"),
+        pool_size=int(os.environ.get("GRADER_POOL_SIZE", 2)),
+        result_cache_size=int(os.environ.get("GRADER_CACHE_SIZE", 1024)),
+        parallel_cases=int(os.environ.get("GRADER_PARALLEL_CASES", 1)),
+        submission_deadline=float(os.environ["GRADER_DEADLINE"]) if os.environ.get("GRADER_DEADLINE") else None,
+    )
+    app.grading_queue = GradingQueue(
+        app.coding_challenges.run_test,
+        workers=int(os.environ.get("GRADING_WORKERS", 2)),
+        max_pending=int(os.environ.get("GRADING_QUEUE_DEPTH", 64)),
+        metrics=app.coding_challenges.metrics,
+        store=job_store,
+    )
     app.resume_analyzer = ResumeAnalyzer()
     app.interview_prep = InterviewPrep()
 
@@ -57,7 +118,13 @@ def create_app() -> Flask:
 
     @app.get("/health")
     def health() -> Any:
-        return jsonify({"status": "ok", "items": app.qa_engine.size})
+        return jsonify({
+            "status": "ok",
+            "items": app.qa_engine.size,
+            "cache": app.qa_engine.cache.stats(),
+            "grading": app.grading_queue.stats(),
+            "submission_cache": app.coding_challenges.result_cache.stats(),
+        })
 
     @app.post("/api/ask")
     def api_ask() -> Any:
@@ -67,18 +134,85 @@ def create_app() -> Flask:
         if not question:
             return jsonify({"error": "Question is required."}), 400
         result: AnswerResult = app.qa_engine.answer(question=question, subject=subject)
-        return jsonify({
-            "answer": result.answer,
-            "subject": result.subject,
-            "confidence": result.confidence,
-            "sources": [
-                {
-                    "question": s.question,
-                    "subject": s.subject,
-                    "score": s.score,
-                } for s in result.sources
-            ]
-        })
+        return jsonify(_serialize_answer(result))
+
+    @app.post("/api/ask/batch")
+    def api_ask_batch() -> Any:
+        payload = request.get_json(silent=True) or {}
+        items = payload.get("questions")
+        default_subject = (payload.get("subject") or "General").strip()
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "A non-empty list of questions is required."}), 400
+        if len(items) > MAX_BATCH_QUESTIONS:
+            return jsonify({"error": f"At most {MAX_BATCH_QUESTIONS} questions per batch."}), 400
+
+        questions: List[str] = []
+        subjects: List[str] = []
+        for item in items:
+            if isinstance(item, dict):
+                question = (item.get("question") or "").strip()
+                subject = (item.get("subject") or default_subject).strip()
+            else:
+                question = str(item or "").strip()
+                subject = default_subject
+            if not question:
+                return jsonify({"error": "Every question must be non-empty."}), 400
+            questions.append(question)
+            subjects.append(subject)
+
+        results = app.qa_engine.answer_many(questions=questions, subjects=subjects)
+        return jsonify({"results": [_serialize_answer(r) for r in results]})
+
+    def admin_denied() -> Any:
+        # The admin routes are off unless ADMIN_TOKEN is configured
+        token = app.config.get("ADMIN_TOKEN")
+        if not token:
+            return jsonify({"error": "Admin API is disabled"}), 404
+        supplied = request.headers.get("X-Admin-Token", "")
+        if not hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8")):
+            return jsonify({"error": "Unauthorized"}), 401
+        return None
+
+    @app.post("/api/admin/qa")
+    def api_admin_upsert_qa() -> Any:
+        denied = admin_denied()
+        if denied:
+            return denied
+        payload = request.get_json(silent=True) or {}
+        try:
+            entry = app.qa_engine.upsert(
+                question=payload.get("question") or "",
+                answer=payload.get("answer") or "",
+                subject=payload.get("subject") or "General",
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"entry": entry, "items": app.qa_engine.size})
+
+    @app.delete("/api/admin/qa")
+    def api_admin_delete_qa() -> Any:
+        denied = admin_denied()
+        if denied:
+            return denied
+        payload = request.get_json(silent=True) or {}
+        question = (payload.get("question") or "").strip()
+        if not question:
+            return jsonify({"error": "Question is required."}), 400
+        try:
+            deleted = app.qa_engine.delete(question=question, subject=payload.get("subject") or "General")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not deleted:
+            return jsonify({"error": "Entry not found"}), 404
+        return jsonify({"deleted": True, "items": app.qa_engine.size})
+
+    @app.post("/api/admin/qa/compact")
+    def api_admin_compact_qa() -> Any:
+        denied = admin_denied()
+        if denied:
+            return denied
+        app.qa_engine.compact(block=False)
+        return jsonify({"status": "compacting"}), 202
 
     @app.get("/api/courses")
     def api_courses() -> Any:
@@ -96,12 +230,42 @@ def create_app() -> Flask:
         challenge_id = payload.get("challenge_id")
         code = payload.get("code")
         language = payload.get("language", "python")
+        fail_fast = bool(payload.get("fail_fast", False))
         
-        if not challenge_id or not code:
+        if not isinstance(challenge_id, str) or not isinstance(code, str) or not challenge_id or not code:
             return jsonify({"error": "Challenge ID and code are required"}), 400
+        try:
+            challenge = app.coding_challenges.get_challenge_by_id(challenge_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 404
+        if language not in challenge.starter_code:
+            return jsonify({"error": f"Language {language} not supported for this challenge"}), 400
         
-        result = app.coding_challenges.run_test(challenge_id, code, language)
-        return jsonify(result)
+        try:
+            job = app.grading_queue.submit(challenge_id, code, language, fail_fast)
+        except QueueFull:
+            response = jsonify({"error": "Grading queue is full, please retry shortly"})
+            response.headers["Retry-After"] = "5"
+            return response, 429
+        return jsonify(job.to_dict()), 202
+
+    @app.get("/api/metrics/grader")
+    def api_grader_metrics() -> Any:
+        # ?challenge_id=... narrows the histograms to one challenge
+        challenge_id = request.args.get("challenge_id")
+        return jsonify(app.coding_challenges.metrics.snapshot(challenge_id))
+
+    @app.get("/api/submit-challenge/<job_id>")
+    def api_submission_status(job_id: str) -> Any:
+        # ?wait=N long-polls up to N seconds for the result
+        try:
+            wait = min(float(request.args.get("wait", 0)), MAX_SUBMISSION_WAIT)
+        except ValueError:
+            return jsonify({"error": "wait must be a number of seconds"}), 400
+        job = app.grading_queue.wait(job_id, wait)
+        if job is None:
+            return jsonify({"error": "Unknown submission"}), 404
+        return jsonify(job.to_dict())
 
     @app.post("/api/analyze-resume")
     def api_analyze_resume() -> Any:
@@ -131,7 +295,11 @@ def create_app() -> Flask:
         
         # Update user progress and award points
         user_id = session.get('user_id', 'anonymous')
-        result = app.gamification.complete_lesson(user_id, lesson_id, score)
+        course_id = app.course_manager.get_course_id_for_lesson(lesson_id)
+        try:
+            result = app.gamification.complete_lesson(user_id, lesson_id, score, course_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         return jsonify(result)
 
     @app.get("/api/user-progress")
@@ -140,6 +308,56 @@ def create_app() -> Flask:
         progress = app.gamification.get_user_progress(user_id)
         return jsonify(progress)
 
+    @app.post("/api/help-peer")
+    def api_help_peer() -> Any:
+        payload = request.get_json(silent=True) or {}
+        peer_id = (payload.get("peer_id") or "").strip()
+        
+        if not peer_id:
+            return jsonify({"error": "Peer ID is required"}), 400
+        
+        user_id = session.get('user_id', 'anonymous')
+        try:
+            result = app.gamification.record_peer_help(user_id, peer_id)
+        except UnknownUser as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(result)
+
+    @app.get("/api/leaderboard")
+    def api_leaderboard() -> Any:
+        # ?window=daily|weekly and ?course_id=... select a windowed or per-course leaderboard
+        try:
+            limit = int(request.args.get("limit", 10))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, MAX_LEADERBOARD_LIMIT))
+        try:
+            entries = app.gamification.get_leaderboard(
+                limit, window=request.args.get("window", "all"), course_id=request.args.get("course_id")
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"entries": entries})
+
+    @app.get("/api/leaderboard/me")
+    def api_leaderboard_me() -> Any:
+        # ?radius=N also returns the N users ranked either side of the current user
+        try:
+            radius = int(request.args.get("radius", 2))
+        except ValueError:
+            return jsonify({"error": "radius must be an integer"}), 400
+        radius = max(0, min(radius, MAX_LEADERBOARD_RADIUS))
+        user_id = session.get('user_id', 'anonymous')
+        try:
+            position = app.gamification.get_leaderboard_position(
+                user_id, radius, window=request.args.get("window", "all"), course_id=request.args.get("course_id")
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(position)
+
     return app
 
 if __name__ == "__main__":
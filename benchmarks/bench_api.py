@@ -0,0 +1,403 @@
+"""Latency/throughput benchmarks for every /api endpoint.
+
+Builds the app with ``create_app()`` over a synthetic Q&A corpus, drives each
+endpoint through the Flask test client and (optionally) a local gunicorn, and
+writes p50/p95/p99 latency, requests/second and peak RSS to a JSON report that
+can be diffed between releases.
+
+Usage:
+    python -m benchmarks.bench_api --qa-entries 20000 --requests 200
+    python -m benchmarks.bench_api --gunicorn --workers 2 --concurrency 8 --out bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+SUBJECTS = ["Computer Science", "Mathematics", "Physics", "English", "Biology", "History"]
+SKILLS = ["python", "java", "react", "docker", "aws", "postgresql", "kubernetes", "flask", "git"]
+SECRET_KEY = "bench-secret-key"
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    payload: Callable[[random.Random], Optional[Dict[str, Any]]]
+    per_user: bool = False
+    # Follow a 202 grading job until it is done, so latency covers the whole grade
+    poll: bool = False
+
+
+# Long-poll interval when following a grading job
+POLL_WAIT = 5
+
+
+def _words(rng: random.Random, vocab: List[str], n: int) -> str:
+    return " ".join(rng.choice(vocab) for _ in range(n))
+
+
+def make_qa_dataset(path: str, n: int, seed: int = 0) -> List[str]:
+    """Write ``n`` synthetic Q&A entries as JSON Lines and return their questions."""
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(max(500, n // 10))]
+    questions: List[str] = []
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(n):
+            question = "What is " + _words(rng, vocab, 6)
+            entry = {
+                "subject": rng.choice(SUBJECTS),
+                "question": question,
+                "answer": _words(rng, vocab, 40),
+            }
+            f.write(json.dumps(entry) + "\n")
+            questions.append(question)
+    return questions
+
+
+def make_resume(rng: random.Random) -> str:
+    skills = ", ".join(rng.sample(SKILLS, 4))
+    years = rng.randint(1, 15)
+    return (
+        "John Doe\nSoftware Engineer\n\nSummary\n"
+        f"Engineer with {years} years of experience building web services.\n\n"
+        f"Skills\n{skills}\n\nExperience\nSenior Developer at Example Corp 2018-2024\n"
+        "Led migration of monolith to microservices, improving latency by 40%.\n\n"
+        "Education\nBachelor of Science in Computer Science\n"
+    )
+
+
+def make_solution(rng: random.Random) -> str:
+    # A distinct identifier per request so every submission misses the result cache and is really
+    # graded; comments and whitespace would not do, the cache key normalizes them away
+    n = rng.randrange(10 ** 12)
+    return f"def reverse_string(s):\n    unused_{n} = {n}\n    return s[::-1]\n"
+
+
+def build_scenarios(questions: List[str], users: int, job_id: Optional[str] = None) -> List[Scenario]:
+    scenarios = [
+        Scenario("health", "GET", "/health", lambda rng: None),
+        Scenario("ask", "POST", "/api/ask", lambda rng: {
+            "question": rng.choice(questions), "subject": rng.choice(SUBJECTS)}),
+        Scenario("ask_batch_32", "POST", "/api/ask/batch", lambda rng: {
+            "questions": [rng.choice(questions) for _ in range(32)]}),
+        Scenario("courses", "GET", "/api/courses", lambda rng: None),
+        Scenario("challenges", "GET", "/api/challenges", lambda rng: None),
+        Scenario("submit_challenge", "POST", "/api/submit-challenge", lambda rng: {
+            "challenge_id": "reverse_string", "code": make_solution(rng), "language": "python"}, poll=True),
+        Scenario("analyze_resume", "POST", "/api/analyze-resume", lambda rng: {
+            "resume_text": make_resume(rng)}),
+        Scenario("interview_questions", "GET", "/api/interview-questions?subject=algorithms", lambda rng: None),
+        Scenario("complete_lesson", "POST", "/api/complete-lesson", lambda rng: {
+            "lesson_id": f"lesson_{rng.randint(1, 50)}", "score": rng.randint(50, 100)}, per_user=True),
+        Scenario("user_progress", "GET", "/api/user-progress", lambda rng: None, per_user=True),
+        Scenario("leaderboard", "GET", "/api/leaderboard?limit=10", lambda rng: None),
+        Scenario("leaderboard_me", "GET", "/api/leaderboard/me?radius=2", lambda rng: None, per_user=True),
+        Scenario("help_peer", "POST", "/api/help-peer", lambda rng: {
+            "peer_id": f"user_{rng.randrange(users)}"}, per_user=True),
+        Scenario("grader_metrics", "GET", "/api/metrics/grader", lambda rng: None),
+    ]
+    if job_id is not None:
+        scenarios.append(Scenario("submission_status", "GET", f"/api/submit-challenge/{job_id}", lambda rng: None))
+    return scenarios
+
+
+def seed_app(app: Any, users: int) -> Optional[str]:
+    """Give every synthetic user some progress and grade one submission.
+
+    Peers must exist before they can be helped, and the status scenario
+    needs a finished job to look up. Returns that job's id.
+    """
+    for i in range(users):
+        app.gamification.complete_lesson(f"user_{i}", "lesson_0", 50)
+    app.gamification.store.flush()
+    client = app.test_client()
+    response = client.post("/api/submit-challenge", json={
+        "challenge_id": "reverse_string", "code": "def reverse_string(s):\n    return s[::-1]\n"})
+    if response.status_code != 202:
+        return None
+    job_id = response.get_json()["job_id"]
+    while client.get(f"/api/submit-challenge/{job_id}?wait={POLL_WAIT}").get_json()["status"] != "done":
+        pass
+    return job_id
+
+
+def summarize(latencies: List[float], wall: float, statuses: Counter) -> Dict[str, Any]:
+    ms = np.asarray(latencies) * 1000.0
+    failed = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+    return {
+        # Latency of failing requests says nothing about the endpoint; such scenarios fail the run
+        "failed": failed,
+        "requests": len(latencies),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "max_ms": float(ms.max()),
+        "rps": len(latencies) / wall if wall > 0 else 0.0,
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def session_cookie(app: Any, user_id: str) -> str:
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({"user_id": user_id})
+
+
+def run_test_client(app: Any, scenarios: List[Scenario], n_requests: int, users: int, seed: int) -> Dict[str, Any]:
+    client = app.test_client()
+    cookie_name = app.config["SESSION_COOKIE_NAME"]
+    cookies = [session_cookie(app, f"user_{i}") for i in range(users)]
+    results: Dict[str, Any] = {}
+    for scenario in scenarios:
+        rng = random.Random(seed)
+        latencies: List[float] = []
+        statuses: Counter = Counter()
+        started = time.perf_counter()
+        for _ in range(n_requests):
+            payload = scenario.payload(rng)
+            if scenario.per_user:
+                client.set_cookie(cookie_name, rng.choice(cookies))
+            t0 = time.perf_counter()
+            response = client.open(scenario.path, method=scenario.method, json=payload)
+            if scenario.poll and response.status_code == 202:
+                path = f"{scenario.path}/{response.get_json()['job_id']}?wait={POLL_WAIT}"
+                response = client.get(path)
+                while response.status_code == 200 and response.get_json()["status"] != "done":
+                    response = client.get(path)
+            latencies.append(time.perf_counter() - t0)
+            statuses[response.status_code] += 1
+        results[scenario.name] = summarize(latencies, time.perf_counter() - started, statuses)
+    results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _process_tree(pid: int) -> List[int]:
+    pids = [pid]
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        children = f.read().split()
+    for child in children:
+        pids.extend(_process_tree(int(child)))
+    return pids
+
+
+def _peak_rss_mb(pid: int) -> Optional[float]:
+    """Sum of VmHWM over gunicorn's master and workers (Linux only)."""
+    total_kb = 0
+    try:
+        for p in _process_tree(pid):
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total_kb += int(line.split()[1])
+    except OSError:
+        return None
+    return total_kb / 1024.0
+
+
+def _send(url: str, method: str, payload: Optional[Dict[str, Any]], cookie: Optional[str]) -> Tuple[int, bytes]:
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    if data is not None:
+        req.add_header("Content-Type", "application/json")
+    if cookie:
+        req.add_header("Cookie", cookie)
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, b""
+
+
+def _request(base: str, scenario: Scenario, payload: Optional[Dict[str, Any]], cookie: Optional[str]) -> Tuple[float, int]:
+    t0 = time.perf_counter()
+    status, body = _send(base + scenario.path, scenario.method, payload, cookie)
+    if scenario.poll and status == 202:
+        # Polls may land on another worker; jobs are shared through the progress database
+        url = f"{base}{scenario.path}/{json.loads(body)['job_id']}?wait={POLL_WAIT}"
+        status, body = _send(url, "GET", None, cookie)
+        while status == 200 and json.loads(body)["status"] != "done":
+            status, body = _send(url, "GET", None, cookie)
+    return time.perf_counter() - t0, status
+
+
+def run_gunicorn(
+    app: Any,
+    env: Dict[str, str],
+    scenarios: List[Scenario],
+    n_requests: int,
+    users: int,
+    workers: int,
+    threads: int,
+    concurrency: int,
+    seed: int,
+) -> Dict[str, Any]:
+    if importlib.util.find_spec("gunicorn") is None:
+        return {"skipped": "gunicorn is not installed"}
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+         "-b", f"127.0.0.1:{port}", "app:create_app()"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        started = time.perf_counter()
+        while True:
+            try:
+                urllib.request.urlopen(base + "/health", timeout=1).read()
+                break
+            except OSError:
+                if proc.poll() is not None or time.perf_counter() - started > 120:
+                    return {"skipped": "gunicorn failed to start"}
+                time.sleep(0.1)
+        results: Dict[str, Any] = {"startup_s": time.perf_counter() - started}
+
+        cookie_name = app.config["SESSION_COOKIE_NAME"]
+        cookies = [f"{cookie_name}={session_cookie(app, f'user_{i}')}" for i in range(users)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for scenario in scenarios:
+                rng = random.Random(seed)
+                jobs = [
+                    (scenario.payload(rng), rng.choice(cookies) if scenario.per_user else None)
+                    for _ in range(n_requests)
+                ]
+                t0 = time.perf_counter()
+                outcomes = list(pool.map(lambda job: _request(base, scenario, *job), jobs))
+                wall = time.perf_counter() - t0
+                statuses = Counter(status for _, status in outcomes)
+                results[scenario.name] = summarize([lat for lat, _ in outcomes], wall, statuses)
+        results["peak_rss_mb"] = _peak_rss_mb(proc.pid)
+        return results
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qa-entries", type=int, default=5000, help="synthetic Q&A corpus size")
+    parser.add_argument("--users", type=int, default=1000, help="distinct synthetic users for gamification endpoints")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--only", nargs="*", help="run only these scenario names")
+    parser.add_argument("--gunicorn", action="store_true", help="also benchmark a local gunicorn server")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_output.json")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="lurnzo-bench-")
+    try:
+        dataset_path = os.path.join(workdir, "qa_dataset.jsonl")
+        questions = make_qa_dataset(dataset_path, args.qa_entries, args.seed)
+        env = dict(os.environ)
+        env.update({
+            "QA_DATASET_PATH": dataset_path,
+            "QA_INDEX_DIR": os.path.join(workdir, "qa_index"),
+            "PROGRESS_DB": os.path.join(workdir, "progress.db"),
+            "SECRET_KEY": SECRET_KEY,
+        })
+        os.environ.update(env)
+
+        from app import create_app
+
+        t0 = time.perf_counter()
+        app = create_app()
+        build_s = time.perf_counter() - t0
+
+        job_id = seed_app(app, args.users)
+        scenarios = build_scenarios(questions, args.users, job_id)
+        if args.only:
+            scenarios = [s for s in scenarios if s.name in args.only]
+
+        report: Dict[str, Any] = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "git_rev": _git_rev(),
+                "args": vars(args),
+                "create_app_s": build_s,
+            },
+            "test_client": run_test_client(app, scenarios, args.requests, args.users, args.seed),
+        }
+        if args.gunicorn:
+            report["gunicorn"] = run_gunicorn(
+                app, env, scenarios, args.requests, args.users,
+                args.workers, args.threads, args.concurrency, args.seed,
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    failing: List[str] = []
+    for mode in ("test_client", "gunicorn"):
+        section = report.get(mode)
+        if not section:
+            continue
+        print(f"== {mode} ==")
+        for name, stats in section.items():
+            if isinstance(stats, dict) and "p50_ms" in stats:
+                flag = "  FAILED" if stats["failed"] else ""
+                print(f"  {name:<22} p50 {stats['p50_ms']:8.2f}  p95 {stats['p95_ms']:8.2f}  "
+                      f"p99 {stats['p99_ms']:8.2f} ms  {stats['rps']:8.1f} rps  {stats['status']}{flag}")
+                if stats["failed"]:
+                    failing.append(f"{mode}/{name}")
+        print(f"  peak RSS: {section.get('peak_rss_mb')} MB")
+    print(f"Report written to {args.out}")
+    if failing:
+        print(f"Non-2xx responses in: {', '.join(failing)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Contention benchmark for ``GamificationEngine.complete_lesson``.
+
+Drives the engine directly from 1, 2, 4, ... threads with the same number of
+lesson completions per thread, in two workloads:
+
+* ``disjoint``: every thread works on its own users, so threads only meet
+  on the rare stripe shared by two users.
+* ``hot``: every thread hammers the same few users, so updates for one user
+  serialize on its stripe lock.
+
+After each run every user's experience, points, streak and lessons, as well
+as the leaderboard, are checked against what the threads submitted, so a lost
+update fails the run. Under CPython's GIL pure-Python work does not run in
+parallel, so compare the scaling column with ``--stripes 1`` (a single global
+lock) rather than expecting it to equal the thread count.
+
+Usage:
+    python -m benchmarks.bench_gamification --threads 1 2 4 8 --ops 5000
+    python -m benchmarks.bench_gamification --store sqlite --stripes 1 --out bench_gamification.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from services.gamification import GamificationEngine
+from services.progress_store import MemoryProgressStore, ProgressStore, SQLiteProgressStore
+
+COURSES = ["python_basics", "data_science_intro", "web_development"]
+
+
+def make_store(kind: str, workdir: str, run: str) -> ProgressStore:
+    if kind == "sqlite":
+        return SQLiteProgressStore(os.path.join(workdir, f"{run}.db"), flush_interval=0.05)
+    return MemoryProgressStore()
+
+
+def plan(workload: str, thread: int, ops: int, hot_users: int, seed: int) -> List[Tuple[str, str, int, str]]:
+    """The ``(user_id, lesson_id, score, course_id)`` completions one thread submits."""
+    rng = random.Random(seed * 1000 + thread)
+    jobs = []
+    for i in range(ops):
+        if workload == "hot":
+            user_id = f"hot_{rng.randrange(hot_users)}"
+        else:
+            user_id = f"t{thread}_user_{rng.randrange(50)}"
+        jobs.append((user_id, f"lesson_{rng.randrange(200)}", rng.randint(0, 100), rng.choice(COURSES)))
+    return jobs
+
+
+def run_once(engine: GamificationEngine, plans: List[List[Tuple[str, str, int, str]]]) -> float:
+    barrier = threading.Barrier(len(plans) + 1)
+
+    def worker(jobs: List[Tuple[str, str, int, str]]) -> None:
+        barrier.wait()
+        for user_id, lesson_id, score, course_id in jobs:
+            engine.complete_lesson(user_id, lesson_id, score, course_id)
+
+    threads = [threading.Thread(target=worker, args=(jobs,)) for jobs in plans]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started
+
+
+def verify(engine: GamificationEngine, plans: List[List[Tuple[str, str, int, str]]]) -> List[str]:
+    """Compare the engine's state with the submitted completions; returns the mismatches."""
+    expected: Dict[str, Dict[str, Any]] = {}
+    for jobs in plans:
+        for user_id, lesson_id, score, _ in jobs:
+            user = expected.setdefault(user_id, {"experience": 0, "total_points": 0, "streak_days": 0, "lessons": set()})
+            user["experience"] += score * 10
+            user["total_points"] += score * 2
+            user["streak_days"] += 1
+            user["lessons"].add(lesson_id)
+
+    errors = []
+    engine.get_leaderboard(1)  # Seeds the leaderboard of a freshly opened engine
+    for user_id, want in expected.items():
+        got = engine.get_user_progress(user_id)
+        for key in ("experience", "total_points", "streak_days"):
+            if got[key] != want[key]:
+                errors.append(f"{user_id} {key}: expected {want[key]}, got {got[key]}")
+        if got["completed_lessons"] != len(want["lessons"]):
+            errors.append(f"{user_id} completed_lessons: expected {len(want['lessons'])}, got {got['completed_lessons']}")
+        if engine.leaderboard.points(user_id) != want["total_points"]:
+            errors.append(f"{user_id} leaderboard: expected {want['total_points']}, got {engine.leaderboard.points(user_id)}")
+    return errors
+
+
+def bench(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for workload in ("disjoint", "hot"):
+        rows = []
+        baseline: Optional[float] = None
+        for n in args.threads:
+            store = make_store(args.store, workdir, f"{workload}_{n}")
+            engine = GamificationEngine(store=store, lock_stripes=args.stripes)
+            plans = [plan(workload, t, args.ops, args.hot_users, args.seed) for t in range(n)]
+            wall = run_once(engine, plans)
+            store.flush()
+            errors = verify(engine, plans)
+            if args.store == "sqlite":
+                # A fresh engine over the same file must see the same totals once flushed
+                reopened = GamificationEngine(store=make_store(args.store, workdir, f"{workload}_{n}"))
+                errors += [f"after reload: {e}" for e in verify(reopened, plans)]
+            store.close()
+
+            ops_per_s = n * args.ops / wall
+            baseline = baseline or ops_per_s
+            rows.append({
+                "threads": n,
+                "ops": n * args.ops,
+                "wall_s": wall,
+                "ops_per_s": ops_per_s,
+                "scaling": ops_per_s / baseline,
+                "lost_updates": len(errors),
+                "errors": errors[:10],
+            })
+        results[workload] = rows
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=5000, help="lesson completions per thread")
+    parser.add_argument("--hot-users", type=int, default=4, help="users shared by every thread in the hot workload")
+    parser.add_argument("--stripes", type=int, default=64, help="lock stripes; 1 is a single global lock")
+    parser.add_argument("--store", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_gamification.json")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="lurnzo-bench-")
+    try:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "args": vars(args),
+            },
+            "results": bench(args, workdir),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    failed = False
+    for workload, rows in report["results"].items():
+        print(f"== {workload} ==")
+        for row in rows:
+            print(f"  {row['threads']:>3} threads  {row['ops_per_s']:10.1f} ops/s  "
+                  f"scaling {row['scaling']:5.2f}x  lost updates {row['lost_updates']}")
+            for error in row["errors"]:
+                print(f"    {error}")
+            failed = failed or bool(row["lost_updates"])
+    print(f"Report written to {args.out}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
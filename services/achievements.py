@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import bisect
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class AchievementRule:
+    """When an achievement unlocks.
+
+    A counter rule unlocks once ``counter`` reaches ``threshold``. An event
+    rule unlocks when ``predicate`` holds for an event of type ``event``.
+    """
+    achievement_id: str
+    counter: Optional[str] = None
+    threshold: int = 0
+    event: Optional[str] = None
+    predicate: Optional[Callable[[Dict[str, Any]], bool]] = None
+
+
+class _CounterIndex:
+    """Rules on one counter, sorted by threshold."""
+
+    def __init__(self) -> None:
+        self.thresholds: List[int] = []
+        self.entries: List[Tuple[int, str]] = []
+        # reached_masks[k] has the bits of the first k rules, to skip fully unlocked prefixes
+        self.reached_masks: List[int] = [0]
+
+    def build(self, rules: List[Tuple[int, AchievementRule]]) -> None:
+        rules.sort(key=lambda item: item[1].threshold)
+        self.thresholds = [rule.threshold for _, rule in rules]
+        self.entries = [(bit, rule.achievement_id) for bit, rule in rules]
+        self.reached_masks = [0]
+        for bit, _ in self.entries:
+            self.reached_masks.append(self.reached_masks[-1] | bit)
+
+
+class AchievementEngine:
+    """Evaluates achievement rules against one user's events and counters.
+
+    Each achievement owns one bit, so a user's unlocked set is a single int.
+    Rules are indexed by the event type or counter they depend on, and an
+    update only looks at the rules subscribed to what changed. Counter rules
+    are sorted by threshold, so a counter update is a bisect plus a mask
+    test when everything it has reached is already unlocked.
+    """
+
+    def __init__(self, achievement_ids: Iterable[str], rules: Iterable[AchievementRule]) -> None:
+        self.bits: Dict[str, int] = {aid: 1 << i for i, aid in enumerate(achievement_ids)}
+        self._event_rules: Dict[str, List[Tuple[int, AchievementRule]]] = {}
+        counter_rules: Dict[str, List[Tuple[int, AchievementRule]]] = {}
+        for rule in rules:
+            bit = self.bits.get(rule.achievement_id)
+            if bit is None:
+                raise ValueError(f"Rule for unknown achievement: {rule.achievement_id}")
+            if rule.counter is not None:
+                counter_rules.setdefault(rule.counter, []).append((bit, rule))
+            elif rule.event is not None and rule.predicate is not None:
+                self._event_rules.setdefault(rule.event, []).append((bit, rule))
+            else:
+                raise ValueError(f"Rule for {rule.achievement_id} needs a counter or an event and predicate")
+        self._counter_rules: Dict[str, _CounterIndex] = {}
+        for counter, indexed in counter_rules.items():
+            self._counter_rules[counter] = _CounterIndex()
+            self._counter_rules[counter].build(indexed)
+
+    def to_bits(self, achievement_ids: Iterable[str]) -> int:
+        bits = 0
+        for aid in achievement_ids:
+            bits |= self.bits.get(aid, 0)
+        return bits
+
+    def evaluate(
+        self,
+        unlocked: int,
+        event_type: Optional[str] = None,
+        event: Optional[Dict[str, Any]] = None,
+        counters: Optional[Dict[str, int]] = None,
+    ) -> Tuple[int, List[str]]:
+        """Return the updated bitset and the ids it newly unlocked.
+
+        ``counters`` holds the current values of the counters this event changed.
+        """
+        new_achievements: List[str] = []
+        for counter, value in (counters or {}).items():
+            index = self._counter_rules.get(counter)
+            if index is None:
+                continue
+            reached = bisect.bisect_right(index.thresholds, value)
+            if not index.reached_masks[reached] & ~unlocked:
+                continue
+            for bit, achievement_id in index.entries[:reached]:
+                if not unlocked & bit:
+                    unlocked |= bit
+                    new_achievements.append(achievement_id)
+
+        for bit, rule in self._event_rules.get(event_type, ()):
+            if not unlocked & bit and rule.predicate(event or {}):
+                unlocked |= bit
+                new_achievements.append(rule.achievement_id)
+        return unlocked, new_achievements
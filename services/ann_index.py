@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index over SVD-reduced TF-IDF rows.
+
+    Rows are projected to ``n_components`` dense dimensions, L2-normalized and
+    clustered into ``n_lists`` cells. A query only scans the vectors of its
+    ``n_probe`` closest cells, so raising ``n_probe`` trades latency for recall.
+    Search returns a shortlist of row ids meant to be re-ranked exactly.
+    A fitted index can be saved next to the TF-IDF index and loaded
+    memory-mapped, so workers share one copy instead of each refitting.
+    """
+
+    ARRAYS = ("projection", "centroids", "rows", "vectors", "offsets")
+
+    def __init__(
+        self,
+        n_components: int = 128,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        random_state: int = 0,
+    ) -> None:
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+
+    def fit(self, matrix: csr_matrix) -> "IVFIndex":
+        n_rows, n_features = matrix.shape
+        components = max(1, min(self.n_components, n_features - 1, n_rows - 1))
+        svd = TruncatedSVD(n_components=components, random_state=self.random_state)
+        vectors = self._normalize(svd.fit_transform(matrix).astype(np.float32))
+        # C-contiguous (n_features, n_components) so projecting a sparse query never copies it
+        self.projection = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+        n_lists = self.n_lists or int(np.sqrt(n_rows))
+        n_lists = max(1, min(n_lists, n_rows))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=self.random_state, n_init=1)
+        labels = kmeans.fit_predict(vectors)
+        self.centroids = self._normalize(kmeans.cluster_centers_.astype(np.float32))
+
+        # Store vectors grouped by cell so probing a cell is one contiguous slice
+        order = np.argsort(labels, kind="stable")
+        self.rows = order.astype(np.int64)
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))])
+        return self
+
+    def save(self, path: str) -> None:
+        """Write the fitted arrays to the directory ``path``, atomically; an existing copy is kept."""
+        parent = os.path.dirname(path) or "."
+        tmp_path = tempfile.mkdtemp(prefix=".ann-", dir=parent)
+        try:
+            for name in self.ARRAYS:
+                np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(self, name))
+            with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "n_components": self.n_components,
+                    "n_lists": self.n_lists,
+                    "random_state": self.random_state,
+                }, f)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Another worker saved it first; keep its copy
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, path: str, n_probe: int = 8, mmap_mode: Optional[str] = "r") -> Optional["IVFIndex"]:
+        """Load an index saved by ``save``, or None if there is none at ``path``."""
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        index = cls(n_probe=n_probe, **meta)
+        for name in cls.ARRAYS:
+            setattr(index, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+        return index
+
+    def search(self, query: csr_matrix, shortlist: int, n_probe: Optional[int] = None) -> np.ndarray:
+        """Return up to ``shortlist`` candidate row ids for a single query row."""
+        # Gather only the projection rows for the query's nonzero terms
+        query = query.tocsr()
+        q = query.data.astype(np.float32) @ self.projection[query.indices]
+        q = self._normalize(q[np.newaxis, :])[0]
+        n_probe = max(1, min(n_probe or self.n_probe, len(self.centroids)))
+        cell_scores = self.centroids @ q
+        cells = np.argpartition(-cell_scores, n_probe - 1)[:n_probe]
+
+        slices = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells]
+        positions = np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+        if positions.size > shortlist:
+            sims = self.vectors[positions] @ q
+            positions = positions[np.argpartition(-sims, shortlist - 1)[:shortlist]]
+        return np.sort(self.rows[positions])
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
@@ -1,15 +1,83 @@
 from __future__ import annotations
-import subprocess
-import tempfile
+import json
 import os
-from typing import Dict, List, Any
+import functools
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Any, Optional, Sequence
 from dataclasses import dataclass
 
+from services.grader_metrics import GraderMetrics
+from services.grader_pool import WORKER_PATH, GraderPool
+from services.grader_worker import apply_limits, check_output, user_task_count
+from services.java_runner import HARNESS_DIR, JavaRunner
+from services.submission_cache import SubmissionCache, challenge_version
+
+DEFAULT_CHALLENGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "challenges")
+CHALLENGE_FILE = "challenge.json"
+TESTS_FILE = "tests.json"
+NODE_HARNESS_PATH = os.path.join(HARNESS_DIR, "harness.js")
+# V8 reserves about a gigabyte of address space before running any code
+NODE_ADDRESS_SPACE_MB = 1024
+# Threads a runtime may start beyond those the server already runs; RLIMIT_NPROC counts threads
+RUNTIME_THREADS = 32
+
+# Name of the function a submission must define, found in each language's starter code
+ENTRY_POINT_PATTERNS = {
+    "python": re.compile(r"^def\s+(\w+)\s*\(", re.MULTILINE),
+    "javascript": re.compile(r"\bfunction\s+(\w+)\s*\("),
+    "java": re.compile(r"\b(?:public|protected|private|static)\s+(?:static\s+)?[\w<>\[\]]+\s+(\w+)\s*\("),
+}
+
 @dataclass
 class TestCase:
-    input: str
-    expected_output: str
-    description: str
+    input: str = ""
+    expected_output: str = ""
+    description: str = ""
+    # Large cases keep their data on disk: input_file is fed on stdin, expected_file is streamed
+    input_file: Optional[str] = None
+    expected_file: Optional[str] = None
+
+    def job_input(self) -> Any:
+        if self.input_file:
+            return {"input_file": self.input_file, "expected_file": self.expected_file}
+        return self.input
+
+class LazyTestCases(Sequence):
+    """Read-only list of test cases that parses ``path`` on first access."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._cases: Optional[List[TestCase]] = None
+        self._lock = threading.Lock()
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __repr__(self) -> str:
+        return f"LazyTestCases({self.path!r})"
+
+    def _load(self) -> List[TestCase]:
+        if self._cases is None:
+            with self._lock:
+                if self._cases is None:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        cases = [TestCase(**item) for item in json.load(f)]
+                    # Data files are named relative to the challenge directory
+                    base = os.path.dirname(self.path)
+                    for case in cases:
+                        if case.input_file:
+                            case.input_file = os.path.join(base, case.input_file)
+                            case.expected_file = os.path.join(base, case.expected_file)
+                    self._cases = cases
+        return self._cases
 
 @dataclass
 class CodingChallenge:
@@ -20,122 +88,61 @@ class CodingChallenge:
     category: str
     problem_statement: str
     examples: List[Dict[str, str]]
-    test_cases: List[TestCase]
+    test_cases: Sequence[TestCase]
     starter_code: Dict[str, str]
     time_limit: int  # seconds
     memory_limit: int  # MB
+    comparator: str = "exact"  # exact, tokens or float
+    tolerance: float = 1e-6
 
 class CodingChallenges:
-    def __init__(self):
+    def __init__(
+        self,
+        challenges_dir: Optional[str] = None,
+        pool_size: int = 0,
+        result_cache_size: int = 1024,
+        parallel_cases: int = 1,
+        submission_deadline: Optional[float] = None,
+    ):
+        self.challenges_dir = challenges_dir or DEFAULT_CHALLENGES_DIR
         self.challenges = self._load_challenges()
+        self._build_indexes()
+        self._versions: Dict[str, str] = {}
+        # Warm grader processes for Python submissions; 0 spawns one harness process per submission
+        self.grader_pool: Optional[GraderPool] = GraderPool(size=pool_size) if pool_size > 0 else None
+        self.node = shutil.which("node")
+        self._node_flags: Optional[List[str]] = None
+        self.java_runner = JavaRunner()
+        self.result_cache = SubmissionCache(max_size=result_cache_size)
+        self.metrics = GraderMetrics()
+        # Python test cases per submission run on this many processes; 0 uses every available core
+        self.parallel_cases = parallel_cases if parallel_cases > 0 else len(os.sched_getaffinity(0))
+        self.submission_deadline = submission_deadline
     
     def _load_challenges(self) -> List[CodingChallenge]:
-        return [
-            CodingChallenge(
-                id="reverse_string",
-                title="Reverse a String",
-                description="Write a function to reverse a given string",
-                difficulty="easy",
-                category="strings",
-                problem_statement="Given a string, return the string reversed. For example, 'hello' should return 'olleh'.",
-                examples=[
-                    {"input": "hello", "output": "olleh"},
-                    {"input": "world", "output": "dlrow"}
-                ],
-                test_cases=[
-                    TestCase("hello", "olleh", "Basic string reversal"),
-                    TestCase("python", "nohtyp", "Python string"),
-                    TestCase("", "", "Empty string"),
-                    TestCase("a", "a", "Single character")
-                ],
-                starter_code={
-                    "python": "def reverse_string(s):\n    # Your code here\n    pass",
-                    "javascript": "function reverseString(s) {\n    // Your code here\n}",
-                    "java": "public class Solution {\n    public String reverseString(String s) {\n        // Your code here\n        return \"\";\n    }\n}"
-                },
-                time_limit=5,
-                memory_limit=128
-            ),
-            CodingChallenge(
-                id="find_max",
-                title="Find Maximum Number",
-                description="Find the maximum number in an array",
-                difficulty="easy",
-                category="arrays",
-                problem_statement="Given an array of integers, return the maximum number in the array.",
-                examples=[
-                    {"input": "[1, 3, 5, 2, 4]", "output": "5"},
-                    {"input": "[-1, -5, -3]", "output": "-1"}
-                ],
-                test_cases=[
-                    TestCase("[1, 3, 5, 2, 4]", "5", "Positive numbers"),
-                    TestCase("[-1, -5, -3]", "-1", "Negative numbers"),
-                    TestCase("[42]", "42", "Single element"),
-                    TestCase("[]", "None", "Empty array")
-                ],
-                starter_code={
-                    "python": "def find_max(arr):\n    # Your code here\n    pass",
-                    "javascript": "function findMax(arr) {\n    // Your code here\n}",
-                    "java": "public class Solution {\n    public Integer findMax(int[] arr) {\n        // Your code here\n        return null;\n    }\n}"
-                },
-                time_limit=5,
-                memory_limit=128
-            ),
-            CodingChallenge(
-                id="fibonacci",
-                title="Fibonacci Sequence",
-                description="Calculate the nth Fibonacci number",
-                difficulty="medium",
-                category="recursion",
-                problem_statement="Write a function to calculate the nth Fibonacci number. F(0) = 0, F(1) = 1, F(n) = F(n-1) + F(n-2).",
-                examples=[
-                    {"input": "5", "output": "5"},
-                    {"input": "10", "output": "55"}
-                ],
-                test_cases=[
-                    TestCase("0", "0", "Base case 0"),
-                    TestCase("1", "1", "Base case 1"),
-                    TestCase("5", "5", "Small number"),
-                    TestCase("10", "55", "Medium number")
-                ],
-                starter_code={
-                    "python": "def fibonacci(n):\n    # Your code here\n    pass",
-                    "javascript": "function fibonacci(n) {\n    // Your code here\n}",
-                    "java": "public class Solution {\n    public int fibonacci(int n) {\n        // Your code here\n        return 0;\n    }\n}"
-                },
-                time_limit=10,
-                memory_limit=256
-            ),
-            CodingChallenge(
-                id="palindrome",
-                title="Check Palindrome",
-                description="Check if a string is a palindrome",
-                difficulty="easy",
-                category="strings",
-                problem_statement="A palindrome is a string that reads the same forwards and backwards. Write a function to check if a given string is a palindrome.",
-                examples=[
-                    {"input": "racecar", "output": "true"},
-                    {"input": "hello", "output": "false"}
-                ],
-                test_cases=[
-                    TestCase("racecar", "true", "Palindrome"),
-                    TestCase("hello", "false", "Not palindrome"),
-                    TestCase("", "true", "Empty string"),
-                    TestCase("a", "true", "Single character"),
-                    TestCase("A man a plan a canal Panama", "false", "With spaces")
-                ],
-                starter_code={
-                    "python": "def is_palindrome(s):\n    # Your code here\n    pass",
-                    "javascript": "function isPalindrome(s) {\n    // Your code here\n}",
-                    "java": "public class Solution {\n    public boolean isPalindrome(String s) {\n        // Your code here\n        return false;\n    }\n}"
-                },
-                time_limit=5,
-                memory_limit=128
-            )
-        ]
-    
-    def get_challenges(self) -> List[Dict[str, Any]]:
-        return [
+        # One directory per challenge: challenge.json holds the definition, tests.json the test cases
+        challenges = []
+        for name in sorted(os.listdir(self.challenges_dir)):
+            definition_path = os.path.join(self.challenges_dir, name, CHALLENGE_FILE)
+            if not os.path.isfile(definition_path):
+                continue
+            with open(definition_path, "r", encoding="utf-8") as f:
+                definition = json.load(f)
+            challenges.append(CodingChallenge(
+                test_cases=LazyTestCases(os.path.join(self.challenges_dir, name, TESTS_FILE)),
+                **definition
+            ))
+        return challenges
+
+    def _build_indexes(self) -> None:
+        self._by_id: Dict[str, CodingChallenge] = {}
+        self._by_difficulty: Dict[str, List[CodingChallenge]] = {}
+        self._by_category: Dict[str, List[CodingChallenge]] = {}
+        for challenge in self.challenges:
+            self._by_id[challenge.id] = challenge
+            self._by_difficulty.setdefault(challenge.difficulty.lower(), []).append(challenge)
+            self._by_category.setdefault(challenge.category.lower(), []).append(challenge)
+        self._listing = [
             {
                 "id": challenge.id,
                 "title": challenge.title,
@@ -146,22 +153,55 @@ class CodingChallenges:
             }
             for challenge in self.challenges
         ]
+
+    def get_challenges(self) -> List[Dict[str, Any]]:
+        return self._listing
     
     def get_challenge_by_id(self, challenge_id: str) -> CodingChallenge:
-        for challenge in self.challenges:
-            if challenge.id == challenge_id:
-                return challenge
-        raise ValueError(f"Challenge {challenge_id} not found")
+        challenge = self._by_id.get(challenge_id)
+        if challenge is None:
+            raise ValueError(f"Challenge {challenge_id} not found")
+        return challenge
+
+    def _version(self, challenge: CodingChallenge) -> str:
+        # Computed on first grade so startup never reads test files
+        version = self._versions.get(challenge.id)
+        if version is None:
+            version = self._versions[challenge.id] = challenge_version(challenge)
+        return version
     
-    def run_test(self, challenge_id: str, code: str, language: str = "python") -> Dict[str, Any]:
+    def run_test(
+        self, challenge_id: str, code: str, language: str = "python", fail_fast: bool = False
+    ) -> Dict[str, Any]:
         challenge = self.get_challenge_by_id(challenge_id)
         
         if language not in challenge.starter_code:
             return {"error": f"Language {language} not supported for this challenge"}
         
+        key = self.result_cache.key(challenge.id, self._version(challenge), language, code)
+        # A fail-fast run that passes everything equals a full run, and skipped cases are never cached
+        result = self.result_cache.get_or_run(key, lambda: self._grade(challenge, code, language, fail_fast))
+
+        # Place a passing submission in this challenge's runtime distribution
+        runtime_ms = sum(r.get("time_ms", 0.0) for r in result.get("results", []))
+        if result.get("score") == 100 and runtime_ms:
+            result = dict(result, performance={
+                "runtime_ms": round(runtime_ms, 3),
+                "faster_than": self.metrics.runtime_rank(challenge.id, runtime_ms),
+            })
+        return result
+
+    def _grade(self, challenge: CodingChallenge, code: str, language: str, fail_fast: bool) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = self._run(challenge, code, language, fail_fast)
+        if "results" in result:
+            self.metrics.observe_submission(challenge.id, result, (time.perf_counter() - start) * 1000)
+        return result
+
+    def _run(self, challenge: CodingChallenge, code: str, language: str, fail_fast: bool) -> Dict[str, Any]:
         try:
             if language == "python":
-                return self._run_python_test(challenge, code)
+                return self._run_python_test(challenge, code, fail_fast)
             elif language == "javascript":
                 return self._run_javascript_test(challenge, code)
             elif language == "java":
@@ -171,91 +211,183 @@ class CodingChallenges:
         except Exception as e:
             return {"error": f"Execution error: {str(e)}"}
     
-    def _run_python_test(self, challenge: CodingChallenge, code: str) -> Dict[str, Any]:
+    def _run_python_test(self, challenge: CodingChallenge, code: str, fail_fast: bool = False) -> Dict[str, Any]:
+        job = self._job(challenge, code, "python")
+        job.update(
+            comparator=challenge.comparator,
+            tolerance=challenge.tolerance,
+            parallel=self.parallel_cases,
+            deadline=self.submission_deadline,
+            fail_fast=fail_fast,
+            expected=[test_case.expected_output for test_case in challenge.test_cases],
+        )
+        if self.grader_pool is not None:
+            reply = self.grader_pool.run(**job)
+        else:
+            reply = self._run_harness([sys.executable, "-I", WORKER_PATH, "--once"], job)
+        return self._format_results(challenge, reply)
+
+    def _job(self, challenge: CodingChallenge, code: str, language: str) -> Dict[str, Any]:
+        match = ENTRY_POINT_PATTERNS[language].search(challenge.starter_code[language])
+        return {
+            "code": code,
+            "function": match.group(1) if match else challenge.id,
+            "inputs": [test_case.job_input() for test_case in challenge.test_cases],
+            "time_limit": challenge.time_limit,
+            "memory_limit": challenge.memory_limit
+        }
+
+    def _run_harness(self, command: List[str], job: Dict[str, Any], preexec_fn: Any = None) -> Dict[str, Any]:
+        # One process per submission: the harness compiles the code once and runs every case
+        inputs = job["inputs"]
+        try:
+            result = subprocess.run(
+                command,
+                input=json.dumps(job) + "\n",
+                capture_output=True,
+                text=True,
+                preexec_fn=preexec_fn,
+                timeout=job["time_limit"] * (len(inputs) + 1) + 1
+            )
+        except subprocess.TimeoutExpired:
+            return {"results": [{"status": "timeout"} for _ in inputs]}
+
+        try:
+            return json.loads(result.stdout)
+        except ValueError:
+            return {"error": result.stderr or "Grader process exited without reporting results"}
+
+    def _format_results(self, challenge: CodingChallenge, reply: Dict[str, Any]) -> Dict[str, Any]:
         results = []
         passed = 0
-        
-        for test_case in challenge.test_cases:
-            try:
-                # Create a temporary file with the code
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-                    f.write(code)
-                    f.write(f"\n\n# Test the function\nresult = {challenge.id}('{test_case.input}')\nprint(result)")
-                    temp_file = f.name
-                
-                # Run the code
-                result = subprocess.run(
-                    ['python', temp_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=challenge.time_limit
-                )
-                
-                # Clean up
-                os.unlink(temp_file)
-                
-                if result.returncode == 0:
-                    output = result.stdout.strip()
-                    if output == test_case.expected_output:
-                        results.append({
-                            "test_case": test_case.description,
-                            "status": "passed",
-                            "input": test_case.input,
-                            "expected": test_case.expected_output,
-                            "output": output
-                        })
-                        passed += 1
-                    else:
-                        results.append({
-                            "test_case": test_case.description,
-                            "status": "failed",
-                            "input": test_case.input,
-                            "expected": test_case.expected_output,
-                            "output": output
-                        })
+
+        if "results" in reply:
+            case_results = reply["results"]
+        else:
+            case_results = [{"status": "error", "error": reply.get("error", "")} for _ in challenge.test_cases]
+
+        for test_case, case in zip(challenge.test_cases, case_results):
+            if case["status"] == "ok":
+                output = case["output"]
+                if test_case.input_file:
+                    # File-based case: the worker compared it while streaming; output holds the first mismatch
+                    ok = case.get("passed") is True
                 else:
-                    results.append({
-                        "test_case": test_case.description,
-                        "status": "error",
-                        "error": result.stderr
-                    })
-                    
-            except subprocess.TimeoutExpired:
-                results.append({
+                    ok = check_output(
+                        output, test_case.expected_output, challenge.comparator, challenge.tolerance
+                    ) is None
+                status = "passed" if ok else "failed"
+                if status == "passed":
+                    passed += 1
+                entry = {
+                    "test_case": test_case.description,
+                    "status": status,
+                    "input": test_case.input or self._file_label(test_case.input_file),
+                    "expected": test_case.expected_output or self._file_label(test_case.expected_file),
+                    "output": output
+                }
+            elif case["status"] == "timeout":
+                entry = {
                     "test_case": test_case.description,
                     "status": "timeout",
                     "error": "Execution timed out"
-                })
-            except Exception as e:
-                results.append({
+                }
+            elif case["status"] == "skipped":
+                entry = {
+                    "test_case": test_case.description,
+                    "status": "skipped",
+                    "error": "Skipped after an earlier test case failed"
+                }
+            elif case["status"] == "memory_limit":
+                entry = {
+                    "test_case": test_case.description,
+                    "status": "memory_limit",
+                    "error": f"Memory limit exceeded ({challenge.memory_limit} MB)"
+                }
+            else:
+                entry = {
                     "test_case": test_case.description,
                     "status": "error",
-                    "error": str(e)
-                })
-        
+                    "error": case.get("error", "")
+                }
+            for metric in ("time_ms", "cpu_ms", "peak_memory_kb", "max_rss_kb"):
+                if metric in case:
+                    entry[metric] = case[metric]
+            results.append(entry)
+
         score = (passed / len(challenge.test_cases)) * 100 if challenge.test_cases else 0
-        
-        return {
+
+        summary = {
             "challenge_id": challenge.id,
             "total_tests": len(challenge.test_cases),
             "passed_tests": passed,
             "score": score,
             "results": results
         }
-    
+        if "usage" in reply:
+            summary["usage"] = reply["usage"]
+        return summary
+
+    @staticmethod
+    def _file_label(path: Optional[str]) -> str:
+        return f"<{os.path.basename(path)}>" if path else ""
+
+    @staticmethod
+    def _has_file_cases(challenge: CodingChallenge) -> bool:
+        return any(test_case.input_file for test_case in challenge.test_cases)
+
     def _run_javascript_test(self, challenge: CodingChallenge, code: str) -> Dict[str, Any]:
-        # Similar to Python but for Node.js
-        # This is a simplified version
-        return {"error": "JavaScript execution not fully implemented yet"}
+        if self.node is None:
+            return {"error": "JavaScript execution is not available on this server"}
+        if self._has_file_cases(challenge):
+            return {"error": "File-based test cases are only supported for Python"}
+        job = self._job(challenge, code, "javascript")
+        # vm contexts are no isolation boundary, so every submission gets its own limited process
+        limits = functools.partial(
+            apply_limits,
+            challenge.time_limit,
+            len(job["inputs"]),
+            challenge.memory_limit,
+            NODE_ADDRESS_SPACE_MB,
+            user_task_count() + RUNTIME_THREADS,
+        )
+        command = [
+            self.node, f"--max-old-space-size={challenge.memory_limit}", *self._node_sandbox_flags(),
+            NODE_HARNESS_PATH, "--once",
+        ]
+        reply = self._run_harness(command, job, preexec_fn=limits)
+        return self._format_results(challenge, reply)
+
+    def _node_sandbox_flags(self) -> List[str]:
+        # Node's permission model denies child processes, workers, addons and file access
+        if self._node_flags is None:
+            try:
+                version = subprocess.run([self.node, "--version"], capture_output=True, text=True, timeout=10).stdout
+                release = tuple(int(part) for part in version.strip().lstrip("v").split(".")[:2])
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                release = (0, 0)
+            if release >= (23, 5) or (22, 13) <= release < (23, 0):
+                flags = ["--permission"]
+            elif release >= (20, 0):
+                flags = ["--experimental-permission"]
+            else:
+                flags = []
+            if flags:
+                flags += [f"--allow-fs-read={NODE_HARNESS_PATH}", "--no-warnings"]
+            self._node_flags = flags
+        return self._node_flags
     
     def _run_java_test(self, challenge: CodingChallenge, code: str) -> Dict[str, Any]:
-        # Similar to Python but for Java
-        # This is a simplified version
-        return {"error": "Java execution not fully implemented yet"}
+        if not self.java_runner.available:
+            return {"error": "Java execution is not available on this server"}
+        if self._has_file_cases(challenge):
+            return {"error": "File-based test cases are only supported for Python"}
+        reply = self.java_runner.run(**self._job(challenge, code, "java"))
+        return self._format_results(challenge, reply)
     
     def get_challenges_by_difficulty(self, difficulty: str) -> List[CodingChallenge]:
-        return [c for c in self.challenges if c.difficulty.lower() == difficulty.lower()]
+        return list(self._by_difficulty.get(difficulty.lower(), []))
     
     def get_challenges_by_category(self, category: str) -> List[CodingChallenge]:
-        return [c for c in self.challenges if c.category.lower() == category.lower()]
+        return list(self._by_category.get(category.lower(), []))
 
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 
 @dataclass
@@ -31,6 +31,7 @@ class Course:
 class CourseManager:
     def __init__(self):
         self.courses = self._load_courses()
+        self._lesson_courses = {lesson.id: course.id for course in self.courses for lesson in course.lessons}
     
     def _load_courses(self) -> List[Course]:
         return [
@@ -217,6 +218,9 @@ class CourseManager:
                 return course
         raise ValueError(f"Course {course_id} not found")
     
+    def get_course_id_for_lesson(self, lesson_id: str) -> Optional[str]:
+        return self._lesson_courses.get(lesson_id)
+    
     def get_courses_by_category(self, category: str) -> List[Course]:
         return [course for course in self.courses if course.category.lower() == category.lower()]
     
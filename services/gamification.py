@@ -1,8 +1,29 @@
 from __future__ import annotations
 import json
 import os
-from typing import Dict, List, Any
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple, Union
+from dataclasses import dataclass, field
+
+from services.achievements import AchievementEngine, AchievementRule
+from services.leaderboard import Leaderboard, RollingLeaderboard
+from services.progress_store import ProgressStore, MemoryProgressStore, ProgressDelta, PointEvent
+
+# Windowed leaderboards: name -> (bucket seconds, buckets). Windows slide one bucket at a time,
+# so "daily" is the last 24 hours to the hour and "weekly" the last 7 days to 6 hours.
+LEADERBOARD_WINDOWS = {
+    "daily": (3600, 24),
+    "weekly": (6 * 3600, 28),
+}
+# Lesson scores are percentages
+MAX_LESSON_SCORE = 100
+
+
+class UnknownUser(ValueError):
+    pass
+
 
 @dataclass
 class Achievement:
@@ -23,11 +44,43 @@ class UserProgress:
     achievements: List[str]
     streak_days: int
     last_login: str
+    # Event counts that achievements depend on, e.g. peers_helped
+    counters: Dict[str, int] = field(default_factory=dict)
+    # One bit per unlocked achievement, see AchievementEngine
+    achievement_bits: int = 0
+    # Distinct peers this user has helped; peers_helped counts these
+    helped_peers: List[str] = field(default_factory=list)
 
 class GamificationEngine:
-    def __init__(self):
+    def __init__(
+        self,
+        store: Optional[ProgressStore] = None,
+        cache_ttl: float = 5.0,
+        lock_stripes: int = 64,
+        max_cached_users: int = 10000,
+    ):
         self.achievements = self._load_achievements()
-        self.user_progress = {}  # In production, use a database
+        self.achievement_rules = AchievementEngine([a.id for a in self.achievements], self._load_achievement_rules())
+        self.store = store or MemoryProgressStore()
+        # Cache over the store; users are loaded on first touch and the least recently
+        # used are dropped past max_cached_users, since every change is already in the store
+        self.cache_ttl = cache_ttl
+        self.max_cached_users = max(1, max_cached_users)
+        self.user_progress: "OrderedDict[str, UserProgress]" = OrderedDict()
+        self._loaded_at: Dict[str, float] = {}
+        self._cache_lock = threading.Lock()
+        # A user's progress is only read or changed under that user's stripe lock, so
+        # requests for different users rarely contend and requests for one user serialize
+        self._stripes = [threading.Lock() for _ in range(max(1, lock_stripes))]
+        self._boards_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        # Ranked by total_points; seeded from the store on first use, then kept up to date incrementally
+        self.leaderboard = Leaderboard()
+        self._leaderboard_cursor = 0
+        self._leaderboard_synced_at: Optional[float] = None
+        # Windowed and per-course boards, keyed by (window or "all", course_id or None)
+        self._boards: Dict[Tuple[str, Optional[str]], Union[Leaderboard, RollingLeaderboard]] = {}
+        self._events_cursor = 0
         
     def _load_achievements(self) -> List[Achievement]:
         return [
@@ -41,34 +94,147 @@ class GamificationEngine:
             Achievement("night_owl", "Night Owl", "Study after 10 PM", "🦉", 75),
         ]
     
+    def _load_achievement_rules(self) -> List[AchievementRule]:
+        # Study times use the server's local clock
+        return [
+            AchievementRule("first_lesson", counter="lessons_completed", threshold=1),
+            AchievementRule("streak_3", counter="streak_days", threshold=3),
+            AchievementRule("streak_7", counter="streak_days", threshold=7),
+            AchievementRule("perfect_score", event="lesson_completed", predicate=lambda e: e["score"] >= 100),
+            AchievementRule("course_complete", counter="lessons_completed", threshold=10),  # Simplified
+            AchievementRule("helpful_peer", counter="peers_helped", threshold=5),
+            AchievementRule("early_bird", event="lesson_completed", predicate=lambda e: time.localtime(e["at"]).tm_hour < 8),
+            AchievementRule("night_owl", event="lesson_completed", predicate=lambda e: time.localtime(e["at"]).tm_hour >= 22),
+        ]
+    
     def get_user_progress(self, user_id: str) -> Dict[str, Any]:
-        if user_id not in self.user_progress:
-            self.user_progress[user_id] = UserProgress(
-                user_id=user_id,
-                level=1,
-                experience=0,
-                total_points=0,
-                completed_lessons=[],
-                achievements=[],
-                streak_days=0,
-                last_login=""
+        with self._user_lock(user_id):
+            progress = self._get_progress(user_id)
+            return {
+                "level": progress.level,
+                "experience": progress.experience,
+                "total_points": progress.total_points,
+                "completed_lessons": len(progress.completed_lessons),
+                "achievements": len(progress.achievements),
+                "streak_days": progress.streak_days,
+                "next_level_exp": self._get_next_level_exp(progress.level),
+                "progress_percentage": self._get_level_progress(progress.level, progress.experience)
+            }
+    
+    def complete_lesson(self, user_id: str, lesson_id: str, score: int, course_id: Optional[str] = None) -> Dict[str, Any]:
+        if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= MAX_LESSON_SCORE:
+            raise ValueError(f"Score must be a number between 0 and {MAX_LESSON_SCORE}")
+        # Seed the leaderboards before this process awards its first points
+        self._sync_leaderboard()
+        with self._user_lock(user_id):
+            progress = self._get_progress(user_id)
+            
+            # Award experience and points based on score
+            exp_gained = int(score * 10)  # 10 exp per percentage point
+            points_gained = int(score * 2)  # 2 points per percentage point
+            
+            progress.experience += exp_gained
+            progress.total_points += points_gained
+            
+            if lesson_id not in progress.completed_lessons:
+                progress.completed_lessons.append(lesson_id)
+            
+            # Check for level up
+            old_level = progress.level
+            progress.level = self._calculate_level(progress.experience)
+            
+            # Update streak
+            progress.streak_days += 1
+            
+            # Check for achievements
+            now = time.time()
+            new_achievements = self._check_achievements(
+                progress,
+                "lesson_completed",
+                {"lesson_id": lesson_id, "score": score, "at": now, "course_id": course_id},
+                {"lessons_completed": len(progress.completed_lessons), "streak_days": progress.streak_days},
             )
-        
-        progress = self.user_progress[user_id]
-        return {
-            "level": progress.level,
-            "experience": progress.experience,
-            "total_points": progress.total_points,
-            "completed_lessons": len(progress.completed_lessons),
-            "achievements": len(progress.achievements),
-            "streak_days": progress.streak_days,
-            "next_level_exp": self._get_next_level_exp(progress.level),
-            "progress_percentage": self._get_level_progress(progress.level, progress.experience)
-        }
+            
+            event = PointEvent(user_id=user_id, points=points_gained, at=now, course_id=course_id)
+            self.store.apply(ProgressDelta(
+                user_id=user_id,
+                experience=exp_gained,
+                total_points=points_gained,
+                streak_days=1,
+                completed_lessons={lesson_id},
+                achievements=set(new_achievements),
+                events=[event],
+            ))
+            self.leaderboard.update(user_id, progress.total_points)
+            self._record_event(event)
+            
+            return {
+                "exp_gained": exp_gained,
+                "points_gained": points_gained,
+                "leveled_up": progress.level > old_level,
+                "new_level": progress.level,
+                "new_achievements": new_achievements,
+                "total_points": progress.total_points,
+                "streak_days": progress.streak_days
+            }
+    
+    def record_peer_help(self, user_id: str, peer_id: str) -> Dict[str, Any]:
+        """Record that ``user_id`` helped ``peer_id``; helping the same peer again counts once."""
+        if peer_id == user_id:
+            raise ValueError("Helping yourself doesn't count")
+        if not self.user_exists(peer_id):
+            raise UnknownUser(f"Unknown peer {peer_id}")
+        with self._user_lock(user_id):
+            progress = self._get_progress(user_id)
+            if peer_id in progress.helped_peers:
+                new_achievements: List[str] = []
+            else:
+                progress.helped_peers.append(peer_id)
+                progress.counters["peers_helped"] = len(progress.helped_peers)
+                new_achievements = self._check_achievements(
+                    progress, "peer_helped", {"peer_id": peer_id, "at": time.time()},
+                    {"peers_helped": progress.counters["peers_helped"]},
+                )
+                self.store.apply(ProgressDelta(
+                    user_id=user_id,
+                    achievements=set(new_achievements),
+                    helped_peers={peer_id},
+                ))
+            return {
+                "peers_helped": progress.counters["peers_helped"],
+                "new_achievements": new_achievements
+            }
+    
+    def user_exists(self, user_id: str) -> bool:
+        """Whether ``user_id`` has any recorded progress; merely viewed users are cached but don't count."""
+        return self.store.load(user_id) is not None
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        return self._stripes[hash(user_id) % len(self._stripes)]
+    
+    def _get_progress(self, user_id: str) -> UserProgress:
+        # Callers hold the user's stripe lock; the cache itself is shared by every stripe
+        with self._cache_lock:
+            progress = self.user_progress.get(user_id)
+            if progress is not None:
+                self.user_progress.move_to_end(user_id)
+            loaded_at = self._loaded_at.get(user_id, 0.0)
+        # Other processes may write a shared store, so cached users go stale after cache_ttl
+        stale = self.store.shared and time.time() - loaded_at > self.cache_ttl
+        if progress is None or stale:
+            progress = self._from_row(user_id, self.store.load(user_id))
+            with self._cache_lock:
+                self.user_progress[user_id] = progress
+                self.user_progress.move_to_end(user_id)
+                self._loaded_at[user_id] = time.time()
+                while len(self.user_progress) > self.max_cached_users:
+                    evicted, _ = self.user_progress.popitem(last=False)
+                    self._loaded_at.pop(evicted, None)
+        return progress
     
-    def complete_lesson(self, user_id: str, lesson_id: str, score: int) -> Dict[str, Any]:
-        if user_id not in self.user_progress:
-            self.user_progress[user_id] = UserProgress(
+    def _from_row(self, user_id: str, row: Optional[Dict[str, Any]]) -> UserProgress:
+        if row is None:
+            return UserProgress(
                 user_id=user_id,
                 level=1,
                 experience=0,
@@ -78,38 +244,20 @@ class GamificationEngine:
                 streak_days=0,
                 last_login=""
             )
-        
-        progress = self.user_progress[user_id]
-        
-        # Award experience and points based on score
-        exp_gained = int(score * 10)  # 10 exp per percentage point
-        points_gained = int(score * 2)  # 2 points per percentage point
-        
-        progress.experience += exp_gained
-        progress.total_points += points_gained
-        
-        if lesson_id not in progress.completed_lessons:
-            progress.completed_lessons.append(lesson_id)
-        
-        # Check for level up
-        old_level = progress.level
-        progress.level = self._calculate_level(progress.experience)
-        
-        # Check for achievements
-        new_achievements = self._check_achievements(progress)
-        
-        # Update streak
-        progress.streak_days += 1
-        
-        return {
-            "exp_gained": exp_gained,
-            "points_gained": points_gained,
-            "leveled_up": progress.level > old_level,
-            "new_level": progress.level,
-            "new_achievements": new_achievements,
-            "total_points": progress.total_points,
-            "streak_days": progress.streak_days
-        }
+        return UserProgress(
+            user_id=user_id,
+            level=self._calculate_level(row["experience"]),
+            experience=row["experience"],
+            total_points=row["total_points"],
+            completed_lessons=row["completed_lessons"],
+            achievements=row["achievements"],
+            streak_days=row["streak_days"],
+            last_login=row["last_login"],
+            # Derived from the distinct peers so repeat or concurrent help never inflates it
+            counters=dict(row["counters"], peers_helped=len(row["helped_peers"])),
+            achievement_bits=self.achievement_rules.to_bits(row["achievements"]),
+            helped_peers=row["helped_peers"],
+        )
     
     def _calculate_level(self, experience: int) -> int:
         # Simple level calculation: every 100 exp = 1 level
@@ -125,41 +273,109 @@ class GamificationEngine:
         total_needed = next_level_exp - current_level_exp
         return min(100.0, (progress / total_needed) * 100)
     
-    def _check_achievements(self, progress: UserProgress) -> List[str]:
-        new_achievements = []
-        
-        # Check first lesson achievement
-        if len(progress.completed_lessons) == 1 and "first_lesson" not in progress.achievements:
-            progress.achievements.append("first_lesson")
-            new_achievements.append("first_lesson")
-        
-        # Check streak achievements
-        if progress.streak_days >= 3 and "streak_3" not in progress.achievements:
-            progress.achievements.append("streak_3")
-            new_achievements.append("streak_3")
-        
-        if progress.streak_days >= 7 and "streak_7" not in progress.achievements:
-            progress.achievements.append("streak_7")
-            new_achievements.append("streak_7")
-        
-        # Check course completion (simplified)
-        if len(progress.completed_lessons) >= 10 and "course_complete" not in progress.achievements:
-            progress.achievements.append("course_complete")
-            new_achievements.append("course_complete")
-        
+    def _check_achievements(
+        self,
+        progress: UserProgress,
+        event_type: str,
+        event: Dict[str, Any],
+        counters: Dict[str, int],
+    ) -> List[str]:
+        # Only rules subscribed to this event type or to the given counters are evaluated
+        progress.achievement_bits, new_achievements = self.achievement_rules.evaluate(
+            progress.achievement_bits, event_type, event, counters
+        )
+        progress.achievements.extend(new_achievements)
         return new_achievements
     
-    def get_leaderboard(self) -> List[Dict[str, Any]]:
-        # Simple leaderboard based on total points
-        leaderboard = []
-        for user_id, progress in self.user_progress.items():
-            leaderboard.append({
+    def get_leaderboard(self, limit: int = 10, window: str = "all", course_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        self._sync_leaderboard()
+        board = self._board(window, course_id, create=False)
+        return [self._leaderboard_entry(*entry) for entry in board.top(limit)]
+    
+    def get_leaderboard_position(
+        self, user_id: str, radius: int = 2, window: str = "all", course_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        self._sync_leaderboard()
+        board = self._board(window, course_id, create=False)
+        return {
+            "rank": board.rank(user_id),
+            "total_users": len(board),
+            "neighbours": [self._leaderboard_entry(*entry) for entry in board.around(user_id, radius)],
+        }
+    
+    def _leaderboard_entry(self, rank: int, user_id: str, points: int) -> Dict[str, Any]:
+        with self._user_lock(user_id):
+            progress = self._get_progress(user_id)
+            return {
+                "rank": rank,
                 "user_id": user_id,
                 "level": progress.level,
+                "points": points,  # Points counted by this leaderboard
                 "total_points": progress.total_points,
                 "completed_lessons": len(progress.completed_lessons)
-            })
-        
-        leaderboard.sort(key=lambda x: x["total_points"], reverse=True)
-        return leaderboard[:10]  # Top 10
+            }
+    
+    def _board(self, window: str, course_id: Optional[str] = None, create: bool = True) -> Union[Leaderboard, RollingLeaderboard]:
+        if window != "all" and window not in LEADERBOARD_WINDOWS:
+            raise ValueError(f"Unknown leaderboard window: {window}")
+        if window == "all" and course_id is None:
+            return self.leaderboard
+        board = self._boards.get((window, course_id))
+        if board is None:
+            with self._boards_lock:
+                board = self._boards.get((window, course_id))
+                if board is None:
+                    board = Leaderboard() if window == "all" else RollingLeaderboard(*LEADERBOARD_WINDOWS[window])
+                    # Only points create boards, so querying arbitrary course ids can't grow memory
+                    if create:
+                        self._boards[(window, course_id)] = board
+        return board
+    
+    def _record_event(self, event: PointEvent, course_totals: bool = True) -> None:
+        # Feeds the windowed and per-course boards; overall lifetime totals are tracked separately
+        for course_id in {None, event.course_id}:
+            for window in LEADERBOARD_WINDOWS:
+                self._board(window, course_id).add(event.user_id, event.points, event.at)
+        if course_totals and event.course_id is not None:
+            self._board("all", event.course_id).add(event.user_id, event.points)
+    
+    def _sync_leaderboard(self) -> None:
+        # Points awarded by this process are indexed as they happen; the store only
+        # has to report other processes' changes, so a shared store is polled every cache_ttl
+        synced_at = self._leaderboard_synced_at
+        if synced_at is not None and (not self.store.shared or time.time() - synced_at < self.cache_ttl):
+            return
+        if synced_at is None:
+            # Nobody may award points before the boards are seeded, so wait for the first sync
+            with self._sync_lock:
+                if self._leaderboard_synced_at is None:
+                    self._seed_leaderboards()
+            return
+        # Later polls are best effort: if another thread is already polling, don't wait for it
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._leaderboard_synced_at = time.time()
+            changed, self._leaderboard_cursor = self.store.changed_points(self._leaderboard_cursor)
+            for user_id, points in changed.items():
+                self.leaderboard.update(user_id, points)
+            events, self._events_cursor = self.store.point_events(self._events_cursor)
+            for event in events:
+                self._record_event(event)
+        finally:
+            self._sync_lock.release()
+    
+    def _seed_leaderboards(self) -> None:
+        now = time.time()
+        changed, self._leaderboard_cursor = self.store.changed_points(0)
+        self.leaderboard.reset(changed)
+        longest = max(bucket_seconds * buckets for bucket_seconds, buckets in LEADERBOARD_WINDOWS.values())
+        history = self.store.point_history(since=now - longest)
+        for course_id, points in history.course_points.items():
+            self._board("all", course_id).reset(points)
+        for event in history.events:
+            # history.course_points already includes these
+            self._record_event(event, course_totals=False)
+        self._events_cursor = history.cursor
+        self._leaderboard_synced_at = now
 
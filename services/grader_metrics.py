@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+from typing import Any, Dict, List, Optional
+
+# Geometric bucket bounds from 0.01 up to ~1e8; each bucket is 25% wider than the last
+BUCKET_GROWTH = 1.25
+BUCKET_BOUNDS: List[float] = [0.01 * BUCKET_GROWTH ** i for i in range(int(math.log(1e10, BUCKET_GROWTH)) + 1)]
+
+SUBMISSION_METRICS = ("submission_ms", "spawn_ms", "case_time_ms", "max_rss_kb")
+
+
+class Histogram:
+    """Fixed-bucket histogram for non-negative values.
+
+    Buckets grow geometrically, so memory is constant and percentiles are
+    accurate to within one bucket (25%) across the whole range.
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        value = max(0.0, float(value))
+        with self._lock:
+            self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+            self.count += 1
+            self.total += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q``-th percentile (0-100)."""
+        with self._lock:
+            if not self.count:
+                return None
+            target = q / 100.0 * self.count
+            seen = 0
+            for i, n in enumerate(self.counts):
+                seen += n
+                if n and seen >= target:
+                    bound = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                    return max(self.min, min(bound, self.max))
+            return self.max
+
+    def fraction_above(self, value: float) -> Optional[float]:
+        """Share of observations in buckets above ``value``'s bucket."""
+        with self._lock:
+            if not self.count:
+                return None
+            index = bisect.bisect_left(BUCKET_BOUNDS, max(0.0, value))
+            return sum(self.counts[index + 1:]) / self.count
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p90, p99 = (self.percentile(q) for q in (50, 90, 99))
+        with self._lock:
+            return {
+                "count": self.count,
+                "mean": (self.total / self.count) if self.count else None,
+                "min": self.min if self.count else None,
+                "max": self.max if self.count else None,
+                "p50": p50,
+                "p90": p90,
+                "p99": p99,
+            }
+
+
+class GraderMetrics:
+    """In-process grading metrics, overall and per challenge.
+
+    Tracks queue wait, process spawn overhead, whole-submission time, per-case
+    execution time and max RSS, plus the runtime of fully passing submissions
+    per challenge so a new submission can be placed in that distribution.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.overall: Dict[str, Histogram] = {name: Histogram() for name in SUBMISSION_METRICS}
+        self.overall["queue_wait_ms"] = Histogram()
+        self.challenges: Dict[str, Dict[str, Histogram]] = {}
+        self.statuses: Dict[str, int] = {}
+
+    def observe_queue_wait(self, ms: float) -> None:
+        self.overall["queue_wait_ms"].observe(ms)
+
+    def observe_submission(self, challenge_id: str, result: Dict[str, Any], wall_ms: float) -> None:
+        per_challenge = self._challenge(challenge_id)
+        observations: Dict[str, List[float]] = {"submission_ms": [wall_ms]}
+        usage = result.get("usage") or {}
+        if "wall_ms" in usage:
+            observations["spawn_ms"] = [max(0.0, wall_ms - usage["wall_ms"])]
+        if "max_rss_kb" in usage:
+            observations["max_rss_kb"] = [usage["max_rss_kb"]]
+        observations["case_time_ms"] = [r["time_ms"] for r in result.get("results", []) if "time_ms" in r]
+        for name, values in observations.items():
+            for value in values:
+                self.overall[name].observe(value)
+                per_challenge[name].observe(value)
+
+        with self._lock:
+            for case in result.get("results", []):
+                self.statuses[case["status"]] = self.statuses.get(case["status"], 0) + 1
+        if result.get("score") == 100 and observations["case_time_ms"]:
+            per_challenge["runtime_ms"].observe(sum(observations["case_time_ms"]))
+
+    def runtime_rank(self, challenge_id: str, runtime_ms: float) -> Optional[float]:
+        """Share of passing submissions to ``challenge_id`` that were slower than ``runtime_ms``."""
+        with self._lock:
+            per_challenge = self.challenges.get(challenge_id)
+        if per_challenge is None:
+            return None
+        return per_challenge["runtime_ms"].fraction_above(runtime_ms)
+
+    def snapshot(self, challenge_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            challenges = dict(self.challenges)
+            statuses = dict(self.statuses)
+        if challenge_id is not None:
+            per_challenge = challenges.get(challenge_id, {})
+            return {name: h.snapshot() for name, h in per_challenge.items()}
+        return {
+            "overall": {name: h.snapshot() for name, h in self.overall.items()},
+            "statuses": statuses,
+            "challenges": {
+                cid: {name: h.snapshot() for name, h in per_challenge.items()}
+                for cid, per_challenge in challenges.items()
+            },
+        }
+
+    def _challenge(self, challenge_id: str) -> Dict[str, Histogram]:
+        with self._lock:
+            per_challenge = self.challenges.get(challenge_id)
+            if per_challenge is None:
+                per_challenge = {name: Histogram() for name in SUBMISSION_METRICS}
+                per_challenge["runtime_ms"] = Histogram()
+                self.challenges[challenge_id] = per_challenge
+            return per_challenge
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grader_worker.py")
+PYTHON_WORKER_COMMAND = [sys.executable, "-I", WORKER_PATH]
+
+
+class _Worker:
+    def __init__(self, command: List[str]) -> None:
+        self.proc = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._buffer = b""
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def request(self, job: Dict[str, Any], timeout: float) -> Optional[Dict[str, Any]]:
+        """Send one job and wait for its reply line; None if the worker missed the deadline.
+
+        Raises ``EOFError`` if the worker exits before replying.
+        """
+        self.proc.stdin.write((json.dumps(job) + "\n").encode("utf-8"))
+        self.proc.stdin.flush()
+        fd = self.proc.stdout.fileno()
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 1 << 16)
+            if not chunk:
+                raise EOFError("grader worker exited")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line.decode("utf-8"))
+
+    def kill(self) -> None:
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+
+
+class GraderPool:
+    """Pool of warm grader processes.
+
+    By default each worker is ``grader_worker.py``, which forks a fresh child
+    per Python submission, so a submission costs one fork instead of one
+    interpreter start per test case. Any ``command`` speaking the same
+    JSON-lines protocol works, but workers are reused across submissions, so
+    the command must isolate each submission itself the way the Python worker
+    does by forking.
+    Workers are started lazily in the process that first uses the pool,
+    which keeps the pool safe to create before gunicorn forks its workers.
+    """
+
+    def __init__(self, size: int = 2, command: Optional[List[str]] = None) -> None:
+        self.size = size
+        self.command = command or PYTHON_WORKER_COMMAND
+        self._lock = threading.Lock()
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._pid: Optional[int] = None
+
+    def run(
+        self,
+        code: str,
+        function: str,
+        inputs: List[str],
+        time_limit: float,
+        memory_limit: int = 256,
+        **options: Any,
+    ) -> Dict[str, Any]:
+        """Run every input through ``function`` under the given limits.
+
+        Extra ``options`` (e.g. ``parallel``, ``deadline``, ``fail_fast``) are
+        passed through to the worker.
+
+        Returns ``{"results": [...], "usage": {...}}`` with one result per
+        input; each has ``status`` ``"ok"`` (with ``output``), ``"error"``
+        (with ``error``), ``"timeout"`` or ``"memory_limit"``. ``usage`` holds
+        the CPU time and max RSS of the submission's process, when known.
+        """
+        self._ensure_started()
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                worker = self._replace(worker)
+            job = {
+                "code": code,
+                "function": function,
+                "inputs": inputs,
+                "time_limit": time_limit,
+                "memory_limit": memory_limit,
+                **options,
+            }
+            # The worker enforces its own deadline; this one only catches a wedged worker
+            try:
+                reply = worker.request(job, time_limit * (len(inputs) + 1) + 5)
+            except (OSError, EOFError):
+                worker = self._replace(worker)
+                return {"error": "Grader process exited without reporting results"}
+            if reply is None:
+                worker = self._replace(worker)
+                return {"results": [{"status": "timeout"} for _ in inputs]}
+        finally:
+            self._idle.put(worker)
+
+        if "error" in reply:
+            error = reply.pop("error")
+            reply["results"] = [{"status": "error", "error": error} for _ in inputs]
+        return reply
+
+    def close(self) -> None:
+        with self._lock:
+            for worker in self._workers:
+                worker.kill()
+            self._workers = []
+            self._idle = queue.Queue()
+            self._pid = None
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Workers inherited across a fork belong to the parent; start our own
+            self._idle = queue.Queue()
+            self._workers = [_Worker(self.command) for _ in range(self.size)]
+            for worker in self._workers:
+                self._idle.put(worker)
+            self._pid = os.getpid()
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        fresh = _Worker(self.command)
+        with self._lock:
+            self._workers = [fresh if w is worker else w for w in self._workers]
+        return fresh
@@ -0,0 +1,692 @@
+"""Long-lived grader process for Python submissions.
+
+Started by ``GraderPool`` with ``python -I grader_worker.py``. Each request is
+one JSON line on stdin::
+
+    {"code": ..., "function": ..., "inputs": [...], "time_limit": seconds,
+     "memory_limit": megabytes}
+
+An input is either a string passed to ``function`` or
+``{"input_file": ..., "expected_file": ...}``, which runs the code as a
+script with the file on stdin and compares its output as it streams.
+
+The worker forks; the child closes every descriptor it inherited except its
+own pipes, applies resource limits (address space, CPU time, no new
+processes, bounded file writes), execs the submission once and calls the
+function for every input with a per-case timeout; ``parallel`` spreads the
+cases over several children. Every file-based case gets a child and output
+pipe of its own, so its output can't be mixed up with another case's, and
+the child is killed as soon as its output diverges from the expected file.
+Children are not trusted: the worker only accepts results for a child's own
+cases, in order, and compares the output of file-based cases itself as it
+arrives on the pipe. The worker reaps the
+children with ``wait4`` and replies with one JSON line
+``{"results": [...], "usage": {...}}`` on stdout. Forking keeps the
+interpreter warm while giving every submission a fresh address space. Only
+the standard library is used so the process starts fast and imports nothing
+from the app.
+
+With ``--once`` the process handles a single job and exits; this is the
+one-spawn-per-submission harness used when no pool is configured.
+"""
+from __future__ import annotations
+
+import codecs
+import contextlib
+import io
+import json
+import math
+import os
+import resource
+import select
+import signal
+import sys
+import time
+import tracemalloc
+import traceback
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+
+# Submissions have no business writing files; cap anything they try at 1 MB
+MAX_FILE_SIZE = 1 << 20
+READ_CHUNK_SIZE = 1 << 16
+COMPARATORS = ("exact", "tokens", "float")
+RESULT_STATUSES = ("ok", "error", "timeout", "memory_limit")
+RESULT_METRICS = ("time_ms", "cpu_ms", "peak_memory_kb", "max_rss_kb")
+
+
+class CaseTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum: int, frame: Any) -> None:
+    raise CaseTimeout()
+
+
+class OutputMismatch(Exception):
+    pass
+
+
+class OutputChecker(io.TextIOBase):
+    """Writable text stream that checks output against ``expected`` as it is written.
+
+    ``comparator`` is ``"exact"`` (line by line, ignoring trailing whitespace
+    and trailing blank lines), ``"tokens"`` (whitespace-separated tokens) or
+    ``"float"`` (tokens, with numbers equal within ``tolerance`` absolute or
+    relative). Only a chunk of the expected stream is held at a time, and the
+    first difference raises ``OutputMismatch``; later writes raise it again.
+    """
+
+    def __init__(self, expected: TextIO, comparator: str = "exact", tolerance: float = 1e-6) -> None:
+        if comparator not in COMPARATORS:
+            raise ValueError(f"Unknown comparator {comparator}")
+        self._expected = expected
+        self._comparator = comparator
+        self._tolerance = tolerance
+        self._pending = ""
+        self._position = 0
+        self._expected_tokens = self._iter_expected_tokens()
+        self.mismatch: Optional[str] = None
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if self.mismatch is not None:
+            raise OutputMismatch(self.mismatch)
+        self._pending += text
+        if self._comparator == "exact":
+            *lines, self._pending = self._pending.split("\n")
+            for line in lines:
+                self._check_line(line)
+        else:
+            # The last piece may be a token cut in half; keep it until more text arrives
+            pieces = self._pending.split()
+            if pieces and not self._pending[-1].isspace():
+                self._pending = pieces.pop()
+            else:
+                self._pending = ""
+            for token in pieces:
+                self._check_token(token)
+        return len(text)
+
+    def finish(self) -> Optional[str]:
+        """Check the end of output; return the first mismatch, or None if the output matched."""
+        try:
+            if self._comparator == "exact":
+                if self._pending:
+                    self._check_line(self._pending)
+                for line in self._expected:
+                    if line.strip():
+                        self._fail(f"Output ended early; expected line {self._position + 1}: {line.rstrip()!r}")
+                    self._position += 1
+            else:
+                for token in self._pending.split():
+                    self._check_token(token)
+                token = next(self._expected_tokens, None)
+                if token is not None:
+                    self._fail(f"Output ended early; expected token {self._position + 1}: {token!r}")
+        except OutputMismatch:
+            pass
+        self._pending = ""
+        return self.mismatch
+
+    def _fail(self, message: str) -> None:
+        if self.mismatch is None:
+            self.mismatch = message
+        raise OutputMismatch(self.mismatch)
+
+    def _check_line(self, actual: str) -> None:
+        self._position += 1
+        expected = self._expected.readline()
+        if not expected and actual.strip():
+            self._fail(f"Unexpected output at line {self._position}: {actual.rstrip()!r}")
+        if expected and actual.rstrip() != expected.rstrip("\r\n").rstrip():
+            self._fail(
+                f"Line {self._position}: expected {expected.rstrip()!r}, got {actual.rstrip()!r}"
+            )
+
+    def _check_token(self, actual: str) -> None:
+        self._position += 1
+        expected = next(self._expected_tokens, None)
+        if expected is None:
+            self._fail(f"Unexpected output at token {self._position}: {actual!r}")
+        if actual == expected:
+            return
+        if self._comparator == "float":
+            try:
+                a, b = float(actual), float(expected)
+            except ValueError:
+                pass
+            else:
+                if abs(a - b) <= self._tolerance * max(1.0, abs(b)):
+                    return
+        self._fail(f"Token {self._position}: expected {expected!r}, got {actual!r}")
+
+    def _iter_expected_tokens(self) -> Iterator[str]:
+        buf = ""
+        while True:
+            chunk = self._expected.read(READ_CHUNK_SIZE)
+            if not chunk:
+                yield from buf.split()
+                return
+            buf += chunk
+            pieces = buf.split()
+            buf = pieces.pop() if pieces and not buf[-1].isspace() else ""
+            yield from pieces
+
+
+def check_output(actual: str, expected: str, comparator: str = "exact", tolerance: float = 1e-6) -> Optional[str]:
+    """Compare two in-memory outputs; return the first mismatch or None."""
+    if comparator == "exact":
+        return None if actual == expected else f"Expected {expected!r}, got {actual!r}"
+    checker = OutputChecker(io.StringIO(expected), comparator, tolerance)
+    try:
+        checker.write(actual)
+    except OutputMismatch:
+        pass
+    return checker.finish()
+
+
+def _run_program(program: Any, case: Dict[str, Any], output_fd: int) -> Dict[str, Any]:
+    """Run the whole submission as a script with ``input_file`` on stdin and its
+    stdout written to ``output_fd``, where the worker compares it.
+
+    The file and the pipe are placed on fds 0 and 1 for the duration, so
+    ``sys.stdout.buffer`` and ``os.write(1, ...)`` reach the worker just like
+    ``print`` does.
+    """
+    with open(case["input_file"], "r", encoding="utf-8") as stdin:
+        saved_fds = (os.dup(0), os.dup(1))
+        os.dup2(stdin.fileno(), 0)
+        os.dup2(output_fd, 1)
+        stdout = io.TextIOWrapper(io.FileIO(1, "w", closefd=False), encoding="utf-8")
+        saved_stdin, sys.stdin = sys.stdin, stdin
+        try:
+            with contextlib.redirect_stdout(stdout):
+                exec(program, {"__name__": "__main__"})
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise
+        finally:
+            sys.stdin = saved_stdin
+            # The worker reads the output up to our result line, so it must all be in the pipe first
+            with contextlib.suppress(Exception):
+                stdout.flush()
+            for fd, saved in enumerate(saved_fds):
+                os.dup2(saved, fd)
+                os.close(saved)
+    return {"status": "ok"}
+
+
+def iter_cases(
+    code: str,
+    function: str,
+    inputs: List[Any],
+    time_limit: float,
+    output_fd: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Run ``code`` against each input, yielding one result per input.
+
+    A string input is passed to ``function`` (the code is exec'd once for
+    all of them) and the printed output is returned. A dict input with
+    ``input_file`` runs the code as a script reading the file on stdin and
+    writing its output to ``output_fd`` (discarded if None); the caller
+    compares that output with ``expected_file``.
+
+    Every case reports ``time_ms`` (wall time of the call), ``cpu_ms``,
+    ``peak_memory_kb`` (peak Python allocations during the call) and
+    ``max_rss_kb`` (process high-water mark after the call).
+    """
+    signal.signal(signal.SIGALRM, _on_alarm)
+    if output_fd is None:
+        output_fd = os.open(os.devnull, os.O_WRONLY)
+    try:
+        program = compile(code, "<submission>", "exec")
+    except MemoryError:
+        compile_failure: Dict[str, Any] = {"status": "memory_limit"}
+    except BaseException:
+        compile_failure = {"status": "error", "error": traceback.format_exc()}
+    else:
+        compile_failure = {}
+    if compile_failure:
+        for _ in inputs:
+            yield dict(compile_failure)
+        return
+
+    # Function-style cases share one exec of the module; file-based cases re-run it per case
+    fn = None
+    setup_failure: Dict[str, Any] = {}
+    if any(isinstance(value, str) for value in inputs):
+        namespace: Dict[str, Any] = {"__name__": "__main__"}
+        try:
+            signal.setitimer(signal.ITIMER_REAL, time_limit)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    exec(program, namespace)
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            fn = namespace[function]
+        except CaseTimeout:
+            setup_failure = {"status": "timeout"}
+        except MemoryError:
+            setup_failure = {"status": "memory_limit"}
+        except KeyError:
+            setup_failure = {"status": "error", "error": f"NameError: name '{function}' is not defined"}
+        except BaseException:
+            setup_failure = {"status": "error", "error": traceback.format_exc()}
+
+    tracemalloc.start()
+    try:
+        for value in inputs:
+            if isinstance(value, str) and setup_failure:
+                yield dict(setup_failure)
+                continue
+            buf = io.StringIO()
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            try:
+                signal.setitimer(signal.ITIMER_REAL, time_limit)
+                try:
+                    if isinstance(value, str):
+                        with contextlib.redirect_stdout(buf):
+                            print(fn(value))
+                        result: Dict[str, Any] = {"status": "ok", "output": buf.getvalue().strip()}
+                    else:
+                        result = _run_program(program, value, output_fd)
+                finally:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+            except CaseTimeout:
+                result = {"status": "timeout"}
+            except MemoryError:
+                result = {"status": "memory_limit"}
+            except BaseException:
+                result = {"status": "error", "error": traceback.format_exc()}
+            result["time_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            result["cpu_ms"] = round((time.process_time() - cpu_start) * 1000, 3)
+            result["peak_memory_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            result["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            yield result
+    finally:
+        tracemalloc.stop()
+
+
+def apply_limits(
+    time_limit: float,
+    cases: int,
+    memory_limit: int,
+    address_space_overhead: int = 0,
+    processes: int = 0,
+) -> None:
+    """Apply rlimits to the current process: ``memory_limit`` MB of address space,
+    CPU time for every case plus a second of slack, no forks and small files.
+
+    Runtimes that reserve virtual memory up front (V8, the JVM) get
+    ``address_space_overhead`` extra MB and enforce ``memory_limit`` on their
+    heap themselves; runtimes that need threads pass ``processes``, the total
+    the user may own (see ``user_task_count``), since RLIMIT_NPROC counts threads.
+    """
+    cpu = int(math.ceil(time_limit * max(cases, 1))) + 1
+    address_space = (memory_limit + address_space_overhead) << 20
+    limits = {
+        resource.RLIMIT_AS: (address_space, address_space),
+        resource.RLIMIT_CPU: (cpu, cpu + 1),
+        resource.RLIMIT_NPROC: (processes, processes),
+        resource.RLIMIT_FSIZE: (MAX_FILE_SIZE, MAX_FILE_SIZE),
+        resource.RLIMIT_CORE: (0, 0),
+    }
+    for limit, (soft, hard) in limits.items():
+        _, current_hard = resource.getrlimit(limit)
+        if current_hard != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current_hard), min(hard, current_hard)
+        resource.setrlimit(limit, (soft, hard))
+
+
+def user_task_count() -> int:
+    """Processes and threads owned by this process's real uid, which is what RLIMIT_NPROC counts."""
+    uid = str(os.getuid())
+    count = 0
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/status", "r", encoding="ascii", errors="replace") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        if fields.get("Uid", "").split()[:1] == [uid]:
+            count += int(fields.get("Threads", "1"))
+    return count
+
+
+def _passed(result: Dict[str, Any], expected: Optional[str], comparator: str, tolerance: float) -> bool:
+    if result["status"] != "ok":
+        return False
+    if "passed" in result:
+        return result["passed"]
+    return check_output(result["output"], expected or "", comparator, tolerance) is None
+
+
+def _close_inherited_fds(keep: Tuple[int, ...]) -> None:
+    # Everything above stderr except ``keep``: the worker's reply pipe, sibling children's pipes
+    low = 3
+    for fd in sorted(keep):
+        os.closerange(low, fd)
+        low = fd + 1
+    os.closerange(low, os.sysconf("SC_OPEN_MAX"))
+
+
+def _run_child(job: Dict[str, Any], indices: List[int], write_fd: int, output_fd: int) -> None:
+    # Keep the submission away from every pipe but its own before any of its code runs
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    _close_inherited_fds((write_fd, output_fd))
+    sys.stdin = open(os.devnull)
+    out = os.fdopen(write_fd, "wb")
+    try:
+        apply_limits(job["time_limit"], len(indices), job.get("memory_limit", 256))
+        inputs = [job["inputs"][i] for i in indices]
+        cases = iter_cases(job["code"], job["function"], inputs, job["time_limit"], output_fd)
+        for index, result in zip(indices, cases):
+            result["index"] = index
+            # One line per case, flushed, so the parent can abort early on a failure
+            out.write(json.dumps(result).encode("utf-8") + b"\n")
+            out.flush()
+    except BaseException:
+        out.write(json.dumps({"error": traceback.format_exc()}).encode("utf-8") + b"\n")
+        out.flush()
+    os._exit(0)
+
+
+class _Child:
+    """The worker's side of one forked child.
+
+    The child runs submitted code, so its messages are checked rather than
+    trusted: a result must be for the child's next case, only known fields
+    are kept, and file-based cases are judged here from the raw output the
+    child wrote to ``output_fd``. A child runs either function-style cases
+    or a single file-based case, so everything on ``output_fd`` belongs to
+    that one case.
+    """
+
+    def __init__(self, pid: int, indices: List[int], control_fd: int, output_fd: int, job: Dict[str, Any]) -> None:
+        self.pid = pid
+        self.indices = indices
+        self.control_fd = control_fd
+        self.output_fd = output_fd
+        self.error: Optional[str] = None
+        self.rejected = False
+        self._inputs = job["inputs"]
+        self._comparator = job.get("comparator", "exact")
+        self._tolerance = job.get("tolerance", 1e-6)
+        self._position = 0
+        self._buffer = b""
+        self._checker: Optional[OutputChecker] = None
+        self._expected: Optional[TextIO] = None
+        self._decoder: Any = None
+
+    def receive(self, chunk: bytes) -> List[Tuple[int, Dict[str, Any]]]:
+        """Parse the result lines completed by ``chunk`` into ``(index, result)`` pairs."""
+        *lines, self._buffer = (self._buffer + chunk).split(b"\n")
+        accepted = []
+        for line in lines:
+            if self.rejected:
+                break
+            try:
+                message = json.loads(line.decode("utf-8"))
+            except ValueError:
+                message = None
+            if isinstance(message, dict) and "index" not in message:
+                self.error = str(message.get("error"))
+                continue
+            index = self._current()
+            if not isinstance(message, dict) or index is None or message["index"] != index \
+                    or isinstance(message["index"], bool):
+                self.rejected = True
+                self.error = "Grader process sent an invalid result"
+                break
+            # The child flushes a case's output before its result line, so all of it is waiting
+            self.read_output()
+            accepted.append((index, self._result(index, message)))
+            self._position += 1
+        return accepted
+
+    def read_output(self) -> bool:
+        """Feed whatever output is waiting to the current case; False once the pipe is closed."""
+        while True:
+            try:
+                chunk = os.read(self.output_fd, READ_CHUNK_SIZE)
+            except BlockingIOError:
+                return True
+            if not chunk:
+                return False
+            index = self._current()
+            if index is None or isinstance(self._inputs[index], str):
+                # Function-style cases print into the child's own buffer; anything here is stray
+                continue
+            self._write(self._decoder_for(index).decode(chunk))
+
+    def take_mismatch(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """The current file-based case as failed, if its output already differs from the expected file."""
+        index = self._current()
+        if index is None or self._checker is None or self._checker.mismatch is None:
+            return None
+        result = {"status": "ok", "passed": False, "output": self._checker.mismatch}
+        self._close_checker()
+        self._position += 1
+        return index, result
+
+    def close(self) -> None:
+        self._close_checker()
+        os.close(self.control_fd)
+        os.close(self.output_fd)
+
+    def _current(self) -> Optional[int]:
+        return self.indices[self._position] if self._position < len(self.indices) else None
+
+    def _result(self, index: int, message: Dict[str, Any]) -> Dict[str, Any]:
+        status = message.get("status")
+        if status not in RESULT_STATUSES:
+            status = "error"
+        result: Dict[str, Any] = {"status": status}
+        if status == "error":
+            result["error"] = str(message.get("error", ""))
+        elif status == "ok":
+            if isinstance(self._inputs[index], str):
+                result["output"] = str(message.get("output", ""))
+            else:
+                self._write(self._decoder_for(index).decode(b"", final=True))
+                mismatch = self._checker.finish()
+                result.update(passed=mismatch is None, output=mismatch or "")
+        for metric in RESULT_METRICS:
+            value = message.get(metric)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+                result[metric] = value
+        self._close_checker()
+        return result
+
+    def _decoder_for(self, index: int) -> Any:
+        if self._checker is None:
+            self._expected = open(self._inputs[index]["expected_file"], "r", encoding="utf-8")
+            self._checker = OutputChecker(self._expected, self._comparator, self._tolerance)
+            self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        return self._decoder
+
+    def _write(self, text: str) -> None:
+        try:
+            self._checker.write(text)
+        except OutputMismatch:
+            pass  # Recorded on the checker; take_mismatch reports it and the child is killed
+
+    def _close_checker(self) -> None:
+        if self._expected is not None:
+            self._expected.close()
+        self._checker = self._expected = self._decoder = None
+
+
+def _spawn(job: Dict[str, Any], indices: List[int]) -> _Child:
+    read_fd, write_fd = os.pipe()
+    output_read, output_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        _run_child(job, indices, write_fd, output_write)
+    os.close(write_fd)
+    os.close(output_write)
+    os.set_blocking(output_read, False)
+    return _Child(pid, indices, read_fd, output_read, job)
+
+
+def _run_forked(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Grade ``job`` in forked children and collect their results in input order.
+
+    Optional job keys: ``parallel`` runs up to that many children at once,
+    ``deadline`` caps the whole submission's wall time, and ``fail_fast``
+    (with ``expected`` outputs) stops at the first failing case and reports
+    the unfinished ones as ``"skipped"``. ``comparator`` and ``tolerance``
+    choose how outputs are compared (see ``OutputChecker``).
+    """
+    inputs = job["inputs"]
+    workers = max(1, min(int(job.get("parallel") or 1), len(inputs)))
+    expected = job.get("expected")
+    fail_fast = bool(job.get("fail_fast")) and expected is not None
+    comparator = job.get("comparator", "exact")
+    tolerance = job.get("tolerance", 1e-6)
+
+    # Function-style cases share a child per worker (one exec of the module each);
+    # every file-based case runs alone so its output pipe carries nothing else
+    calls = [i for i, value in enumerate(inputs) if isinstance(value, str)]
+    units = [calls[w::workers] for w in range(workers) if calls[w::workers]]
+    units += [[i] for i, value in enumerate(inputs) if not isinstance(value, str)]
+    units.reverse()
+
+    # Backstop for code that ignores SIGALRM (e.g. a tight loop inside a C call)
+    per_child = -(-len(inputs) // workers)
+    budget = job["time_limit"] * (per_child + 1) + 1
+    if job.get("deadline"):
+        budget = min(budget, job["deadline"])
+    started = time.monotonic()
+    deadline = started + budget
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(inputs)
+    usage = {"cpu_ms": 0.0, "max_rss_kb": 0}
+    # Running children by pid, and by each of their pipes still being read
+    running: Dict[int, _Child] = {}
+    children: Dict[int, _Child] = {}
+    timed_out = aborted = False
+
+    def finish(child: _Child, kill: bool) -> None:
+        # Reap the child and fill in whatever it never reported
+        del running[child.pid]
+        children.pop(child.control_fd, None)
+        children.pop(child.output_fd, None)
+        child.close()
+        if kill or timed_out or aborted or child.rejected:
+            try:
+                os.kill(child.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        _, status, rusage = os.wait4(child.pid, 0)
+        usage["cpu_ms"] = round(usage["cpu_ms"] + (rusage.ru_utime + rusage.ru_stime) * 1000, 3)
+        usage["max_rss_kb"] = max(usage["max_rss_kb"], rusage.ru_maxrss)
+
+        # SIGXCPU/SIGKILL mean the CPU rlimit (or our backstop) ended the child
+        killed = os.WIFSIGNALED(status) and os.WTERMSIG(status) in (signal.SIGXCPU, signal.SIGKILL)
+        if child.rejected:
+            missing: Dict[str, Any] = {"status": "error", "error": child.error}
+        elif aborted:
+            missing = {"status": "skipped"}
+        elif timed_out or killed:
+            missing = {"status": "timeout"}
+        else:
+            missing = {"status": "error", "error": child.error or "Grader process exited without reporting results"}
+        for index in child.indices:
+            if results[index] is None:
+                results[index] = dict(missing)
+
+    def record(index: int, message: Dict[str, Any]) -> None:
+        nonlocal aborted
+        results[index] = message
+        if fail_fast and not _passed(message, expected[index], comparator, tolerance):
+            aborted = True
+
+    while not aborted and (units or running):
+        while units and len(running) < workers:
+            child = _spawn(job, units.pop())
+            running[child.pid] = children[child.control_fd] = children[child.output_fd] = child
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        ready, _, _ = select.select(list(children), [], [], remaining)
+        for fd in ready:
+            child = children.get(fd)
+            if child is None:
+                continue  # Finished earlier in this pass
+            if fd == child.output_fd:
+                if not child.read_output():
+                    # The child has exited or closed its output; its result line is still to come
+                    children.pop(fd)
+            else:
+                chunk = os.read(fd, 1 << 16)
+                for index, message in child.receive(chunk):
+                    record(index, message)
+                if not chunk or child.rejected:
+                    # Anything it wrote to the output pipe before exiting belongs to its last case
+                    child.read_output()
+                    finish(child, kill=bool(chunk))
+                    continue
+            failure = child.take_mismatch()
+            if failure is not None:
+                # The output already differs; the rest of it can't make the case pass
+                record(*failure)
+                finish(child, kill=True)
+
+    for child in list(running.values()):
+        finish(child, kill=True)
+    missing = {"status": "skipped"} if aborted else {"status": "timeout"}
+    for unit in units:
+        for index in unit:
+            results[index] = dict(missing)
+
+    usage["wall_ms"] = round((time.monotonic() - started) * 1000, 3)
+    return {"results": results, "usage": usage}
+
+
+def _private_stdout() -> io.TextIOWrapper:
+    # Replies go to a private copy of stdout; fd 1 itself is pointed at /dev/null
+    out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    return out
+
+
+def run_once() -> None:
+    out = _private_stdout()
+    try:
+        response = _run_forked(json.loads(sys.stdin.readline()))
+    except Exception:
+        response = {"error": traceback.format_exc()}
+    out.write(json.dumps(response) + "\n")
+    out.flush()
+
+
+def serve() -> None:
+    out = _private_stdout()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            response = _run_forked(json.loads(line))
+        except Exception:
+            response = {"error": traceback.format_exc()}
+        out.write(json.dumps(response) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    if "--once" in sys.argv[1:]:
+        run_once()
+    else:
+        serve()
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from services.grader_metrics import GraderMetrics
+from services.sqlite_connections import LocalConnections
+
+
+class QueueFull(Exception):
+    """Raised when the grading queue already holds ``max_pending`` jobs."""
+
+
+@dataclass
+class GradingJob:
+    id: str
+    status: str = "queued"
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"job_id": self.id, "status": self.status}
+        if self.result is not None:
+            data["result"] = self.result
+        return data
+
+
+class SQLiteJobStore:
+    """Job status and results in a SQLite (WAL) file shared by every process.
+
+    A job runs in the process that accepted it, but under gunicorn the poll
+    for it may reach any worker; each state change is written here so that
+    worker can answer.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS grading_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            submitted_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            result TEXT
+        );
+        CREATE INDEX IF NOT EXISTS grading_jobs_finished ON grading_jobs (finished_at);
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connections = LocalConnections(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def save(self, job: GradingJob) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO grading_jobs (id, status, submitted_at, started_at, finished_at, result) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                job.id, job.status, job.submitted_at, job.started_at, job.finished_at,
+                json.dumps(job.result) if job.result is not None else None,
+            ),
+        )
+
+    def load(self, job_id: str) -> Optional[GradingJob]:
+        row = self._connection().execute(
+            "SELECT status, submitted_at, started_at, finished_at, result FROM grading_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, submitted_at, started_at, finished_at, result = row
+        job = GradingJob(
+            id=job_id,
+            status=status,
+            submitted_at=submitted_at,
+            started_at=started_at,
+            finished_at=finished_at,
+            result=json.loads(result) if result is not None else None,
+        )
+        if status == "done":
+            job.done.set()
+        return job
+
+    def prune(self, cutoff: float) -> None:
+        self._connection().execute("DELETE FROM grading_jobs WHERE finished_at < ?", (cutoff,))
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+
+class GradingQueue:
+    """Bounded background queue for grading submissions.
+
+    ``submit`` returns a job id straight away and a fixed set of threads runs
+    ``grade_fn`` in submission order, so slow submissions never hold a web
+    worker. At most ``max_pending`` jobs may be queued or running; beyond that
+    ``submit`` raises ``QueueFull``. Finished jobs are kept for ``result_ttl``
+    seconds for polling. With a ``store``, jobs accepted by other processes
+    can be polled too; waiting on one re-reads it every ``poll_interval``.
+    """
+
+    def __init__(
+        self,
+        grade_fn: Callable[..., Dict[str, Any]],
+        workers: int = 2,
+        max_pending: int = 64,
+        result_ttl: float = 600.0,
+        metrics: Optional[GraderMetrics] = None,
+        store: Optional[SQLiteJobStore] = None,
+        poll_interval: float = 0.1,
+    ) -> None:
+        self.grade_fn = grade_fn
+        self.metrics = metrics
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.store = store
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grader")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, GradingJob] = {}
+        self._pending = 0
+
+    def submit(self, *args: Any) -> GradingJob:
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_pending:
+                raise QueueFull()
+            job = GradingJob(id=uuid.uuid4().hex)
+            self._jobs[job.id] = job
+            self._pending += 1
+        if self.store is not None:
+            try:
+                self.store.save(job)
+            except sqlite3.Error:
+                with self._lock:
+                    del self._jobs[job.id]
+                    self._pending -= 1
+                raise
+        self._executor.submit(self._run, job, args)
+        return job
+
+    def get(self, job_id: str) -> Optional[GradingJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    def wait(self, job_id: str, timeout: float) -> Optional[GradingJob]:
+        """Return the job once it finishes or ``timeout`` seconds pass, whichever is first."""
+        with self._lock:
+            local = self._jobs.get(job_id)
+        if local is not None:
+            if timeout > 0:
+                local.done.wait(timeout)
+            return local
+        job = self.get(job_id)
+        # Another process is running it; re-read the shared store until it is done
+        deadline = time.monotonic() + timeout
+        while job is not None and job.status != "done":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(self.poll_interval, remaining))
+            job = self.store.load(job_id) or job
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"pending": self._pending, "max_pending": self.max_pending, "tracked_jobs": len(self._jobs)}
+
+    def _run(self, job: GradingJob, args: tuple) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        self._save(job)
+        if self.metrics is not None:
+            self.metrics.observe_queue_wait((job.started_at - job.submitted_at) * 1000)
+        try:
+            job.result = self.grade_fn(*args)
+        except Exception as e:
+            job.result = {"error": f"Execution error: {str(e)}"}
+        job.finished_at = time.time()
+        job.status = "done"
+        self._save(job)
+        with self._lock:
+            self._pending -= 1
+        job.done.set()
+
+    def _save(self, job: GradingJob) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.save(job)
+        except sqlite3.Error:
+            pass  # This process still answers for the job; other workers see it once a save succeeds
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self.store is not None:
+            self.store.prune(cutoff)
@@ -0,0 +1,153 @@
+// Grader harness for Java submissions.
+//
+// Usage: java -cp <harness>:<solution> Harness <method> <time limit ms>
+// Reads one base64-encoded input per line on stdin, calls Solution.<method>
+// on each with a per-case timeout, and prints one line per case:
+// "<status>\t<base64 output or error>\t<milliseconds>".
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.io.StringWriter;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.lang.reflect.Modifier;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.Base64;
+import java.util.List;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.TimeoutException;
+
+public class Harness {
+    private static PrintStream out;
+
+    public static void main(String[] args) throws Exception {
+        out = System.out;
+        String function = args[0];
+        long timeLimitMs = Long.parseLong(args[1]);
+
+        List<String> inputs = new ArrayList<>();
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        for (String line = in.readLine(); line != null; line = in.readLine()) {
+            inputs.add(new String(Base64.getDecoder().decode(line.trim()), StandardCharsets.UTF_8));
+        }
+
+        Method method;
+        Object instance;
+        try {
+            method = findMethod(Class.forName("Solution"), function);
+            instance = Modifier.isStatic(method.getModifiers())
+                ? null
+                : method.getDeclaringClass().getDeclaredConstructor().newInstance();
+        } catch (Throwable e) {
+            for (int i = 0; i < inputs.size(); i++) {
+                report("error", stackTrace(e), System.nanoTime());
+            }
+            out.flush();
+            return;
+        }
+
+        ExecutorService executor = Executors.newSingleThreadExecutor(r -> {
+            Thread thread = new Thread(r);
+            thread.setDaemon(true);
+            return thread;
+        });
+        Class<?> parameter = method.getParameterTypes()[0];
+        for (int i = 0; i < inputs.size(); i++) {
+            long start = System.nanoTime();
+            Object arg;
+            try {
+                arg = convert(inputs.get(i), parameter);
+            } catch (RuntimeException e) {
+                report("error", stackTrace(e), start);
+                continue;
+            }
+
+            ByteArrayOutputStream captured = new ByteArrayOutputStream();
+            System.setOut(new PrintStream(captured, true, "UTF-8"));
+            final Method target = method;
+            final Object self = instance;
+            final Object input = arg;
+            Future<Object> future = executor.submit(() -> target.invoke(self, input));
+            try {
+                Object value = future.get(timeLimitMs, TimeUnit.MILLISECONDS);
+                System.setOut(out);
+                report("ok", (captured.toString("UTF-8") + format(value)).trim(), start);
+            } catch (TimeoutException e) {
+                // The runaway call cannot be stopped; report the rest as timed out and halt
+                System.setOut(out);
+                for (int j = i; j < inputs.size(); j++) {
+                    report("timeout", "", start);
+                }
+                out.flush();
+                Runtime.getRuntime().halt(0);
+            } catch (ExecutionException e) {
+                System.setOut(out);
+                Throwable cause = e.getCause();
+                if (cause instanceof InvocationTargetException) {
+                    cause = cause.getCause();
+                }
+                report(cause instanceof OutOfMemoryError ? "memory_limit" : "error", stackTrace(cause), start);
+            }
+        }
+        out.flush();
+        System.exit(0);
+    }
+
+    private static Method findMethod(Class<?> cls, String name) throws NoSuchMethodException {
+        for (Method method : cls.getDeclaredMethods()) {
+            if (method.getName().equals(name) && method.getParameterCount() == 1) {
+                method.setAccessible(true);
+                return method;
+            }
+        }
+        throw new NoSuchMethodException("Solution." + name + " taking one argument is not defined");
+    }
+
+    private static Object convert(String raw, Class<?> type) {
+        String s = raw.trim();
+        if (type == String.class) return raw;
+        if (type == int.class || type == Integer.class) return Integer.parseInt(s);
+        if (type == long.class || type == Long.class) return Long.parseLong(s);
+        if (type == double.class || type == Double.class) return Double.parseDouble(s);
+        if (type == boolean.class || type == Boolean.class) return Boolean.parseBoolean(s);
+        if (type == int[].class) {
+            String body = s.replaceAll("^\\[|\\]$", "").trim();
+            if (body.isEmpty()) return new int[0];
+            String[] parts = body.split(",");
+            int[] values = new int[parts.length];
+            for (int i = 0; i < parts.length; i++) {
+                values[i] = Integer.parseInt(parts[i].trim());
+            }
+            return values;
+        }
+        throw new IllegalArgumentException("Unsupported parameter type " + type.getSimpleName());
+    }
+
+    private static String format(Object value) {
+        // Expected outputs follow Python's print(): missing values render as None
+        if (value == null) return "None";
+        if (value instanceof int[]) return Arrays.toString((int[]) value);
+        if (value instanceof Object[]) return Arrays.toString((Object[]) value);
+        return String.valueOf(value);
+    }
+
+    private static String stackTrace(Throwable e) {
+        StringWriter writer = new StringWriter();
+        e.printStackTrace(new PrintWriter(writer));
+        return writer.toString();
+    }
+
+    private static void report(String status, String text, long start) {
+        String encoded = Base64.getEncoder().encodeToString(text.getBytes(StandardCharsets.UTF_8));
+        double ms = (System.nanoTime() - start) / 1e6;
+        out.println(status + "\t" + encoded + "\t" + ms);
+    }
+}
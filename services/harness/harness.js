@@ -0,0 +1,98 @@
+// Grader harness for JavaScript submissions.
+//
+// Speaks the same JSON-lines protocol as grader_worker.py: each request is
+// {"code", "function", "inputs", "time_limit"} and each reply is
+// {"results": [...]}. The code is compiled once in a vm context and the
+// function is called for every input with a per-case timeout. A vm context is
+// not a security boundary (submitted code can reach `process`), so the grader
+// runs this with --once in a fresh process per submission, under rlimits and
+// Node's permission model; never keep one process serving several users.
+'use strict';
+
+const readline = require('readline');
+const vm = require('vm');
+
+const IDENTIFIER = /^[A-Za-z_$][\w$]*$/;
+
+function format(value) {
+  // Expected outputs follow Python's print(): missing values render as None
+  if (value === null || value === undefined) return 'None';
+  if (typeof value === 'object') return JSON.stringify(value);
+  return String(value);
+}
+
+function parseInput(raw) {
+  // Numbers, arrays and objects arrive as JSON text; anything else is a plain string
+  try {
+    const value = JSON.parse(raw);
+    if (typeof value !== 'string') return value;
+  } catch (e) {
+    // not JSON
+  }
+  return raw;
+}
+
+function failure(error) {
+  if (error && error.code === 'ERR_SCRIPT_EXECUTION_TIMEOUT') return { status: 'timeout' };
+  return { status: 'error', error: (error && error.stack) || String(error) };
+}
+
+function runCases(job) {
+  const timeout = Math.max(1, Math.round(job.time_limit * 1000));
+  const logs = [];
+  const log = (...args) => logs.push(args.map((a) => (typeof a === 'string' ? a : format(a))).join(' '));
+  const context = vm.createContext({ console: { log, info: log, warn: log, error: log } });
+
+  if (!IDENTIFIER.test(job.function)) {
+    return job.inputs.map(() => ({ status: 'error', error: `Invalid function name ${job.function}` }));
+  }
+  let fn;
+  try {
+    new vm.Script(job.code, { filename: 'submission.js' }).runInContext(context, { timeout });
+    // Resolves function declarations as well as const/let bindings
+    fn = vm.runInContext(`typeof ${job.function} === 'function' ? ${job.function} : undefined`, context);
+  } catch (error) {
+    const result = failure(error);
+    return job.inputs.map(() => result);
+  }
+  if (fn === undefined) {
+    const error = `ReferenceError: ${job.function} is not defined`;
+    return job.inputs.map(() => ({ status: 'error', error }));
+  }
+
+  const call = new vm.Script(`${job.function}(__input)`, { filename: 'harness.js' });
+  return job.inputs.map((raw) => {
+    logs.length = 0;
+    context.__input = parseInput(raw);
+    const start = process.hrtime.bigint();
+    let result;
+    try {
+      const value = call.runInContext(context, { timeout });
+      result = { status: 'ok', output: logs.concat([format(value)]).join('\n').trim() };
+    } catch (error) {
+      result = failure(error);
+    }
+    result.time_ms = Number(process.hrtime.bigint() - start) / 1e6;
+    return result;
+  });
+}
+
+function handle(line) {
+  try {
+    return { results: runCases(JSON.parse(line)) };
+  } catch (error) {
+    return { error: (error && error.stack) || String(error) };
+  }
+}
+
+function main() {
+  const once = process.argv.includes('--once');
+  const input = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+  input.on('line', (line) => {
+    if (!line.trim()) return;
+    process.stdout.write(JSON.stringify(handle(line)) + '\n');
+    if (once) input.close();
+  });
+}
+
+main();
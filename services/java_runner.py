@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import base64
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.grader_worker import apply_limits, user_task_count
+
+HARNESS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "harness")
+COMPILE_TIMEOUT = 30
+
+# Flags that trim JVM startup, which dominates short submissions, and its up-front reservations
+JVM_FLAGS = [
+    "-Xshare:auto", "-XX:TieredStopAtLevel=1", "-XX:+UseSerialGC", "-Xss16m",
+    "-XX:ReservedCodeCacheSize=64m", "-XX:CompressedClassSpaceSize=64m", "-XX:MaxMetaspaceSize=128m",
+]
+# Address space the JVM needs beyond -Xmx: code cache, class space, metaspace, thread stacks
+JVM_ADDRESS_SPACE_MB = 1024
+# Threads the JVM may start beyond those the server already runs; RLIMIT_NPROC counts threads
+JVM_THREADS = 32
+
+
+class JavaRunner:
+    """Compiles and runs Java submissions through ``harness/Harness.java``.
+
+    Compiled classes are cached on disk under a hash of the source, so a
+    resubmitted or shared solution skips ``javac`` (compile errors are cached
+    too). Each submission runs every test case inside a single JVM, started
+    fresh under the same rlimits as Python submissions.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 256) -> None:
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "grader-java")
+        self.max_entries = max_entries
+        self.javac = shutil.which("javac")
+        self.java = shutil.which("java")
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return self.javac is not None and self.java is not None
+
+    def run(
+        self,
+        code: str,
+        function: str,
+        inputs: List[str],
+        time_limit: float,
+        memory_limit: int = 256,
+    ) -> Dict[str, Any]:
+        if not self.available:
+            return {"error": "Java is not installed on this server"}
+
+        with open(os.path.join(HARNESS_DIR, "Harness.java"), "r", encoding="utf-8") as f:
+            harness_dir, error = self._compile("Harness", f.read())
+        if error is not None:
+            return {"error": f"Harness failed to compile:\n{error}"}
+        solution_dir, error = self._compile("Solution", code)
+        if error is not None:
+            return {"error": error}
+
+        command = [
+            self.java, f"-Xmx{memory_limit}m", *JVM_FLAGS,
+            "-cp", os.pathsep.join([harness_dir, solution_dir]),
+            "Harness", function, str(int(time_limit * 1000)),
+        ]
+        stdin = "".join(base64.b64encode(value.encode("utf-8")).decode("ascii") + "\n" for value in inputs)
+        try:
+            result = subprocess.run(
+                command,
+                input=stdin,
+                capture_output=True,
+                text=True,
+                # The CPU limit allows one extra case for JVM startup
+                preexec_fn=functools.partial(
+                    apply_limits,
+                    time_limit,
+                    len(inputs) + 1,
+                    memory_limit,
+                    JVM_ADDRESS_SPACE_MB,
+                    user_task_count() + JVM_THREADS,
+                ),
+                # JVM startup is not the submission's fault; allow a few seconds for it
+                timeout=time_limit * (len(inputs) + 1) + 5,
+            )
+        except subprocess.TimeoutExpired:
+            return {"results": [{"status": "timeout"} for _ in inputs]}
+
+        results = [self._parse_line(line) for line in result.stdout.splitlines() if line]
+        if len(results) != len(inputs):
+            return {"error": result.stderr or "Java process exited without reporting results"}
+        return {"results": results}
+
+    @staticmethod
+    def _parse_line(line: str) -> Dict[str, Any]:
+        status, payload, ms = line.split("\t")
+        text = base64.b64decode(payload).decode("utf-8")
+        result: Dict[str, Any] = {"status": status, "time_ms": round(float(ms), 3)}
+        if status == "ok":
+            result["output"] = text
+        elif status == "error":
+            result["error"] = text
+        return result
+
+    def _compile(self, class_name: str, source: str) -> Tuple[str, Optional[str]]:
+        """Return ``(class directory, compile error)``, compiling only on a cache miss."""
+        key = hashlib.sha256(f"{class_name}\0{source}".encode("utf-8")).hexdigest()
+        target = os.path.join(self.cache_dir, key)
+        error_path = os.path.join(target, "compile_error.txt")
+        if not os.path.isdir(target):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            build = tempfile.mkdtemp(prefix=".build-", dir=self.cache_dir)
+            source_path = os.path.join(build, f"{class_name}.java")
+            with open(source_path, "w", encoding="utf-8") as f:
+                f.write(source)
+            try:
+                proc = subprocess.run(
+                    [self.javac, "-encoding", "UTF-8", "-nowarn", "-d", build, source_path],
+                    capture_output=True,
+                    text=True,
+                    timeout=COMPILE_TIMEOUT,
+                )
+                compile_error = proc.stderr if proc.returncode != 0 else None
+            except subprocess.TimeoutExpired:
+                compile_error = "Compilation timed out"
+            if compile_error is not None:
+                with open(os.path.join(build, "compile_error.txt"), "w", encoding="utf-8") as f:
+                    f.write(compile_error)
+            try:
+                os.rename(build, target)
+            except OSError:
+                # Another thread or process published the same source first
+                shutil.rmtree(build, ignore_errors=True)
+            self._prune()
+        else:
+            os.utime(target)
+
+        if os.path.exists(error_path):
+            with open(error_path, "r", encoding="utf-8") as f:
+                return target, f.read()
+        return target, None
+
+    def _prune(self) -> None:
+        with self._lock:
+            entries = [
+                os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)
+                if not name.startswith(".")
+            ]
+            if len(entries) <= self.max_entries:
+                return
+            entries.sort(key=os.path.getmtime)
+            for path in entries[:len(entries) - self.max_entries]:
+                shutil.rmtree(path, ignore_errors=True)
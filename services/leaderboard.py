@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: Any, level: int) -> None:
+        self.key = key
+        self.next: List[Optional[_Node]] = [None] * level
+        # width[i] is how many positions next[i] is ahead of this node
+        self.width = [1] * level
+
+
+class RankedSet:
+    """Sorted set with O(log n) insert, remove, rank lookup and positional access.
+
+    An indexable skip list: every forward link also records how many
+    elements it skips, so the position of a key is summed on the way down.
+    """
+
+    def __init__(self) -> None:
+        self.head = _Node(None, MAX_LEVEL)
+        self.size = 0
+        # Number of levels in use; the head's links above this are ignored
+        self.level = 1
+        self._random = random.Random()
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def from_sorted(cls, keys: List[Any]) -> "RankedSet":
+        """Build a set from already sorted, distinct keys in O(n)."""
+        ranked = cls()
+        tails = [ranked.head] * MAX_LEVEL
+        tail_positions = [0] * MAX_LEVEL
+        for position, key in enumerate(keys, 1):
+            level = ranked._random_level()
+            node = _Node(key, level)
+            for i in range(level):
+                tails[i].next[i] = node
+                tails[i].width[i] = position - tail_positions[i]
+                tails[i], tail_positions[i] = node, position
+            ranked.level = max(ranked.level, level)
+        for i in range(ranked.level):
+            tails[i].width[i] = len(keys) + 1 - tail_positions[i]
+        ranked.size = len(keys)
+        return ranked
+
+    def insert(self, key: Any) -> None:
+        update: List[_Node] = [self.head] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node, position = self.head, 0
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+            update[i], positions[i] = node, position
+
+        level = self._random_level()
+        for i in range(self.level, level):
+            self.head.width[i] = self.size + 1
+        self.level = max(self.level, level)
+        new = _Node(key, level)
+        for i in range(self.level):
+            if i < level:
+                new.next[i] = update[i].next[i]
+                update[i].next[i] = new
+                new.width[i] = update[i].width[i] - (position - positions[i])
+                update[i].width[i] = position - positions[i] + 1
+            else:
+                update[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key: Any) -> bool:
+        update: List[_Node] = [self.head] * MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+
+        target = node.next[0]
+        if target is None or target.key != key:
+            return False
+        for i in range(self.level):
+            if update[i].next[i] is target:
+                update[i].width[i] += target.width[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].width[i] -= 1
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+        return True
+
+    def index(self, key: Any) -> Optional[int]:
+        """0-based position of ``key``, or None if it is not in the set."""
+        node, position = self.head, 0
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+        found = node.next[0]
+        return position if found is not None and found.key == key else None
+
+    def slice(self, start: int, stop: int) -> List[Any]:
+        """Keys at positions ``start`` up to (not including) ``stop``."""
+        start = max(0, start)
+        if start >= min(stop, self.size):
+            return []
+        # Walk down to the node just before ``start``, then step along level 0
+        node, position = self.head, 0
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and position + node.width[i] <= start:
+                position += node.width[i]
+                node = node.next[i]
+        keys = []
+        node = node.next[0]
+        while node is not None and len(keys) < stop - start:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < MAX_LEVEL and self._random.random() < 0.5:
+            level += 1
+        return level
+
+
+class Leaderboard:
+    """Users ranked by points, updated incrementally as points change.
+
+    Ranks are 1-based; users with equal points are ordered by user id.
+    Updates, top-N, own rank and neighbour queries are all O(log n).
+    """
+
+    def __init__(self) -> None:
+        self._points: Dict[str, int] = {}
+        self._ranked = RankedSet()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ranked)
+
+    def update(self, user_id: str, points: int) -> None:
+        with self._lock:
+            self._set(user_id, points)
+
+    def add(self, user_id: str, points: int) -> None:
+        with self._lock:
+            self._set(user_id, self._points.get(user_id, 0) + points)
+
+    def reset(self, points: Dict[str, int]) -> None:
+        """Replace every entry at once; much faster than ``update`` per user."""
+        ranked = RankedSet.from_sorted(sorted((-p, user_id) for user_id, p in points.items()))
+        with self._lock:
+            self._points = dict(points)
+            self._ranked = ranked
+
+    def remove(self, user_id: str) -> None:
+        with self._lock:
+            old = self._points.pop(user_id, None)
+            if old is not None:
+                self._ranked.remove((-old, user_id))
+
+    def top(self, n: int) -> List[Tuple[int, str, int]]:
+        """``(rank, user_id, points)`` for the ``n`` highest-scoring users."""
+        with self._lock:
+            return self._entries(0, n)
+
+    def points(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            return self._points.get(user_id)
+
+    def rank(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            index = self._index(user_id)
+            return index + 1 if index is not None else None
+
+    def around(self, user_id: str, radius: int) -> List[Tuple[int, str, int]]:
+        """The user's entry plus up to ``radius`` entries either side of it."""
+        with self._lock:
+            index = self._index(user_id)
+            if index is None:
+                return []
+            return self._entries(index - radius, index + radius + 1)
+
+    def _set(self, user_id: str, points: int) -> None:
+        old = self._points.get(user_id)
+        if old == points:
+            return
+        if old is not None:
+            self._ranked.remove((-old, user_id))
+        self._ranked.insert((-points, user_id))
+        self._points[user_id] = points
+
+    def _index(self, user_id: str) -> Optional[int]:
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        return self._ranked.index((-points, user_id))
+
+    def _entries(self, start: int, stop: int) -> List[Tuple[int, str, int]]:
+        start = max(0, start)
+        return [
+            (start + offset + 1, user_id, -negated)
+            for offset, (negated, user_id) in enumerate(self._ranked.slice(start, stop))
+        ]
+
+
+class RollingLeaderboard:
+    """Users ranked by points earned within a sliding time window.
+
+    The window is ``buckets`` consecutive buckets of ``bucket_seconds``, held
+    in a ring buffer of per-bucket counters alongside running totals and a
+    ``Leaderboard`` over those totals. Points go into the current bucket; when
+    the window slides past a bucket its counters are subtracted from the
+    totals and the slot is reused. Queries never rescan history, and memory
+    is bounded by the users active within the window.
+    """
+
+    def __init__(self, bucket_seconds: float, buckets: int, clock: Callable[[], float] = time.time) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.clock = clock
+        self._counters: List[Dict[str, int]] = [{} for _ in range(buckets)]
+        self._current = int(clock() // bucket_seconds)
+        self._totals = Leaderboard()
+        self._lock = threading.Lock()
+
+    @property
+    def window_seconds(self) -> float:
+        return self.bucket_seconds * self.buckets
+
+    def __len__(self) -> int:
+        self._advance(self.clock())
+        return len(self._totals)
+
+    def add(self, user_id: str, points: int, at: Optional[float] = None) -> None:
+        at = self.clock() if at is None else at
+        bucket = int(at // self.bucket_seconds)
+        with self._lock:
+            self._advance_locked(bucket)
+            if bucket <= self._current - self.buckets:
+                return  # Already outside the window
+            counters = self._counters[bucket % self.buckets]
+            counters[user_id] = counters.get(user_id, 0) + points
+            self._totals.add(user_id, points)
+
+    def points(self, user_id: str) -> Optional[int]:
+        self._advance(self.clock())
+        return self._totals.points(user_id)
+
+    def top(self, n: int) -> List[Tuple[int, str, int]]:
+        self._advance(self.clock())
+        return self._totals.top(n)
+
+    def rank(self, user_id: str) -> Optional[int]:
+        self._advance(self.clock())
+        return self._totals.rank(user_id)
+
+    def around(self, user_id: str, radius: int) -> List[Tuple[int, str, int]]:
+        self._advance(self.clock())
+        return self._totals.around(user_id, radius)
+
+    def _advance(self, now: float) -> None:
+        with self._lock:
+            self._advance_locked(int(now // self.bucket_seconds))
+
+    def _advance_locked(self, bucket: int) -> None:
+        # Evict every bucket the window has slid past, at most one full lap
+        if bucket <= self._current:
+            return
+        for expired in range(max(self._current + 1, bucket - self.buckets + 1), bucket + 1):
+            counters = self._counters[expired % self.buckets]
+            for user_id, points in counters.items():
+                self._totals.add(user_id, -points)
+                if not self._totals.points(user_id):
+                    self._totals.remove(user_id)
+            counters.clear()
+        self._current = bucket
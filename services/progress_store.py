@@ -0,0 +1,520 @@
+from __future__ import annotations
+
+import abc
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from services.sqlite_connections import LocalConnections
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class PointEvent:
+    user_id: str
+    points: int
+    at: float
+    course_id: Optional[str] = None
+
+
+@dataclass
+class PointHistory:
+    """Per-course lifetime points plus the recent point events, read as one snapshot."""
+    course_points: Dict[str, Dict[str, int]]
+    events: List[PointEvent]
+    cursor: int
+
+
+@dataclass
+class ProgressDelta:
+    """Pending change to one user's progress; deltas for the same user merge until flushed."""
+    user_id: str
+    experience: int = 0
+    total_points: int = 0
+    streak_days: int = 0
+    completed_lessons: Set[str] = field(default_factory=set)
+    achievements: Set[str] = field(default_factory=set)
+    events: List[PointEvent] = field(default_factory=list)
+    counters: Dict[str, int] = field(default_factory=dict)
+    helped_peers: Set[str] = field(default_factory=set)
+
+    def merge(self, other: "ProgressDelta") -> None:
+        self.experience += other.experience
+        self.total_points += other.total_points
+        self.streak_days += other.streak_days
+        self.completed_lessons |= other.completed_lessons
+        self.achievements |= other.achievements
+        self.helped_peers |= other.helped_peers
+        self.events += other.events
+        for name, value in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def apply_to(self, row: Dict[str, Any]) -> None:
+        row["experience"] += self.experience
+        row["total_points"] += self.total_points
+        row["streak_days"] += self.streak_days
+        row["completed_lessons"] += [l for l in sorted(self.completed_lessons) if l not in row["completed_lessons"]]
+        row["achievements"] += [a for a in sorted(self.achievements) if a not in row["achievements"]]
+        row["helped_peers"] += [p for p in sorted(self.helped_peers) if p not in row["helped_peers"]]
+        for name, value in self.counters.items():
+            row["counters"][name] = row["counters"].get(name, 0) + value
+
+
+def empty_row(user_id: str) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "experience": 0,
+        "total_points": 0,
+        "completed_lessons": [],
+        "achievements": [],
+        "streak_days": 0,
+        "last_login": "",
+        "counters": {},
+        "helped_peers": [],
+    }
+
+
+class ProgressStore(abc.ABC):
+    """Where user progress lives.
+
+    ``load`` returns a user's row (a dict of ``UserProgress`` fields, without
+    ``level``) or None, ``apply`` records a ``ProgressDelta`` and ``top``
+    returns the highest-scoring rows. ``changed_points`` feeds incremental
+    indexes such as the leaderboard. ``shared`` stores may be written by
+    other processes, so callers should re-load cached rows periodically.
+    """
+
+    shared = False
+
+    @abc.abstractmethod
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def apply(self, delta: ProgressDelta) -> None:
+        ...
+
+    @abc.abstractmethod
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def changed_points(self, cursor: int = 0) -> Tuple[Dict[str, int], int]:
+        """``total_points`` of users changed since ``cursor``, plus the cursor to pass next time.
+
+        Cursor 0 returns every user.
+        """
+
+    @abc.abstractmethod
+    def point_history(self, since: float) -> PointHistory:
+        """Per-course points and the point events at or after ``since``, for seeding leaderboards."""
+
+    @abc.abstractmethod
+    def point_events(self, cursor: int) -> Tuple[List[PointEvent], int]:
+        """Point events recorded by other processes since ``cursor``, plus the next cursor."""
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryProgressStore(ProgressStore):
+    """Process-local store; progress is lost on restart."""
+
+    def __init__(self) -> None:
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._seqs: Dict[str, int] = {}
+        self._seq = 0
+        self._course_points: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.get(user_id)
+            return _copy_row(row) if row is not None else None
+
+    def apply(self, delta: ProgressDelta) -> None:
+        with self._lock:
+            row = self._rows.setdefault(delta.user_id, empty_row(delta.user_id))
+            delta.apply_to(row)
+            self._seq += 1
+            self._seqs[delta.user_id] = self._seq
+            for event in delta.events:
+                if event.course_id is not None:
+                    course = self._course_points.setdefault(event.course_id, {})
+                    course[event.user_id] = course.get(event.user_id, 0) + event.points
+
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = sorted(self._rows.values(), key=lambda r: r["total_points"], reverse=True)[:n]
+            return [_copy_row(row) for row in rows]
+
+    def changed_points(self, cursor: int = 0) -> Tuple[Dict[str, int], int]:
+        with self._lock:
+            changed = {
+                user_id: self._rows[user_id]["total_points"]
+                for user_id, seq in self._seqs.items() if seq > cursor
+            }
+            return changed, self._seq
+
+    def point_history(self, since: float) -> PointHistory:
+        # Events are not kept; nothing but this process writes the store
+        with self._lock:
+            return PointHistory({c: dict(points) for c, points in self._course_points.items()}, [], 0)
+
+    def point_events(self, cursor: int) -> Tuple[List[PointEvent], int]:
+        return [], cursor
+
+
+class SQLiteProgressStore(ProgressStore):
+    """SQLite (WAL) store shared by every process that opens the same file.
+
+    ``apply`` only merges the delta into an in-memory pending map; a
+    background thread writes all pending deltas every ``flush_interval``
+    seconds in one transaction. Deltas are applied as increments and
+    set-unions in SQL, so concurrent writers never overwrite each other.
+    ``load`` overlays pending deltas, including a batch that is being
+    flushed, so a process always reads its own writes exactly once.
+    Each flush stamps the rows it touched with the next ``seq``, which is what
+    ``changed_points`` cursors over. Point events are kept for
+    ``event_retention`` seconds, tagged with the writing process so
+    ``point_events`` can skip that process's own events.
+    """
+
+    shared = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id TEXT PRIMARY KEY,
+            experience INTEGER NOT NULL DEFAULT 0,
+            total_points INTEGER NOT NULL DEFAULT 0,
+            streak_days INTEGER NOT NULL DEFAULT 0,
+            last_login TEXT NOT NULL DEFAULT '',
+            seq INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS user_progress_points ON user_progress (total_points DESC);
+        CREATE INDEX IF NOT EXISTS user_progress_seq ON user_progress (seq);
+        CREATE TABLE IF NOT EXISTS completed_lessons (
+            user_id TEXT NOT NULL,
+            lesson_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, lesson_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            user_id TEXT NOT NULL,
+            achievement_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, achievement_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS user_counters (
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS helped_peers (
+            user_id TEXT NOT NULL,
+            peer_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, peer_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS course_points (
+            course_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            points INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (course_id, user_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS point_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            course_id TEXT,
+            points INTEGER NOT NULL,
+            at REAL NOT NULL,
+            origin TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS point_events_at ON point_events (at);
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, event_retention: float = 8 * 86400) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.event_retention = event_retention
+        self._origin = ""
+        self._pending: Dict[str, ProgressDelta] = {}
+        # The batch a flush has taken from _pending but not committed yet
+        self._flushing: Dict[str, ProgressDelta] = {}
+        # Bumped before and after each commit, so it is odd while one is in progress
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._connections = LocalConnections(path)
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher_pid: Optional[int] = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._migrate()
+        atexit.register(self.close)
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        def read(db: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+            found = db.execute(
+                "SELECT experience, total_points, streak_days, last_login FROM user_progress WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            if found is None:
+                return None
+            row = empty_row(user_id)
+            row["experience"], row["total_points"], row["streak_days"], row["last_login"] = found
+            row["completed_lessons"] = [r[0] for r in db.execute(
+                "SELECT lesson_id FROM completed_lessons WHERE user_id = ? ORDER BY lesson_id", (user_id,)
+            )]
+            row["achievements"] = [r[0] for r in db.execute(
+                "SELECT achievement_id FROM user_achievements WHERE user_id = ? ORDER BY achievement_id",
+                (user_id,),
+            )]
+            row["counters"] = dict(db.execute(
+                "SELECT name, value FROM user_counters WHERE user_id = ?", (user_id,)
+            ).fetchall())
+            row["helped_peers"] = [r[0] for r in db.execute(
+                "SELECT peer_id FROM helped_peers WHERE user_id = ? ORDER BY peer_id", (user_id,)
+            )]
+            return row
+
+        def overlay(row: Optional[Dict[str, Any]], unflushed: List[Dict[str, ProgressDelta]]) -> Optional[Dict[str, Any]]:
+            for deltas in unflushed:
+                delta = deltas.get(user_id)
+                if delta is not None:
+                    row = row or empty_row(user_id)
+                    delta.apply_to(row)
+            return row
+
+        return self._read(read, overlay)
+
+    def apply(self, delta: ProgressDelta) -> None:
+        self._ensure_flusher()
+        with self._lock:
+            pending = self._pending.get(delta.user_id)
+            if pending is None:
+                self._pending[delta.user_id] = delta
+            else:
+                pending.merge(delta)
+
+    def top(self, n: int) -> List[Dict[str, Any]]:
+        # Reads committed rows only; pending deltas show up after the next flush
+        user_ids = [r[0] for r in self._connection().execute(
+            "SELECT user_id FROM user_progress ORDER BY total_points DESC LIMIT ?", (n,)
+        )]
+        return [row for row in (self.load(user_id) for user_id in user_ids) if row is not None]
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+            if not batch:
+                return
+            db = self._connection()
+            committed = False
+            try:
+                # IMMEDIATE takes the write lock up front, so seq values commit in order
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._write(db, batch)
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+                with self._lock:
+                    self._generation += 1
+                try:
+                    db.execute("COMMIT")
+                    committed = True
+                finally:
+                    with self._lock:
+                        self._generation += 1
+            finally:
+                with self._lock:
+                    self._flushing = {}
+                    if not committed:
+                        # Put the batch back in front of anything that arrived meanwhile and retry next tick
+                        for user_id, delta in batch.items():
+                            newer = self._pending.get(user_id)
+                            if newer is not None:
+                                delta.merge(newer)
+                            self._pending[user_id] = delta
+
+    def _write(self, db: sqlite3.Connection, batch: Dict[str, ProgressDelta]) -> None:
+        seq = db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM user_progress").fetchone()[0]
+        db.executemany(
+            "INSERT OR IGNORE INTO user_progress (user_id) VALUES (?)",
+            [(user_id,) for user_id in batch],
+        )
+        db.executemany(
+            "UPDATE user_progress SET experience = experience + ?, total_points = total_points + ?, "
+            "streak_days = streak_days + ?, seq = ? WHERE user_id = ?",
+            [(d.experience, d.total_points, d.streak_days, seq, d.user_id) for d in batch.values()],
+        )
+        db.executemany(
+            "INSERT OR IGNORE INTO completed_lessons (user_id, lesson_id) VALUES (?, ?)",
+            [(d.user_id, l) for d in batch.values() for l in d.completed_lessons],
+        )
+        db.executemany(
+            "INSERT OR IGNORE INTO user_achievements (user_id, achievement_id) VALUES (?, ?)",
+            [(d.user_id, a) for d in batch.values() for a in d.achievements],
+        )
+        db.executemany(
+            "INSERT OR IGNORE INTO helped_peers (user_id, peer_id) VALUES (?, ?)",
+            [(d.user_id, p) for d in batch.values() for p in d.helped_peers],
+        )
+        db.executemany(
+            "INSERT INTO user_counters (user_id, name, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id, name) DO UPDATE SET value = value + excluded.value",
+            [(d.user_id, name, value) for d in batch.values() for name, value in d.counters.items()],
+        )
+        events = [e for d in batch.values() for e in d.events]
+        db.executemany(
+            "INSERT INTO point_events (user_id, course_id, points, at, origin) VALUES (?, ?, ?, ?, ?)",
+            [(e.user_id, e.course_id, e.points, e.at, self._origin) for e in events],
+        )
+        db.executemany(
+            "INSERT INTO course_points (course_id, user_id, points) VALUES (?, ?, ?) "
+            "ON CONFLICT (course_id, user_id) DO UPDATE SET points = points + excluded.points",
+            [(e.course_id, e.user_id, e.points) for e in events if e.course_id is not None],
+        )
+        db.execute("DELETE FROM point_events WHERE at < ?", (time.time() - self.event_retention,))
+
+    def changed_points(self, cursor: int = 0) -> Tuple[Dict[str, int], int]:
+        def read(db: sqlite3.Connection) -> List[Tuple[str, int, int]]:
+            return db.execute(
+                "SELECT user_id, total_points, seq FROM user_progress WHERE seq > ?", (cursor,)
+            ).fetchall()
+
+        def overlay(rows: List[Tuple[str, int, int]], unflushed: List[Dict[str, ProgressDelta]]) -> Tuple[Dict[str, int], int]:
+            # Report this process's unflushed points too, as load does. A full
+            # scan also lists unflushed users that have no row yet.
+            changed = {user_id: points for user_id, points, _ in rows}
+            for deltas in unflushed:
+                for user_id, delta in deltas.items():
+                    if user_id in changed:
+                        changed[user_id] += delta.total_points
+                    elif cursor == 0:
+                        changed[user_id] = changed.get(user_id, 0) + delta.total_points
+            return changed, max([cursor] + [seq for _, _, seq in rows])
+
+        return self._read(read, overlay)
+
+    def point_history(self, since: float) -> PointHistory:
+        db = self._connection()
+        # One read transaction, so the totals and the event cursor agree
+        db.execute("BEGIN")
+        try:
+            course_points: Dict[str, Dict[str, int]] = {}
+            for course_id, user_id, points in db.execute("SELECT course_id, user_id, points FROM course_points"):
+                course_points.setdefault(course_id, {})[user_id] = points
+            events = [
+                PointEvent(user_id, points, at, course_id)
+                for user_id, course_id, points, at in db.execute(
+                    "SELECT user_id, course_id, points, at FROM point_events WHERE at >= ? ORDER BY id", (since,)
+                )
+            ]
+            cursor = db.execute("SELECT COALESCE(MAX(id), 0) FROM point_events").fetchone()[0]
+        finally:
+            db.execute("COMMIT")
+        return PointHistory(course_points, events, cursor)
+
+    def point_events(self, cursor: int) -> Tuple[List[PointEvent], int]:
+        rows = self._connection().execute(
+            "SELECT id, user_id, course_id, points, at, origin FROM point_events WHERE id > ? ORDER BY id", (cursor,)
+        ).fetchall()
+        own = self._origin if self._flusher_pid == os.getpid() else None
+        events = [
+            PointEvent(user_id, points, at, course_id)
+            for _, user_id, course_id, points, at, origin in rows if origin != own
+        ]
+        return events, rows[-1][0] if rows else cursor
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._flusher_pid == os.getpid():
+            self.flush()
+
+    def _ensure_flusher(self) -> None:
+        # The flusher thread does not survive a fork; each process starts its own
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._pending = {}
+            self._flushing = {}
+            self._origin = uuid.uuid4().hex
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name="progress-flusher", daemon=True).start()
+
+    def _read(
+        self,
+        read: Callable[[sqlite3.Connection], T],
+        overlay: Callable[[T, List[Dict[str, ProgressDelta]]], R],
+    ) -> R:
+        """Run ``read`` in one read transaction, then ``overlay`` its result with the
+        deltas this process has not committed: the batch being flushed, then pending.
+
+        A read that overlaps a commit cannot tell whether it saw that batch, so it
+        waits for the commit to finish and reads again.
+        """
+        while True:
+            with self._lock:
+                generation = self._generation
+            if generation % 2:
+                with self._flush_lock:
+                    continue
+            db = self._connection()
+            db.execute("BEGIN")
+            try:
+                result = read(db)
+            finally:
+                db.execute("COMMIT")
+            with self._lock:
+                if self._generation != generation:
+                    continue
+                # Deltas inherited across a fork belong to the parent
+                unflushed = [self._flushing, self._pending] if self._flusher_pid == os.getpid() else []
+                return overlay(result, unflushed)
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                pass  # The batch is back in _pending; a dead flusher would lose every later write
+
+    def _migrate(self) -> None:
+        db = self._connection()
+        columns = [row[1] for row in db.execute("PRAGMA table_info(user_progress)")]
+        if columns and "seq" not in columns:
+            db.execute("ALTER TABLE user_progress ADD COLUMN seq INTEGER NOT NULL DEFAULT 1")
+        db.executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+
+def _copy_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(
+        row,
+        completed_lessons=list(row["completed_lessons"]),
+        achievements=list(row["achievements"]),
+        counters=dict(row["counters"]),
+        helped_peers=list(row["helped_peers"]),
+    )
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
+
+JSON_LINES_EXTENSIONS = (".jsonl", ".ndjson")
+READ_CHUNK_SIZE = 1 << 20
+
+
+def is_json_lines(path: str) -> bool:
+    return path.lower().endswith(JSON_LINES_EXTENSIONS)
+
+
+def iter_entries(path: str) -> Iterator[Dict[str, str]]:
+    """Yield cleaned Q&A entries from a JSON array or JSON Lines file without loading it whole."""
+    with open(path, "r", encoding="utf-8") as f:
+        items = _iter_json_lines(f) if is_json_lines(path) else _iter_json_array(f)
+        for item in items:
+            entry = clean_entry(item)
+            if entry is not None:
+                yield entry
+
+
+def clean_entry(item: Any) -> Optional[Dict[str, str]]:
+    if not isinstance(item, dict):
+        return None
+    q = (item.get("question") or "").strip()
+    a = (item.get("answer") or "").strip()
+    s = (item.get("subject") or "General").strip() or "General"
+    if q and a:
+        return {"question": q, "answer": a, "subject": s}
+    return None
+
+
+def write_entries(path: str, entries: Iterable[Dict[str, str]]) -> None:
+    """Atomically replace ``path`` with ``entries`` in the format implied by its extension."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(prefix=".qa_dataset-", suffix=".tmp", dir=directory)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        if is_json_lines(path):
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False))
+                f.write("\n")
+        else:
+            f.write("[")
+            for i, entry in enumerate(entries):
+                f.write(",\n  " if i else "\n  ")
+                f.write(json.dumps(entry, ensure_ascii=False))
+            f.write("\n]\n")
+    os.replace(tmp, path)
+
+
+@contextlib.contextmanager
+def dataset_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on the dataset at ``path``, shared by every process, via ``<path>.lock``."""
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _iter_json_lines(f: TextIO) -> Iterator[Any]:
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _iter_json_array(f: TextIO) -> Iterator[Any]:
+    # Decode one array element at a time from a sliding buffer
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ",")):
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of dataset: unterminated JSON array")
+            buf, pos = buf[pos:] + f.read(READ_CHUNK_SIZE), 0
+            eof = pos >= len(buf)
+            continue
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("Dataset must be a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        if _may_continue(item, buf, end) and not eof:
+            # A number may have been cut at the buffer edge ("12" of "12.5"); re-read before trusting it
+            chunk = f.read(READ_CHUNK_SIZE)
+            if chunk:
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            eof = True
+        yield item
+        pos = end
+        if pos > READ_CHUNK_SIZE:
+            buf, pos = buf[pos:], 0
+
+
+def _may_continue(item: Any, buf: str, end: int) -> bool:
+    # Strings, arrays and objects end on their closing character; only a number
+    # can be a prefix of a longer one, and then nothing delimits it yet
+    if end == len(buf):
+        return True
+    if isinstance(item, bool) or not isinstance(item, (int, float)):
+        return False
+    return not (buf[end].isspace() or buf[end] in ",]")
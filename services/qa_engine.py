@@ -1,12 +1,81 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
-from dataclasses import dataclass
-from typing import List, Dict, Any, Tuple
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Any, Iterable, Iterator, Mapping, Optional, Tuple, Union
 
+import numpy as np
+from scipy.sparse import csr_matrix, hstack, vstack
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from services.ann_index import IVFIndex
+from services.answer_cache import AnswerCache
+from services.qa_dataset import dataset_lock, iter_entries, write_entries
+from services.qa_index import load_grouped, load_index, save_grouped, save_index
+from services.qa_store import EntryStore
+from services.qa_vectorizer import HashingTfidfVectorizer
+
+_generations = itertools.count()
+
+Vectorizer = Union[TfidfVectorizer, HashingTfidfVectorizer]
+
+NO_ANSWER = "I could not find an answer."
+
+
+def _cosine(queries: csr_matrix, matrix: csr_matrix) -> csr_matrix:
+    # TfidfVectorizer rows are already L2-normalized, so cosine is a plain sparse
+    # product; sklearn's cosine_similarity would re-normalize (copy) the corpus per call.
+    # Keeping the corpus on the left avoids converting its transpose back to CSR.
+    return (matrix @ _narrow(queries, matrix.shape[1]).T).T.tocsr()
+
+
+def _narrow(queries: csr_matrix, width: int) -> csr_matrix:
+    # Terms added by upserts since the fit have no column in older matrices
+    return queries[:, :width] if queries.shape[1] > width else queries
+
+
+def _widen(matrix: csr_matrix, width: int) -> csr_matrix:
+    if matrix.shape[1] >= width:
+        return matrix
+    return csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], width), copy=False)
+
+
+def _dataset_version(path: str) -> Tuple[int, int, int]:
+    # write_entries replaces the file, so any rewrite changes at least the inode
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class _ExtendedVocabulary(Mapping):
+    """A fitted vocabulary plus terms first seen by upserts, numbered after it.
+
+    Only ``extra`` is copied when another upsert adds terms; the fitted
+    vocabulary is shared by every snapshot until the next compaction.
+    """
+
+    def __init__(self, base: Mapping, extra: Dict[str, int]) -> None:
+        self.base = base
+        self.extra = extra
+
+    def __getitem__(self, term: str) -> int:
+        index = self.extra.get(term)
+        return self.base[term] if index is None else index
+
+    def __contains__(self, term: object) -> bool:
+        return term in self.extra or term in self.base
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.base
+        yield from self.extra
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.extra)
 
 
 @dataclass
@@ -24,65 +93,663 @@ class AnswerResult:
     sources: List[Source]
 
 
+@dataclass
+class _Shard:
+    """Rows of the main matrix that share one subject code."""
+    code: int
+    rows: np.ndarray
+    matrix: csr_matrix
+
+
+def _top_candidates(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions, ascending, of every score at least the k-th largest.
+
+    Ties at the boundary are all kept (argpartition would pick among them
+    arbitrarily), so a stable sort of the result breaks them by position.
+    """
+    if k >= scores.shape[0]:
+        return np.arange(scores.shape[0])
+    kth = np.partition(scores, scores.shape[0] - k)[scores.shape[0] - k]
+    return np.flatnonzero(scores >= kth)
+
+
+def _key_hash(key: Tuple[str, str]) -> int:
+    # Stable across processes (unlike hash(), which is salted per interpreter) so it can be saved
+    digest = hashlib.blake2b(f"{key[0]}\0{key[1]}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+@dataclass
+class _KeyIndex:
+    """Row lookup by ``(lowercased subject, normalized question)``.
+
+    Main-segment keys are a sorted array of 64-bit hashes (16 bytes per entry
+    instead of a dict of tuples), saved with the index so workers load them
+    instead of rehashing every question; matches are verified against the
+    stored entry. Keys written since the last compaction live in ``delta``.
+    """
+    hashes: np.ndarray
+    rows: np.ndarray
+    delta: Dict[Tuple[str, str], int] = field(default_factory=dict)
+
+    def main_rows(self, key: Tuple[str, str]) -> np.ndarray:
+        h = _key_hash(key)
+        lo = np.searchsorted(self.hashes, h, side="left")
+        hi = np.searchsorted(self.hashes, h, side="right")
+        return self.rows[lo:hi]
+
+
+@dataclass
+class _Segments:
+    """Immutable snapshot of the searchable index.
+
+    Rows ``[0, len(entries))`` live in the fitted main matrix; later rows are
+    the delta segment appended by upserts. Writers build a new snapshot and
+    swap it in, so queries never wait on a write or a compaction.
+    """
+    vectorizer: Vectorizer
+    matrix: csr_matrix
+    entries: EntryStore
+    delta_entries: List[Dict[str, str]]
+    delta_matrix: Optional[csr_matrix]
+    subject_ids: Dict[str, int]
+    subject_codes: np.ndarray
+    dead: np.ndarray
+    ann: Optional[IVFIndex] = None
+    shards: Optional[List[_Shard]] = None
+    # Fresh on every snapshot (including replace()) so cached answers can be invalidated
+    generation: int = field(init=False, default_factory=lambda: next(_generations))
+
+    @property
+    def rows(self) -> int:
+        return len(self.entries) + len(self.delta_entries)
+
+    @property
+    def size(self) -> int:
+        return self.rows - len(self.dead)
+
+    def entry(self, row: int) -> Dict[str, str]:
+        main = len(self.entries)
+        return self.entries[row] if row < main else self.delta_entries[row - main]
+
+    def iter_live(self):
+        dead = set(self.dead.tolist())
+        for row in range(self.rows):
+            if row not in dead:
+                yield self.entry(row)
+
+
 class QAEngine:
-    def __init__(self, dataset_path: str) -> None:
+    def __init__(
+        self,
+        dataset_path: str,
+        index_dir: Optional[str] = None,
+        compact_threshold: int = 500,
+        cache_size: int = 4096,
+        cache_ttl: float = 300.0,
+        retrieval: str = "exact",
+        ann_probe: int = 8,
+        ann_shortlist: int = 200,
+        shard_workers: int = 0,
+        features: str = "tfidf",
+        hash_features: int = 2 ** 18,
+        compact_interval: Optional[float] = 60.0,
+        reload_interval: float = 1.0,
+    ) -> None:
+        if retrieval not in ("exact", "ann"):
+            raise ValueError(f"Unknown retrieval mode: {retrieval}")
+        if features not in ("tfidf", "hashing"):
+            raise ValueError(f"Unknown feature mode: {features}")
         self.dataset_path = dataset_path
-        self.entries: List[Dict[str, str]] = self._load_dataset(dataset_path)
-        self.size = len(self.entries)
-        corpus = [self._normalize(e["question"] + " \n " + e.get("answer", "")) for e in self.entries]
-        self.vectorizer = TfidfVectorizer(stop_words="english", ngram_range=(1, 2))
-        self.matrix = self.vectorizer.fit_transform(corpus)
+        self.index_dir = index_dir
+        self.compact_threshold = compact_threshold
+        self.compact_interval = compact_interval
+        self.reload_interval = reload_interval
+        self.cache = AnswerCache(max_size=cache_size, ttl=cache_ttl)
+        self.retrieval = retrieval
+        self.ann_probe = ann_probe
+        self.ann_shortlist = ann_shortlist
+        self.features = features
+        self.hash_features = hash_features
+        # Exact retrieval fans out over per-subject shards when a pool is configured
+        self._shard_pool: Optional[ThreadPoolExecutor] = None
+        if shard_workers > 0 and retrieval == "exact":
+            self._shard_pool = ThreadPoolExecutor(max_workers=shard_workers, thread_name_prefix="qa-shard")
+        self._lock = threading.Lock()
+        self._pending_ops: Optional[List[Tuple[str, Any]]] = None
+        # Writes since this process last read the dataset file, replayed onto it by the next compaction
+        self._journal: List[Tuple[str, Any]] = []
+        self._compactor: Optional[threading.Thread] = None
+        self._timer_pid: Optional[int] = None
+        self._next_reload_check = 0.0
+        self._ensure_dataset(dataset_path)
+
+        # Taken before reading, so a rewrite that races the load is picked up by the next check
+        self._dataset_version = _dataset_version(dataset_path)
+        entries, vectorizer, matrix, keys, index_path = self._load()
+        self._segments = self._prepare(entries, vectorizer, matrix, index_path)
+        self._keys = keys
+
+    @property
+    def size(self) -> int:
+        return self._segments.size
+
+    @property
+    def entries(self) -> EntryStore:
+        return self._segments.entries
+
+    @property
+    def vectorizer(self) -> Vectorizer:
+        return self._segments.vectorizer
+
+    @property
+    def matrix(self) -> csr_matrix:
+        return self._segments.matrix
+
+    def _fit(
+        self, source: Iterable[Dict[str, str]]
+    ) -> Tuple[EntryStore, Vectorizer, csr_matrix]:
+        """Fit over ``source``, keeping only the cleaned entries and the matrix.
 
-    def _load_dataset(self, path: str) -> List[Dict[str, str]]:
+        Documents are produced lazily from each entry as the vectorizer consumes
+        them, so no separate corpus list is built. ``features="hashing"`` also
+        avoids the vocabulary dict and fits chunk by chunk.
+        """
+        # Materialize entries before fitting: interleaving them with the
+        # vocabulary's growth fragments the heap and raises peak RSS
+        entries = EntryStore.from_entries(source)
+        if not len(entries):
+            raise ValueError("The Q&A dataset has no entries")
+        if self.features == "hashing":
+            vectorizer: Vectorizer = HashingTfidfVectorizer(n_features=self.hash_features)
+        else:
+            vectorizer = TfidfVectorizer(stop_words="english", ngram_range=(1, 2))
+        matrix = vectorizer.fit_transform(self._document(e) for e in entries)
+        return entries, vectorizer, matrix
+
+    def _load(self) -> Tuple[EntryStore, Vectorizer, csr_matrix, "_KeyIndex", Optional[str]]:
+        """Open the saved index for the current dataset file, or fit and save one."""
+        index = load_index(self.index_dir, self.dataset_path, self.features) if self.index_dir else None
+        if index is not None:
+            keys = _KeyIndex(hashes=index.key_hashes, rows=index.key_rows)
+            return index.entries, index.vectorizer, index.matrix, keys, index.path
+        entries, vectorizer, matrix = self._fit(iter_entries(self.dataset_path))
+        keys = self._build_keys(entries)
+        return entries, vectorizer, matrix, keys, self._save(entries, vectorizer, matrix, keys)
+
+    def _save(
+        self, entries: EntryStore, vectorizer: Vectorizer, matrix: csr_matrix, keys: "_KeyIndex"
+    ) -> Optional[str]:
+        if not self.index_dir:
+            return None
+        return save_index(self.index_dir, self.dataset_path, vectorizer, matrix, entries, keys.hashes, keys.rows)
+
+    def _extend_vocabulary(self, vectorizer: Vectorizer, document: str) -> Vectorizer:
+        """``vectorizer`` with columns for any terms of ``document`` it has not seen.
+
+        New terms get the idf of the rarest fitted term until the next
+        compaction refits. Hashed features need no vocabulary: unseen
+        columns already carry the highest idf.
+        """
+        if not isinstance(vectorizer, TfidfVectorizer):
+            return vectorizer
+        vocabulary = vectorizer.vocabulary_
+        new_terms = [t for t in dict.fromkeys(vectorizer.build_analyzer()(document)) if t not in vocabulary]
+        if not new_terms:
+            return vectorizer
+        if isinstance(vocabulary, _ExtendedVocabulary):
+            base, extra = vocabulary.base, dict(vocabulary.extra)
+        else:
+            base, extra = vocabulary, {}
+        for term in new_terms:
+            extra[term] = len(base) + len(extra)
+        # A fresh vectorizer, as older snapshots keep using the current one
+        extended = TfidfVectorizer(**vectorizer.get_params())
+        extended.vocabulary_ = _ExtendedVocabulary(base, extra)
+        idf = np.asarray(vectorizer.idf_)
+        extended.idf_ = np.concatenate([idf, np.full(len(new_terms), idf.max())])
+        return extended
+
+    def _build_ann(self, matrix: csr_matrix, index_path: Optional[str] = None) -> Optional[IVFIndex]:
+        """Fit the IVF index, or load the one saved under ``index_path`` by another worker."""
+        if self.retrieval != "ann" or matrix.shape[0] < 2:
+            return None
+        ann_path = os.path.join(index_path, "ann") if index_path else None
+        ann = IVFIndex.load(ann_path, self.ann_probe) if ann_path else None
+        if ann is None:
+            ann = IVFIndex(n_probe=self.ann_probe).fit(matrix)
+            if ann_path:
+                ann.save(ann_path)
+        return ann
+
+    def _document(self, entry: Dict[str, str]) -> str:
+        return self._normalize(entry["question"] + " \n " + entry.get("answer", ""))
+
+    def _build_keys(self, entries: EntryStore) -> _KeyIndex:
+        lowered = [name.lower() for name in entries.subject_names]
+        hashes = np.fromiter(
+            (_key_hash((lowered[sid], self._normalize(entries.question(i)))) for i, sid in enumerate(entries.subjects)),
+            dtype=np.int64,
+            count=len(entries),
+        )
+        order = np.argsort(hashes, kind="stable")
+        return _KeyIndex(hashes=hashes[order], rows=order)
+
+    def _prepare(
+        self,
+        entries: EntryStore,
+        vectorizer: Vectorizer,
+        matrix: csr_matrix,
+        index_path: Optional[str] = None,
+    ) -> _Segments:
+        # Intern lowercased subjects so the boost can be applied as a NumPy mask
+        subject_ids: Dict[str, int] = {}
+        lowered = [name.lower() for name in entries.subject_names]
+        name_codes = np.array([subject_ids.setdefault(name, len(subject_ids)) for name in lowered], dtype=np.int32)
+        codes = name_codes[entries.subjects] if len(entries) else np.empty(0, dtype=np.int32)
+
+        return _Segments(
+            vectorizer=vectorizer,
+            matrix=matrix,
+            entries=entries,
+            delta_entries=[],
+            delta_matrix=None,
+            subject_ids=subject_ids,
+            subject_codes=codes,
+            dead=np.empty(0, dtype=np.int64),
+            ann=self._build_ann(matrix, index_path),
+            shards=self._build_shards(matrix, codes, index_path),
+        )
+
+    def _build_shards(
+        self, matrix: csr_matrix, codes: np.ndarray, index_path: Optional[str] = None
+    ) -> Optional[List[_Shard]]:
+        """Split the matrix by subject, reusing the grouped copy saved under ``index_path``."""
+        if self._shard_pool is None or matrix.shape[0] == 0:
+            return None
+        # One row-permuted copy grouped by subject; each shard is a zero-copy CSR view of it.
+        # Saved next to the index, so workers mmap one copy instead of each building its own.
+        grouped_path = os.path.join(index_path, "grouped") if index_path else None
+        saved = load_grouped(grouped_path) if grouped_path else None
+        if saved is not None:
+            grouped, perm = saved
+        else:
+            perm = np.argsort(codes, kind="stable")
+            grouped = csr_matrix(matrix)[perm]
+            if grouped_path:
+                save_grouped(grouped_path, grouped, perm)
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(codes))])
+        shards: List[_Shard] = []
+        for code in range(len(bounds) - 1):
+            a, b = int(bounds[code]), int(bounds[code + 1])
+            if a == b:
+                continue
+            start, end = grouped.indptr[a], grouped.indptr[b]
+            # Assigned, not passed to the constructor: scipy copies a view much smaller than its base
+            view = csr_matrix((b - a, grouped.shape[1]), dtype=grouped.dtype)
+            view.data = grouped.data[start:end]
+            view.indices = grouped.indices[start:end]
+            view.indptr = grouped.indptr[a:b + 1] - start
+            shards.append(_Shard(code=code, rows=perm[a:b], matrix=view))
+        return shards
+
+    def _entry_key(self, entry: Dict[str, str]) -> Tuple[str, str]:
+        return (entry["subject"].lower(), self._normalize(entry["question"]))
+
+    def _find_rows(self, key: Tuple[str, str]) -> List[int]:
+        """Live rows currently stored under ``key``."""
+        segments = self._segments
+        dead = set(segments.dead.tolist())
+        rows = [
+            int(row) for row in self._keys.main_rows(key)
+            if row not in dead and self._entry_key(segments.entry(int(row))) == key
+        ]
+        delta_row = self._keys.delta.get(key)
+        if delta_row is not None and delta_row not in dead:
+            rows.append(delta_row)
+        return rows
+
+    def _ensure_dataset(self, path: str) -> None:
         if not os.path.exists(path):
             os.makedirs(os.path.dirname(path), exist_ok=True)
             with open(path, "w", encoding="utf-8") as f:
                 json.dump(self._default_dataset(), f, ensure_ascii=False, indent=2)
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        assert isinstance(data, list)
-        # Ensure required keys
-        cleaned: List[Dict[str, str]] = []
-        for item in data:
-            q = (item.get("question") or "").strip()
-            a = (item.get("answer") or "").strip()
-            s = (item.get("subject") or "General").strip() or "General"
-            if q and a:
-                cleaned.append({"question": q, "answer": a, "subject": s})
-        return cleaned
 
     def _normalize(self, text: str) -> str:
         return " ".join(text.lower().split())
 
+    def upsert(self, question: str, answer: str, subject: str = "General") -> Dict[str, str]:
+        """Add an entry, replacing any existing one with the same subject and question.
+
+        The new row is appended to the delta segment. Terms unseen at fit time
+        get new columns, so the entry can be found by them straight away;
+        the idf of every term is refreshed by the next compaction.
+        """
+        q = (question or "").strip()
+        a = (answer or "").strip()
+        s = (subject or "General").strip() or "General"
+        if not q or not a:
+            raise ValueError("Question and answer are required")
+        entry = {"question": q, "answer": a, "subject": s}
+        with self._lock:
+            self._apply_upsert(entry)
+            self._journal.append(("upsert", entry))
+            if self._pending_ops is not None:
+                self._pending_ops.append(("upsert", entry))
+        self._maybe_compact()
+        return entry
+
+    def delete(self, question: str, subject: str = "General") -> bool:
+        """Tombstone the entry with this subject and question. Returns False if absent.
+
+        Raises ``ValueError`` rather than delete the last entry, as an empty
+        dataset cannot be fitted.
+        """
+        key = ((subject or "General").strip().lower(), self._normalize(question or ""))
+        with self._lock:
+            rows = self._find_rows(key)
+            if rows and len(rows) >= self._segments.size:
+                raise ValueError("Cannot delete the last Q&A entry")
+            removed = self._apply_delete(key)
+            if removed:
+                self._journal.append(("delete", key))
+            if removed and self._pending_ops is not None:
+                self._pending_ops.append(("delete", key))
+        if removed:
+            self._maybe_compact()
+        return removed
+
+    def _apply_upsert(self, entry: Dict[str, str]) -> None:
+        segments = self._segments
+        key = self._entry_key(entry)
+        dead = segments.dead
+        old_rows = self._find_rows(key)
+        if old_rows:
+            dead = np.append(dead, old_rows)
+
+        document = self._document(entry)
+        vectorizer = self._extend_vocabulary(segments.vectorizer, document)
+        row_vec = vectorizer.transform([document])
+        if segments.delta_matrix is None:
+            delta_matrix = row_vec
+        else:
+            delta_matrix = vstack([_widen(segments.delta_matrix, row_vec.shape[1]), row_vec], format="csr")
+        # New subjects extend the shared id map; older snapshots never hold their codes
+        subject_ids = segments.subject_ids
+        code = subject_ids.setdefault(entry["subject"].lower(), len(subject_ids))
+        codes = np.append(segments.subject_codes, np.int32(code))
+
+        self._keys.delta[key] = segments.rows
+        self._segments = replace(
+            segments,
+            vectorizer=vectorizer,
+            delta_entries=segments.delta_entries + [entry],
+            delta_matrix=delta_matrix,
+            subject_codes=codes,
+            dead=dead,
+        )
+
+    def _apply_delete(self, key: Tuple[str, str]) -> bool:
+        rows = self._find_rows(key)
+        if not rows:
+            return False
+        self._keys.delta.pop(key, None)
+        segments = self._segments
+        self._segments = replace(segments, dead=np.append(segments.dead, rows))
+        return True
+
+    def _maybe_compact(self) -> None:
+        self._ensure_timer()
+        segments = self._segments
+        if len(segments.delta_entries) + len(segments.dead) >= self.compact_threshold:
+            self.compact(block=False)
+
+    def _ensure_timer(self) -> None:
+        # Writes below the threshold still reach the dataset file within compact_interval.
+        # Like the progress flusher, the timer thread does not survive a fork.
+        if self.compact_interval is None or self._timer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            self._timer_pid = os.getpid()
+            threading.Thread(target=self._compact_loop, name="qa-compact-timer", daemon=True).start()
+
+    def _compact_loop(self) -> None:
+        while True:
+            time.sleep(self.compact_interval)
+            with self._lock:
+                due = bool(self._journal)
+            if due:
+                self.compact()
+
+    def _maybe_reload(self) -> None:
+        """Pick up a dataset file rewritten by another process's compaction.
+
+        Checked at most once per ``reload_interval``; the reload is a
+        compaction, so this process's own unsaved writes are merged in.
+        """
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + self.reload_interval
+        try:
+            version = _dataset_version(self.dataset_path)
+        except OSError:
+            return
+        if version != self._dataset_version:
+            self.compact(block=False)
+
+    def compact(self, block: bool = True) -> None:
+        """Refit the vectorizer over live entries and fold the delta segment into the main matrix.
+
+        The refit runs without holding the write lock; writes that land in the
+        meantime are recorded and replayed onto the new snapshot before it is
+        swapped in. Other processes may have compacted their own writes into
+        the dataset file since this one read it, so the file is re-read under
+        a cross-process lock, this process's writes are replayed onto it and
+        the refit is over that merge. The merge is only written back once the
+        fit succeeds. With no writes to merge, or a merge that would leave no
+        entries, this reloads the current file instead.
+        """
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                thread = self._compactor
+            else:
+                thread = threading.Thread(target=self._compact, name="qa-compactor", daemon=True)
+                self._compactor = thread
+                thread.start()
+        if block:
+            thread.join()
+
+    def _compact(self) -> None:
+        with self._lock:
+            journal = list(self._journal)
+            self._pending_ops = []
+        try:
+            # Held through the save too, so the index is keyed by the file it was fitted from
+            with dataset_lock(self.dataset_path):
+                merged = EntryStore.from_entries(self._replay(iter_entries(self.dataset_path), journal))
+                if journal and len(merged):
+                    entries, vectorizer, matrix = self._fit(merged)
+                    write_entries(self.dataset_path, entries)
+                    version = _dataset_version(self.dataset_path)
+                    keys = self._build_keys(entries)
+                    index_path = self._save(entries, vectorizer, matrix, keys)
+                else:
+                    # Nothing to merge, or other processes deleted every entry this one
+                    # kept: its deletes are dropped, as delete() would have refused them
+                    version = _dataset_version(self.dataset_path)
+                    entries, vectorizer, matrix, keys, index_path = self._load()
+            segments = self._prepare(entries, vectorizer, matrix, index_path)
+            with self._lock:
+                pending, self._pending_ops = self._pending_ops, None
+                # Writes made during the refit are replayed below and stay journaled
+                del self._journal[:len(journal)]
+                self._segments, self._keys = segments, keys
+                self._dataset_version = version
+                for op, arg in pending:
+                    if op == "upsert":
+                        self._apply_upsert(arg)
+                    else:
+                        self._apply_delete(arg)
+            self.cache.clear()
+        finally:
+            with self._lock:
+                self._pending_ops = None
+
+    def _replay(
+        self, base: Iterable[Dict[str, str]], journal: List[Tuple[str, Any]]
+    ) -> Iterable[Dict[str, str]]:
+        """``base`` with the journaled upserts and deletes applied; the last write to a key wins."""
+        latest: Dict[Tuple[str, str], Optional[Dict[str, str]]] = {}
+        for op, arg in journal:
+            if op == "upsert":
+                latest[self._entry_key(arg)] = arg
+            else:
+                latest[arg] = None
+        for entry in base:
+            if self._entry_key(entry) not in latest:
+                yield entry
+        for entry in latest.values():
+            if entry is not None:
+                yield entry
+
+    def _candidates(
+        self, segments: _Segments, query_matrix: csr_matrix, k: int, subject: Optional[str] = None
+    ) -> List[Tuple[Optional[np.ndarray], np.ndarray]]:
+        """Score each query row, returning ``(rows, scores)`` pairs.
+
+        Exact retrieval scores every row (``rows`` is None). Sharded retrieval
+        keeps each subject shard's local top-k. ANN retrieval takes the IVF
+        shortlist from the main matrix, re-ranks it with exact sparse cosine,
+        and always scores the small delta segment exactly.
+        """
+        if segments.shards is not None:
+            return self._shard_candidates(segments, query_matrix, k, subject)
+        if segments.ann is None:
+            scores = _cosine(query_matrix, segments.matrix)
+            if segments.delta_matrix is not None:
+                delta = _cosine(query_matrix, segments.delta_matrix)
+                scores = hstack([scores, delta], format="csr")
+            scores = scores.tocsr()
+            return [(None, scores.getrow(i).toarray().ravel()) for i in range(scores.shape[0])]
+
+        main_rows = len(segments.entries)
+        delta_rows = np.arange(main_rows, segments.rows)
+        candidates: List[Tuple[Optional[np.ndarray], np.ndarray]] = []
+        for i in range(query_matrix.shape[0]):
+            q = query_matrix.getrow(i)
+            rows = segments.ann.search(_narrow(q, segments.matrix.shape[1]), self.ann_shortlist, self.ann_probe)
+            scores = _cosine(q, segments.matrix[rows]).toarray().ravel()
+            if segments.delta_matrix is not None:
+                delta = _cosine(q, segments.delta_matrix).toarray().ravel()
+                rows = np.concatenate([rows, delta_rows])
+                scores = np.concatenate([scores, delta])
+            candidates.append((rows, scores))
+        return candidates
+
+    def _shard_candidates(
+        self, segments: _Segments, query_matrix: csr_matrix, k: int, subject: Optional[str]
+    ) -> List[Tuple[Optional[np.ndarray], np.ndarray]]:
+        # The requested subject's shard is scored on this thread while the rest fan out
+        preferred = segments.subject_ids.get((subject or "").lower())
+        shards = sorted(segments.shards, key=lambda shard: shard.code != preferred)
+        futures = [
+            self._shard_pool.submit(self._shard_top, segments, shard, query_matrix, k)
+            for shard in shards[1:]
+        ]
+        parts = [self._shard_top(segments, shards[0], query_matrix, k)]
+        parts.extend(f.result() for f in futures)
+        if segments.delta_matrix is not None:
+            delta_rows = np.arange(len(segments.entries), segments.rows)
+            delta = _cosine(query_matrix, segments.delta_matrix).toarray()
+            parts.append([(delta_rows, delta[i]) for i in range(delta.shape[0])])
+
+        candidates: List[Tuple[Optional[np.ndarray], np.ndarray]] = []
+        for i in range(query_matrix.shape[0]):
+            rows = np.concatenate([part[i][0] for part in parts])
+            scores = np.concatenate([part[i][1] for part in parts])
+            # Merge in row order so ties still resolve by dataset position
+            order = np.argsort(rows, kind="stable")
+            candidates.append((rows[order], scores[order]))
+        return candidates
+
+    def _shard_top(
+        self, segments: _Segments, shard: _Shard, query_matrix: csr_matrix, k: int
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        # Every row in a shard gets the same boost, so the local top-k is boost-independent
+        scores = _cosine(query_matrix, shard.matrix)
+        dead = np.isin(shard.rows, segments.dead) if len(segments.dead) else None
+        top: List[Tuple[np.ndarray, np.ndarray]] = []
+        for i in range(scores.shape[0]):
+            row_scores = scores.getrow(i).toarray().ravel()
+            if dead is not None:
+                row_scores[dead] = -np.inf
+            keep = _top_candidates(row_scores, k)
+            top.append((shard.rows[keep], row_scores[keep]))
+        return top
+
     def answer(self, question: str, subject: str = "General", top_k: int = 3) -> AnswerResult:
+        self._maybe_reload()
+        segments = self._segments
         query = self._normalize(question)
-        query_vec = self.vectorizer.transform([query])
-        scores = cosine_similarity(query_vec, self.matrix).flatten()
-
-        # Filter by subject with a small boost
-        indices = list(range(len(self.entries)))
-        scored: List[Tuple[int, float]] = []
-        for i in indices:
-            entry = self.entries[i]
-            score = float(scores[i])
-            if entry["subject"].lower() == subject.lower():
-                score *= 1.08
-            scored.append((i, score))
-
-        scored.sort(key=lambda t: t[1], reverse=True)
-        top = scored[: max(3, top_k)]
+        key = (query, subject.lower(), top_k)
+        cached = self.cache.get(key, segments.generation)
+        if cached is not None:
+            return cached
+
+        query_vec = segments.vectorizer.transform([query])
+        rows, scores = self._candidates(segments, query_vec, max(3, top_k), subject)[0]
+        result = self._build_result(segments, scores, subject, top_k, rows)
+        self.cache.put(key, segments.generation, result)
+        return result
+
+    def answer_many(self, questions: List[str], subjects: List[str], top_k: int = 3) -> List[AnswerResult]:
+        """Answer a batch of questions with one transform and one sparse product."""
+        if len(questions) != len(subjects):
+            raise ValueError("questions and subjects must have the same length")
+        if not questions:
+            return []
+        self._maybe_reload()
+        segments = self._segments
+        queries = [self._normalize(q) for q in questions]
+        keys = [(q, s.lower(), top_k) for q, s in zip(queries, subjects)]
+        results: List[Optional[AnswerResult]] = [self.cache.get(k, segments.generation) for k in keys]
+        misses = [i for i, r in enumerate(results) if r is None]
+        if misses:
+            query_matrix = segments.vectorizer.transform([queries[i] for i in misses])
+            candidates = self._candidates(segments, query_matrix, max(3, top_k), subjects[misses[0]])
+            for i, (rows, scores) in zip(misses, candidates):
+                result = self._build_result(segments, scores, subjects[i], top_k, rows)
+                self.cache.put(keys[i], segments.generation, result)
+                results[i] = result
+        return results
+
+    def _build_result(
+        self,
+        segments: _Segments,
+        scores: np.ndarray,
+        subject: str,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+    ) -> AnswerResult:
+        top = self._rank(segments, scores, subject, max(3, top_k), rows)
+        if not top:
+            # Every row is tombstoned
+            return AnswerResult(answer=NO_ANSWER, subject=subject, confidence=0.0, sources=[])
 
         sources: List[Source] = [
             Source(
-                question=self.entries[i]["question"],
-                subject=self.entries[i]["subject"],
+                question=segments.entry(i)["question"],
+                subject=segments.entry(i)["subject"],
                 score=float(s),
             )
             for (i, s) in top
         ]
 
         best_idx, best_score = top[0]
-        best_entry = self.entries[best_idx]
+        best_entry = segments.entry(best_idx)
         answer_text = best_entry["answer"]
 
         # Calibrate a confidence from cosine similarity
@@ -95,6 +762,35 @@ class QAEngine:
             sources=sources,
         )
 
+    def _rank(
+        self,
+        segments: _Segments,
+        scores: np.ndarray,
+        subject: str,
+        k: int,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        # Small boost for entries in the requested subject
+        code = segments.subject_ids.get(subject.lower())
+        if code is not None:
+            codes = segments.subject_codes if rows is None else segments.subject_codes[rows]
+            scores = np.where(codes == code, scores * 1.08, scores)
+        if len(segments.dead):
+            scores = np.array(scores, dtype=np.float64)
+            if rows is None:
+                scores[segments.dead] = -np.inf
+            else:
+                scores[np.isin(rows, segments.dead)] = -np.inf
+
+        k = min(k, segments.size, scores.shape[0])
+        if k <= 0:
+            return []
+        candidates = _top_candidates(scores, k)
+        # Stable sort keeps dataset order among equal scores, then the boundary ties are cut
+        order = candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+        ids = order if rows is None else rows[order]
+        return [(int(r), float(scores[i])) for r, i in zip(ids, order) if scores[i] != -np.inf]
+
     def _default_dataset(self) -> List[Dict[str, str]]:
         return [
             {
@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Any, Iterator, Mapping, Optional, Tuple, Union
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from services.qa_store import EntryStore
+from services.qa_vectorizer import HashingTfidfVectorizer
+
+# Bump whenever the on-disk layout or the vectorizer settings change
+INDEX_FORMAT_VERSION = 5
+MANIFEST_NAME = "manifest.json"
+
+
+class MappedVocabulary(Mapping):
+    """Term to column lookup over the sorted term list saved with the index.
+
+    Terms are stored UTF-8 encoded back to back, ``offsets[i]:offsets[i + 1]``
+    delimiting term ``i``, and both arrays are memory-mapped, so workers share
+    the pages instead of each building a dict of every term. TfidfVectorizer
+    numbers its columns in sorted term order, so a term's column is its
+    position and a lookup is a binary search.
+    """
+
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray) -> None:
+        self._terms = memoryview(terms)
+        # A native-format view indexes to plain ints without creating NumPy scalars
+        self._offsets = memoryview(offsets).cast("B").cast("q")
+        self._size = len(offsets) - 1
+
+    @classmethod
+    def save(cls, path: str, vocabulary: Mapping) -> None:
+        terms = sorted(vocabulary, key=vocabulary.__getitem__)
+        encoded = [term.encode("utf-8") for term in terms]
+        if any(a >= b for a, b in zip(encoded, encoded[1:])):
+            raise ValueError("Vocabulary columns are not in sorted term order")
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+        np.save(os.path.join(path, "vocabulary_terms.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(os.path.join(path, "vocabulary_offsets.npy"), offsets)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "MappedVocabulary":
+        return cls(
+            np.load(os.path.join(path, "vocabulary_terms.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "vocabulary_offsets.npy"), mmap_mode=mmap_mode),
+        )
+
+    def _term(self, i: int) -> bytes:
+        return self._terms[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+    def __getitem__(self, term: str) -> int:
+        if not isinstance(term, str):
+            raise KeyError(term)
+        key = term.encode("utf-8")
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._size and self._term(lo) == key:
+            return lo
+        raise KeyError(term)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._size):
+            yield self._term(i).decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._size
+
+
+@dataclass
+class QAIndex:
+    vectorizer: Union[TfidfVectorizer, HashingTfidfVectorizer]
+    matrix: csr_matrix
+    entries: EntryStore
+    dataset_hash: str
+    path: str
+    # Sorted stable key hashes and the entry row for each, see qa_engine._KeyIndex
+    key_hashes: np.ndarray
+    key_rows: np.ndarray
+
+
+def dataset_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def current_dataset_hash(index_dir: str, dataset_path: str) -> str:
+    """Return the dataset hash, trusting the manifest when size and mtime still match."""
+    stat = os.stat(dataset_path)
+    manifest = _read_json(os.path.join(index_dir, MANIFEST_NAME))
+    if manifest and manifest.get("size") == stat.st_size and manifest.get("mtime_ns") == stat.st_mtime_ns:
+        return manifest["dataset_hash"]
+    return dataset_hash(dataset_path)
+
+
+def load_index(index_dir: str, dataset_path: str, kind: str = "tfidf") -> Optional[QAIndex]:
+    """Load a previously saved index for the dataset, or None if missing or stale.
+
+    The CSR arrays, entry columns and vocabulary are opened with
+    ``mmap_mode="r"`` so every worker shares the same pages through the OS
+    cache instead of holding a private copy.
+    """
+    digest = current_dataset_hash(index_dir, dataset_path)
+    path = _index_path(index_dir, digest, kind)
+    meta = _read_json(os.path.join(path, "meta.json"))
+    if not meta or meta.get("version") != INDEX_FORMAT_VERSION or meta.get("dataset_hash") != digest:
+        return None
+
+    params = dict(meta["vectorizer"])
+    params["ngram_range"] = tuple(params["ngram_range"])
+    params.pop("kind", None)
+    if kind == "hashing":
+        vectorizer = HashingTfidfVectorizer(**params)
+    else:
+        vectorizer = TfidfVectorizer(**params)
+        vectorizer.vocabulary_ = MappedVocabulary.load(path)
+    vectorizer.idf_ = np.load(os.path.join(path, "idf.npy"))
+
+    data = np.load(os.path.join(path, "data.npy"), mmap_mode="r")
+    indices = np.load(os.path.join(path, "indices.npy"), mmap_mode="r")
+    indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode="r")
+    matrix = csr_matrix((data, indices, indptr), shape=tuple(meta["shape"]), copy=False)
+    entries = EntryStore.load(path, mmap_mode="r")
+    key_hashes = np.load(os.path.join(path, "key_hashes.npy"), mmap_mode="r")
+    key_rows = np.load(os.path.join(path, "key_rows.npy"), mmap_mode="r")
+
+    _write_manifest(index_dir, dataset_path, digest)
+    return QAIndex(
+        vectorizer=vectorizer,
+        matrix=matrix,
+        entries=entries,
+        dataset_hash=digest,
+        path=path,
+        key_hashes=key_hashes,
+        key_rows=key_rows,
+    )
+
+
+def save_index(
+    index_dir: str,
+    dataset_path: str,
+    vectorizer: Union[TfidfVectorizer, HashingTfidfVectorizer],
+    matrix: csr_matrix,
+    entries: EntryStore,
+    key_hashes: np.ndarray,
+    key_rows: np.ndarray,
+    digest: Optional[str] = None,
+) -> str:
+    """Persist a fitted vectorizer, matrix and key index under ``index_dir/<dataset hash>-<kind>``."""
+    digest = digest or dataset_hash(dataset_path)
+    kind = "hashing" if isinstance(vectorizer, HashingTfidfVectorizer) else "tfidf"
+    os.makedirs(index_dir, exist_ok=True)
+    final_path = _index_path(index_dir, digest, kind)
+
+    if not os.path.exists(os.path.join(final_path, "meta.json")):
+        # Build in a scratch directory and rename so readers never see a partial index
+        tmp_path = tempfile.mkdtemp(prefix=".build-", dir=index_dir)
+        try:
+            matrix = csr_matrix(matrix)
+            params: Dict[str, Any] = {
+                "kind": kind,
+                "stop_words": vectorizer.stop_words,
+                "ngram_range": list(vectorizer.ngram_range),
+            }
+            if kind == "hashing":
+                params["n_features"] = vectorizer.n_features
+            else:
+                MappedVocabulary.save(tmp_path, vectorizer.vocabulary_)
+            entries.save(tmp_path)
+            np.save(os.path.join(tmp_path, "idf.npy"), np.asarray(vectorizer.idf_))
+            np.save(os.path.join(tmp_path, "data.npy"), matrix.data)
+            np.save(os.path.join(tmp_path, "indices.npy"), matrix.indices)
+            np.save(os.path.join(tmp_path, "indptr.npy"), matrix.indptr)
+            np.save(os.path.join(tmp_path, "key_hashes.npy"), key_hashes)
+            np.save(os.path.join(tmp_path, "key_rows.npy"), key_rows)
+            with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": INDEX_FORMAT_VERSION,
+                    "dataset_hash": digest,
+                    "shape": list(matrix.shape),
+                    "vectorizer": params,
+                }, f)
+            try:
+                os.rename(tmp_path, final_path)
+            except OSError:
+                # Another worker won the race; keep its copy
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    _write_manifest(index_dir, dataset_path, digest)
+    _prune(index_dir, digest)
+    return final_path
+
+
+def save_grouped(path: str, matrix: csr_matrix, perm: np.ndarray) -> None:
+    """Write a row-permuted copy of an index matrix and its permutation to the directory ``path``.
+
+    Atomic like ``save_index``; an existing copy is kept.
+    """
+    parent = os.path.dirname(path) or "."
+    tmp_path = tempfile.mkdtemp(prefix=".grouped-", dir=parent)
+    try:
+        np.save(os.path.join(tmp_path, "perm.npy"), perm)
+        np.save(os.path.join(tmp_path, "data.npy"), matrix.data)
+        np.save(os.path.join(tmp_path, "indices.npy"), matrix.indices)
+        np.save(os.path.join(tmp_path, "indptr.npy"), matrix.indptr)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"shape": list(matrix.shape)}, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def load_grouped(path: str, mmap_mode: Optional[str] = "r") -> Optional[Tuple[csr_matrix, np.ndarray]]:
+    """Memory-map a matrix saved by ``save_grouped`` and its permutation, or None if there is none."""
+    meta = _read_json(os.path.join(path, "meta.json"))
+    if not meta:
+        return None
+    data = np.load(os.path.join(path, "data.npy"), mmap_mode=mmap_mode)
+    indices = np.load(os.path.join(path, "indices.npy"), mmap_mode=mmap_mode)
+    indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode=mmap_mode)
+    matrix = csr_matrix((data, indices, indptr), shape=tuple(meta["shape"]), copy=False)
+    return matrix, np.load(os.path.join(path, "perm.npy"), mmap_mode=mmap_mode)
+
+
+def _prune(index_dir: str, digest: str) -> None:
+    # Indexes for older datasets are dead weight once the manifest points past them.
+    # Workers still serving one keep their mmapped pages after the files are unlinked.
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name.startswith(".") or name.startswith(f"{digest}-") or not os.path.isdir(path):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _index_path(index_dir: str, digest: str, kind: str) -> str:
+    return os.path.join(index_dir, f"{digest}-{kind}")
+
+
+def _write_manifest(index_dir: str, dataset_path: str, digest: str) -> None:
+    stat = os.stat(dataset_path)
+    manifest = {"dataset_hash": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if _read_json(os.path.join(index_dir, MANIFEST_NAME)) == manifest:
+        return
+    fd, tmp = tempfile.mkstemp(prefix=".manifest-", dir=index_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(index_dir, MANIFEST_NAME))
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import json
+import os
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+
+class EntryStore:
+    """Columnar storage for Q&A entries.
+
+    Question and answer text live in one UTF-8 byte buffer indexed by an
+    offsets array (entry ``i`` owns ``offsets[2i:2i+3]``), and subjects are
+    interned ids into ``subject_names``. Indexing returns the same
+    ``{"question", "answer", "subject"}`` dicts as a list of entries would,
+    built on demand, so per-entry overhead is a few bytes instead of three
+    dicts' worth of Python objects. Arrays may be memory-mapped.
+    """
+
+    def __init__(
+        self,
+        text: np.ndarray,
+        offsets: np.ndarray,
+        subjects: np.ndarray,
+        subject_names: List[str],
+    ) -> None:
+        self.text = text
+        self.offsets = offsets
+        self.subjects = subjects
+        self.subject_names = subject_names
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict[str, str]]) -> "EntryStore":
+        text = bytearray()
+        offsets = array("q", [0])
+        subjects = array("i")
+        names: Dict[str, int] = {}
+        for entry in entries:
+            text += entry["question"].encode("utf-8")
+            offsets.append(len(text))
+            text += entry["answer"].encode("utf-8")
+            offsets.append(len(text))
+            subjects.append(names.setdefault(entry["subject"], len(names)))
+        return cls(
+            text=np.frombuffer(text, dtype=np.uint8),
+            offsets=np.frombuffer(offsets, dtype=np.int64),
+            subjects=np.frombuffer(subjects, dtype=np.int32),
+            subject_names=list(names),
+        )
+
+    def __len__(self) -> int:
+        return len(self.subjects)
+
+    def __getitem__(self, i: int) -> Dict[str, str]:
+        i = self._check(i)
+        return {"question": self.question(i), "answer": self.answer(i), "subject": self.subject(i)}
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def question(self, i: int) -> str:
+        return self._decode(self.offsets[2 * i], self.offsets[2 * i + 1])
+
+    def answer(self, i: int) -> str:
+        return self._decode(self.offsets[2 * i + 1], self.offsets[2 * i + 2])
+
+    def subject(self, i: int) -> str:
+        return self.subject_names[self.subjects[i]]
+
+    def save(self, path: str) -> None:
+        np.save(os.path.join(path, "entries_text.npy"), self.text)
+        np.save(os.path.join(path, "entries_offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "entries_subjects.npy"), self.subjects)
+        with open(os.path.join(path, "subjects.json"), "w", encoding="utf-8") as f:
+            json.dump(self.subject_names, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "EntryStore":
+        with open(os.path.join(path, "subjects.json"), "r", encoding="utf-8") as f:
+            subject_names: List[str] = json.load(f)
+        return cls(
+            text=np.load(os.path.join(path, "entries_text.npy"), mmap_mode=mmap_mode),
+            offsets=np.load(os.path.join(path, "entries_offsets.npy"), mmap_mode=mmap_mode),
+            subjects=np.load(os.path.join(path, "entries_subjects.npy"), mmap_mode=mmap_mode),
+            subject_names=subject_names,
+        )
+
+    def _check(self, i: int) -> int:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("entry index out of range")
+        return i
+
+    def _decode(self, start: int, end: int) -> str:
+        return self.text[start:end].tobytes().decode("utf-8")
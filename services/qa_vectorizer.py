@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+
+class HashingTfidfVectorizer:
+    """TF-IDF over hashed features, fitted in one streaming pass.
+
+    Unlike ``TfidfVectorizer`` there is no vocabulary to build, so documents
+    are hashed chunk by chunk and only document frequencies are accumulated;
+    the corpus never has to be held as a list of strings. Output rows are
+    L2-normalized with smoothed idf weights, matching ``TfidfVectorizer``.
+    """
+
+    def __init__(
+        self,
+        n_features: int = 2 ** 18,
+        stop_words: Optional[str] = "english",
+        ngram_range: Tuple[int, int] = (1, 2),
+        chunk_size: int = 10000,
+    ) -> None:
+        self.n_features = n_features
+        self.stop_words = stop_words
+        self.ngram_range = ngram_range
+        self.chunk_size = chunk_size
+        self.hasher = HashingVectorizer(
+            n_features=n_features,
+            stop_words=stop_words,
+            ngram_range=ngram_range,
+            alternate_sign=False,
+            norm=None,
+        )
+        self.idf_: Optional[np.ndarray] = None
+
+    def fit_transform(self, documents: Iterable[str]) -> csr_matrix:
+        chunks: List[csr_matrix] = []
+        df = np.zeros(self.n_features, dtype=np.int64)
+        n_docs = 0
+        iterator = iter(documents)
+        while True:
+            batch = list(islice(iterator, self.chunk_size))
+            if not batch:
+                break
+            counts = self.hasher.transform(batch)
+            df += np.bincount(counts.indices, minlength=self.n_features)
+            n_docs += counts.shape[0]
+            chunks.append(counts)
+
+        self.idf_ = np.log((1 + n_docs) / (1 + df)) + 1.0
+        matrix = vstack(chunks, format="csr") if chunks else csr_matrix((0, self.n_features))
+        return self._weight(matrix)
+
+    def transform(self, documents: Iterable[str]) -> csr_matrix:
+        if self.idf_ is None:
+            raise ValueError("HashingTfidfVectorizer is not fitted")
+        return self._weight(self.hasher.transform(documents))
+
+    def _weight(self, counts: csr_matrix) -> csr_matrix:
+        counts = csr_matrix(counts, dtype=np.float64)
+        counts.data *= self.idf_[counts.indices]
+        return normalize(counts, copy=False)
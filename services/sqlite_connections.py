@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+
+
+class LocalConnections:
+    """One SQLite connection per thread and process for the database at ``path``.
+
+    Connections are opened in autocommit mode (callers issue their own
+    ``BEGIN``) with WAL journaling, so readers in other processes never
+    block on a writer. A connection must not cross a fork, so a child
+    process opens its own on first use.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
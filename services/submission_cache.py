@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import threading
+import tokenize
+from dataclasses import asdict, fields
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from services.answer_cache import AnswerCache
+
+# Statuses that depend on machine load or scheduling rather than on the code itself
+UNCACHEABLE_STATUSES = {"timeout", "skipped"}
+
+
+def normalize_source(code: str, language: str) -> str:
+    """Canonical form of ``code`` that ignores comments and insignificant whitespace."""
+    if language == "python":
+        try:
+            return _normalize_python(code)
+        except (tokenize.TokenError, IndentationError, SyntaxError):
+            pass
+    # Other languages (and Python that does not tokenize): drop blank lines and trailing spaces
+    lines = (line.rstrip() for line in code.replace("\r\n", "\n").split("\n"))
+    return "\n".join(line for line in lines if line.strip())
+
+
+def _normalize_python(code: str) -> str:
+    parts = []
+    for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+        if tok.type in (tokenize.COMMENT, tokenize.NL):
+            continue
+        if tok.type == tokenize.INDENT:
+            # Only the nesting matters, not how wide each level is
+            parts.append("<indent>")
+        elif tok.type in (tokenize.NEWLINE, tokenize.DEDENT, tokenize.ENDMARKER):
+            parts.append(tokenize.tok_name[tok.type])
+        else:
+            parts.append(tok.string)
+    return "\x00".join(parts)
+
+
+def challenge_version(challenge: Any) -> str:
+    """Hash of a challenge definition; changes whenever its tests or limits change."""
+    definition = {f.name: getattr(challenge, f.name) for f in fields(challenge) if f.name != "test_cases"}
+    tests = []
+    for test_case in challenge.test_cases:
+        item = asdict(test_case)
+        # File-based cases: fingerprint the data files without reading them
+        for key in ("input_file", "expected_file"):
+            if item.get(key):
+                stat = os.stat(item[key])
+                item[key] = [item[key], stat.st_size, stat.st_mtime_ns]
+        tests.append(item)
+    payload = json.dumps([definition, tests], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class SubmissionCache:
+    """Content-addressed cache of grading results.
+
+    Keys combine the challenge id, its definition version, the language and a
+    hash of the normalized source, so resubmitting the same code (modulo
+    comments and whitespace) returns the stored result. Identical submissions
+    that arrive while the first is still grading wait for it instead of
+    running again. Results containing a timeout or skipped case are not stored.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0) -> None:
+        self._cache = AnswerCache(max_size=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, threading.Event] = {}
+
+    def key(self, challenge_id: str, version: str, language: str, code: str) -> Tuple[str, str, str, str]:
+        digest = hashlib.sha256(normalize_source(code, language).encode("utf-8")).hexdigest()
+        return (challenge_id, version, language, digest)
+
+    def get_or_run(self, key: Hashable, run: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        while True:
+            cached = self._cache.get(key, 0)
+            if cached is not None:
+                return dict(cached, cached=True)
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    break
+            # Someone is grading the same submission; wait, then re-check the cache
+            event.wait()
+
+        try:
+            result = run()
+            if self._cacheable(result):
+                self._cache.put(key, 0, result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+    @staticmethod
+    def _cacheable(result: Dict[str, Any]) -> bool:
+        if "error" in result:
+            return False
+        return not any(r.get("status") in UNCACHEABLE_STATUSES for r in result.get("results", []))
@@ -0,0 +1,195 @@
+"""Randomized checks of the streaming OutputChecker against whole-output comparisons."""
+from __future__ import annotations
+
+import io
+import random
+import time
+from typing import List
+
+import pytest
+
+from services import grader_worker
+from services.grader_worker import OutputChecker, OutputMismatch
+
+TOLERANCE = 1e-6
+
+
+def _reference(actual: str, expected: str, comparator: str) -> bool:
+    if comparator == "exact":
+        # Lines match ignoring trailing whitespace; trailing blank lines don't count
+        def lines(text: str) -> List[str]:
+            stripped = [line.rstrip() for line in text.split("\n")]
+            while stripped and not stripped[-1]:
+                stripped.pop()
+            return stripped
+        return lines(actual) == lines(expected)
+    a, e = actual.split(), expected.split()
+    if comparator == "tokens":
+        return a == e
+    if len(a) != len(e):
+        return False
+    for x, y in zip(a, e):
+        if x == y:
+            continue
+        try:
+            fx, fy = float(x), float(y)
+        except ValueError:
+            return False
+        if abs(fx - fy) > TOLERANCE * max(1.0, abs(fy)):
+            return False
+    return True
+
+
+def _random_output(rng: random.Random) -> str:
+    tokens = []
+    for _ in range(rng.randrange(12)):
+        kind = rng.random()
+        if kind < 0.4:
+            tokens.append(str(rng.randrange(-20, 20)))
+        elif kind < 0.7:
+            tokens.append(f"{rng.uniform(-5, 5):.{rng.randrange(1, 9)}f}")
+        else:
+            tokens.append(rng.choice(["a", "b", "ab", "-", "."]))
+        tokens.append(rng.choice([" ", " ", "  ", "\t", "\n", "\n", "\n\n", " \n", "\r\n"]))
+    return "".join(tokens)
+
+
+def _mutate(rng: random.Random, text: str) -> str:
+    # Near-misses: identical, reformatted numbers, whitespace changes or a small edit
+    choice = rng.randrange(6)
+    if choice == 0 or not text:
+        return text
+    if choice == 1:
+        return text + rng.choice(["\n", "\n\n", " ", "x", "\n1"])
+    if choice == 2:
+        return text.replace(" ", "  ").replace("\n", " \n")
+    if choice == 3:
+        return " ".join(text.split())
+    if choice == 4:
+        out = []
+        for token in text.split(" "):
+            try:
+                out.append(repr(float(token) + rng.choice([0.0, 1e-9, 1e-3])))
+            except ValueError:
+                out.append(token)
+        return " ".join(out)
+    i = rng.randrange(len(text))
+    return text[:i] + rng.choice(["0", "a", " ", "\n", ""]) + text[i + 1:]
+
+
+def _stream(checker: OutputChecker, rng: random.Random, text: str) -> None:
+    pos = 0
+    while pos < len(text):
+        end = pos + rng.randrange(1, 6)
+        checker.write(text[pos:end])
+        pos = end
+
+
+@pytest.mark.parametrize("comparator", grader_worker.COMPARATORS)
+@pytest.mark.parametrize("seed", range(60))
+def test_output_checker_matches_reference(comparator: str, seed: int, monkeypatch: pytest.MonkeyPatch) -> None:
+    rng = random.Random(seed)
+    # A tiny read size makes expected tokens straddle chunk boundaries
+    monkeypatch.setattr(grader_worker, "READ_CHUNK_SIZE", rng.choice([1, 2, 5, 64]))
+    expected = _random_output(rng)
+    actual = _mutate(rng, expected) if rng.random() < 0.8 else _random_output(rng)
+
+    checker = OutputChecker(io.StringIO(expected), comparator, TOLERANCE)
+    try:
+        _stream(checker, rng, actual)
+    except OutputMismatch:
+        pass
+    mismatch = checker.finish()
+
+    assert (mismatch is None) == _reference(actual, expected, comparator), (actual, expected, mismatch)
+
+
+def test_output_checker_keeps_raising_after_a_mismatch() -> None:
+    checker = OutputChecker(io.StringIO("1\n2\n"))
+    with pytest.raises(OutputMismatch):
+        checker.write("3\n")
+    with pytest.raises(OutputMismatch):
+        checker.write("2\n")
+    assert checker.finish() is not None
+
+
+# End to end: the shipped sum_numbers challenge through CodingChallenges, with and without a warm pool
+
+SUM_NUMBERS = "import sys\nd = sys.stdin.read().split()\nprint(sum(map(float, d[1:])))\nrun_{n} = {n}\n"
+
+
+@pytest.fixture(params=[0, 2], ids=["once", "pool"], scope="module")
+def challenges(request: pytest.FixtureRequest):
+    from services.coding_challenges import CodingChallenges
+
+    engine = CodingChallenges(pool_size=request.param)
+    yield engine
+    if engine.grader_pool is not None:
+        engine.grader_pool.close()
+
+
+def test_sum_numbers_is_graded_consistently(challenges) -> None:
+    # Each case's output must be judged against its own expected file, however reads interleave
+    for n in range(30):
+        result = challenges.run_test("sum_numbers", SUM_NUMBERS.format(n=n))
+        assert result["score"] == 100, result
+
+
+def test_constant_output_fails_every_case_on_its_own_line(challenges) -> None:
+    result = challenges.run_test("sum_numbers", "print(42)")
+    assert [case["status"] for case in result["results"]] == ["failed"] * 3
+    for case in result["results"]:
+        assert "got '42'" in case["output"], case
+
+
+def test_endless_output_fails_at_the_first_mismatch(challenges) -> None:
+    started = time.monotonic()
+    result = challenges.run_test("sum_numbers", "while True:\n    print('1' * 1000)\n")
+    assert [case["status"] for case in result["results"]] == ["failed"] * 3
+    # Well under the 5 s time limit of a single case
+    assert time.monotonic() - started < 3
+
+
+def _file_case(tmp_path, name: str, stdin: str, expected: str) -> dict:
+    (tmp_path / f"{name}.in").write_text(stdin)
+    (tmp_path / f"{name}.out").write_text(expected)
+    return {"input_file": str(tmp_path / f"{name}.in"), "expected_file": str(tmp_path / f"{name}.out")}
+
+
+@pytest.mark.parametrize("parallel", [1, 2, 3])
+def test_run_forked_mixes_function_and_file_cases(tmp_path, parallel: int) -> None:
+    code = (
+        "import os, sys\n"
+        "def double(s):\n    return int(s) * 2\n"
+        "if __name__ == '__main__' and not sys.stdin.isatty():\n"
+        "    data = sys.stdin.read()\n"
+        "    if data:\n"
+        "        sys.stdout.buffer.write(data.upper().encode())\n"
+        "        sys.stdout.flush()\n"
+        "        os.write(1, b'!\\n')\n"
+    )
+    inputs = [
+        "1",
+        _file_case(tmp_path, "a", "abc\n", "ABC\n!\n"),
+        "2",
+        _file_case(tmp_path, "b", "xy\n", "XY\n!\n"),
+        _file_case(tmp_path, "c", "q\n", "wrong\n"),
+        "3",
+    ]
+    reply = grader_worker._run_forked(
+        {"code": code, "function": "double", "inputs": inputs, "time_limit": 2, "parallel": parallel}
+    )
+    results = reply["results"]
+    assert [r.get("output") for r in (results[0], results[2], results[5])] == ["2", "4", "6"]
+    assert [r.get("passed") for r in (results[1], results[3], results[4])] == [True, True, False]
+
+
+def test_run_forked_fail_fast_skips_the_rest(tmp_path) -> None:
+    inputs = [_file_case(tmp_path, str(i), "", "expected\n") for i in range(4)]
+    reply = grader_worker._run_forked({
+        "code": "print('nope')", "function": "main", "inputs": inputs, "time_limit": 2,
+        "fail_fast": True, "expected": [None] * len(inputs),
+    })
+    statuses = [r["status"] for r in reply["results"]]
+    assert reply["results"][0]["passed"] is False
+    assert statuses[1:] == ["skipped"] * 3
@@ -0,0 +1,89 @@
+"""GradingQueue with and without the shared SQLite job store."""
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from services.grading_queue import GradingQueue, QueueFull, SQLiteJobStore
+
+
+def _blocking_grader():
+    release = threading.Event()
+
+    def grade(value):
+        release.wait(10)
+        return {"score": value}
+
+    return grade, release
+
+
+def test_job_is_visible_from_another_process_store(tmp_path) -> None:
+    path = str(tmp_path / "jobs.db")
+    grade, release = _blocking_grader()
+    # Two queues over separate connections to one file stand in for two gunicorn workers
+    owner = GradingQueue(grade, workers=1, store=SQLiteJobStore(path), poll_interval=0.01)
+    other = GradingQueue(grade, workers=1, store=SQLiteJobStore(path), poll_interval=0.01)
+
+    job = owner.submit(7)
+    seen = other.wait(job.id, 0.05)
+    assert seen is not None and seen.status in ("queued", "running")
+
+    release.set()
+    finished = other.wait(job.id, 5)
+    assert finished.status == "done"
+    assert finished.result == {"score": 7}
+    assert finished.to_dict() == owner.wait(job.id, 5).to_dict()
+    assert other.get("unknown") is None
+
+
+def test_queue_rejects_jobs_beyond_max_pending() -> None:
+    grade, release = _blocking_grader()
+    queue = GradingQueue(grade, workers=1, max_pending=2)
+    jobs = [queue.submit(1), queue.submit(2)]
+    with pytest.raises(QueueFull):
+        queue.submit(3)
+    release.set()
+    assert [queue.wait(job.id, 5).result for job in jobs] == [{"score": 1}, {"score": 2}]
+    queue.submit(4)
+
+
+def test_grader_exception_is_reported_as_a_result() -> None:
+    def grade():
+        raise RuntimeError("boom")
+
+    queue = GradingQueue(grade, workers=1)
+    job = queue.wait(queue.submit().id, 5)
+    assert job.status == "done"
+    assert job.result == {"error": "Execution error: boom"}
+
+
+def test_expired_jobs_are_pruned_from_the_store(tmp_path) -> None:
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    queue = GradingQueue(lambda: {}, workers=1, result_ttl=0, store=store)
+    job = queue.wait(queue.submit().id, 5)
+    assert store.load(job.id) is not None
+    queue.submit()
+    assert store.load(job.id) is None
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROGRESS_DB", str(tmp_path / "progress.db"))
+    monkeypatch.setenv("QA_INDEX_DIR", str(tmp_path / "qa_index"))
+    from app import create_app
+
+    return create_app().test_client()
+
+
+def test_submit_validates_challenge_before_queueing(client) -> None:
+    response = client.post("/api/submit-challenge", json={"challenge_id": "nope", "code": "x"})
+    assert response.status_code == 404
+    response = client.post("/api/submit-challenge", json={
+        "challenge_id": "reverse_string", "code": "x", "language": "cobol"})
+    assert response.status_code == 400
+    response = client.post("/api/submit-challenge", json={
+        "challenge_id": "reverse_string", "code": "def reverse_string(s):\n    return s[::-1]\n"})
+    assert response.status_code == 202
+    job = client.get(f"/api/submit-challenge/{response.get_json()['job_id']}?wait=10").get_json()
+    assert job["status"] == "done" and job["result"]["score"] == 100
@@ -0,0 +1,78 @@
+"""Randomized checks of RankedSet and Leaderboard against a sorted-list reference."""
+from __future__ import annotations
+
+import bisect
+import random
+
+import pytest
+
+from services.leaderboard import Leaderboard, RankedSet
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_ranked_set_matches_sorted_list(seed: int) -> None:
+    rng = random.Random(seed)
+    start = sorted(rng.sample(range(1000), rng.randrange(50)))
+    ranked = RankedSet.from_sorted(start) if seed % 2 else RankedSet()
+    reference = list(start) if seed % 2 else []
+
+    for _ in range(2000):
+        key = rng.randrange(1000)
+        op = rng.random()
+        if op < 0.45:
+            if key not in reference:
+                bisect.insort(reference, key)
+                ranked.insert(key)
+        elif op < 0.8:
+            removed = key in reference
+            if removed:
+                reference.remove(key)
+            assert ranked.remove(key) is removed
+        elif op < 0.9:
+            expected = reference.index(key) if key in reference else None
+            assert ranked.index(key) == expected
+        else:
+            start_pos = rng.randrange(-5, len(reference) + 5)
+            stop_pos = start_pos + rng.randrange(0, 20)
+            assert ranked.slice(start_pos, stop_pos) == reference[max(0, start_pos):max(0, stop_pos)]
+        assert len(ranked) == len(reference)
+
+    assert ranked.slice(0, len(reference)) == reference
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_leaderboard_matches_full_sort(seed: int) -> None:
+    rng = random.Random(seed)
+    board = Leaderboard()
+    points = {}
+    users = [f"user_{i}" for i in range(60)]
+
+    for step in range(1500):
+        user = rng.choice(users)
+        op = rng.random()
+        if op < 0.5:
+            value = rng.randrange(0, 50)
+            board.add(user, value)
+            points[user] = points.get(user, 0) + value
+        elif op < 0.7:
+            value = rng.randrange(0, 200)
+            board.update(user, value)
+            points[user] = value
+        elif op < 0.8:
+            board.remove(user)
+            points.pop(user, None)
+        elif op < 0.82:
+            board.reset(points)
+
+        # Ties are ordered by user id
+        ordered = sorted(points.items(), key=lambda item: (-item[1], item[0]))
+        expected = [(rank, user_id, p) for rank, (user_id, p) in enumerate(ordered, 1)]
+        if step % 25 == 0:
+            assert board.top(10) == expected[:10]
+            probe = rng.choice(users)
+            rank = next((r for r, u, _ in expected if u == probe), None)
+            assert board.rank(probe) == rank
+            radius = rng.randrange(0, 4)
+            around = expected[max(0, rank - 1 - radius):rank + radius] if rank else []
+            assert board.around(probe, radius) == around
+        assert len(board) == len(points)
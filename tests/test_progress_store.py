@@ -0,0 +1,131 @@
+"""SQLiteProgressStore batching: reads see unflushed deltas exactly once."""
+from __future__ import annotations
+
+import sqlite3
+import threading
+
+import pytest
+
+from services.progress_store import PointEvent, ProgressDelta, SQLiteProgressStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "progress.db")
+
+
+def _store(path):
+    # A long interval keeps the background flusher out of the way; tests flush by hand
+    return SQLiteProgressStore(path, flush_interval=3600)
+
+
+def _points(user_id, points, lesson=None, course_id=None):
+    return ProgressDelta(
+        user_id,
+        total_points=points,
+        completed_lessons={lesson} if lesson else set(),
+        counters={"submissions": 1},
+        events=[PointEvent(user_id, points, 0.0 if course_id is None else 1e12, course_id)],
+    )
+
+
+def test_reads_include_pending_deltas_before_and_after_flush(db_path) -> None:
+    store = _store(db_path)
+    store.apply(_points("ada", 10, "l1"))
+    store.apply(_points("ada", 5, "l2"))
+    before = store.load("ada")
+    store.flush()
+    after = store.load("ada")
+    assert before == after
+    assert after["total_points"] == 15
+    assert after["completed_lessons"] == ["l1", "l2"]
+    assert after["counters"] == {"submissions": 2}
+    assert store.load("nobody") is None
+
+
+def test_writers_on_one_file_add_up(db_path) -> None:
+    first, second = _store(db_path), _store(db_path)
+    for _ in range(3):
+        first.apply(_points("ada", 1, "shared"))
+        second.apply(_points("ada", 2, "shared"))
+    first.flush()
+    second.flush()
+    row = _store(db_path).load("ada")
+    assert row["total_points"] == 9
+    assert row["completed_lessons"] == ["shared"]
+    assert row["counters"] == {"submissions": 6}
+
+
+def test_load_during_a_flush_counts_the_batch_once(db_path, monkeypatch) -> None:
+    store = _store(db_path)
+    store.apply(_points("ada", 10))
+    store.flush()
+    store.apply(_points("ada", 7))
+
+    written, resume = threading.Event(), threading.Event()
+    write = store._write
+
+    def slow_write(db, batch):
+        write(db, batch)
+        written.set()
+        resume.wait(5)
+
+    monkeypatch.setattr(store, "_write", slow_write)
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    assert written.wait(5)
+    # The batch is written but not committed; this process must still see it once
+    assert store.load("ada")["total_points"] == 17
+    assert store.changed_points(0)[0] == {"ada": 17}
+    resume.set()
+    flusher.join(5)
+    assert store.load("ada")["total_points"] == 17
+
+
+def test_failed_flush_keeps_the_batch_for_the_next_one(db_path, monkeypatch) -> None:
+    store = _store(db_path)
+    store.apply(_points("ada", 4, "l1"))
+
+    def fail(db, batch):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(store, "_write", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+    store.apply(_points("ada", 1, "l2"))
+    assert store.load("ada")["total_points"] == 5
+
+    monkeypatch.undo()
+    store.flush()
+    row = _store(db_path).load("ada")
+    assert row["total_points"] == 5
+    assert row["completed_lessons"] == ["l1", "l2"]
+
+
+def test_changed_points_cursor_and_top(db_path) -> None:
+    store = _store(db_path)
+    store.apply(_points("ada", 3))
+    store.apply(_points("bob", 8))
+    store.flush()
+    changed, cursor = store.changed_points(0)
+    assert changed == {"ada": 3, "bob": 8}
+    assert store.changed_points(cursor) == ({}, cursor)
+
+    store.apply(_points("ada", 10))
+    store.flush()
+    changed, _ = store.changed_points(cursor)
+    assert changed == {"ada": 13}
+    assert [row["user_id"] for row in store.top(2)] == ["ada", "bob"]
+
+
+def test_point_events_skip_the_writing_process(db_path) -> None:
+    writer, reader = _store(db_path), _store(db_path)
+    writer.apply(_points("ada", 6, course_id="python"))
+    writer.flush()
+    assert writer.point_events(0)[0] == []
+    events, cursor = reader.point_events(0)
+    assert [(e.user_id, e.points, e.course_id) for e in events] == [("ada", 6, "python")]
+    assert reader.point_events(cursor) == ([], cursor)
+    history = reader.point_history(0)
+    assert history.course_points == {"python": {"ada": 6}}
+    assert history.cursor == cursor
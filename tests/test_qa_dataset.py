@@ -0,0 +1,59 @@
+"""Randomized checks of the streaming JSON array reader against json.loads."""
+from __future__ import annotations
+
+import io
+import json
+import random
+from typing import Any
+
+import pytest
+
+from services import qa_dataset
+from services.qa_dataset import _iter_json_array
+
+ALPHABET = 'ab ,[]{}":\\\n\té😀'
+
+
+def _random_value(rng: random.Random, depth: int = 0) -> Any:
+    kind = rng.randrange(7 if depth < 3 else 5)
+    if kind == 0:
+        return rng.randrange(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rng.uniform(-1e6, 1e6)
+    if kind == 2:
+        return "".join(rng.choice(ALPHABET) for _ in range(rng.randrange(30)))
+    if kind == 3:
+        return rng.choice([True, False, None])
+    if kind == 4:
+        return {"question": "q" * rng.randrange(5), "answer": rng.random()}
+    if kind == 5:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f"k{i}": _random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+
+
+def _random_document(rng: random.Random, items: list) -> str:
+    # Vary whitespace and separators so element boundaries fall anywhere in a chunk
+    space = lambda: "".join(rng.choice(" \n\t") for _ in range(rng.randrange(3)))
+    parts = [space() + json.dumps(item, ensure_ascii=rng.random() < 0.5) + space() for item in items]
+    return space() + "[" + ",".join(parts) + "]" + space()
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_iter_json_array_matches_json_loads(seed: int, monkeypatch: pytest.MonkeyPatch) -> None:
+    rng = random.Random(seed)
+    monkeypatch.setattr(qa_dataset, "READ_CHUNK_SIZE", rng.choice([1, 2, 3, 7, 16, 64]))
+    items = [_random_value(rng) for _ in range(rng.randrange(25))]
+    document = _random_document(rng, items)
+
+    assert list(_iter_json_array(io.StringIO(document))) == json.loads(document)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_iter_json_array_rejects_truncated_input(seed: int, monkeypatch: pytest.MonkeyPatch) -> None:
+    rng = random.Random(seed)
+    monkeypatch.setattr(qa_dataset, "READ_CHUNK_SIZE", rng.choice([1, 4, 16]))
+    document = _random_document(rng, [_random_value(rng) for _ in range(rng.randrange(1, 10))])
+    truncated = document[:document.rindex("]")]
+
+    with pytest.raises(ValueError):
+        list(_iter_json_array(io.StringIO(truncated)))
@@ -0,0 +1,178 @@
+"""QAEngine writes, compaction and cross-process reloads, end to end."""
+from __future__ import annotations
+
+import glob
+import json
+import mmap
+import os
+import time
+from dataclasses import replace
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from services.qa_dataset import iter_entries
+from services.qa_engine import NO_ANSWER, QAEngine
+from services.qa_index import MappedVocabulary
+
+MODES = {
+    "exact": {},
+    "sharded": {"shard_workers": 2},
+    "ann": {"retrieval": "ann", "ann_probe": 64},
+    "hashing": {"features": "hashing"},
+}
+
+
+@pytest.fixture(params=sorted(MODES))
+def make_engine(request, tmp_path):
+    dataset = str(tmp_path / "qa.json")
+    index_dir = str(tmp_path / "index")
+
+    def make(**kwargs):
+        options = dict(MODES[request.param], compact_interval=None, reload_interval=0.0)
+        options.update(kwargs)
+        return QAEngine(dataset, index_dir=index_dir, **options)
+
+    return make
+
+
+def _questions(path):
+    return sorted(entry["question"] for entry in iter_entries(path))
+
+
+def test_upserted_entry_is_found_by_terms_the_fit_never_saw(make_engine) -> None:
+    engine = make_engine()
+    engine.upsert("What is a monad?", "A monad wraps values with bind and unit.", "Programming")
+    result = engine.answer("monad bind", "Programming")
+    assert result.sources[0].question == "What is a monad?"
+    assert result.confidence > 0
+
+    engine.compact()
+    assert "What is a monad?" in _questions(engine.dataset_path)
+    assert engine.answer("monad bind", "Programming").sources[0].question == "What is a monad?"
+
+
+def test_upsert_replaces_and_delete_tombstones(make_engine) -> None:
+    engine = make_engine()
+    size = engine.size
+    engine.upsert("Explain binary search", "Halve a sorted range until the target is found.", "Computer Science")
+    assert engine.size == size
+    result = engine.answer("binary search", "Computer Science")
+    assert result.answer == "Halve a sorted range until the target is found."
+
+    assert engine.delete("Explain binary search", "Computer Science")
+    assert not engine.delete("Explain binary search", "Computer Science")
+    assert engine.size == size - 1
+    assert all(s.question != "Explain binary search" for s in engine.answer("binary search").sources)
+
+    engine.compact()
+    assert "Explain binary search" not in _questions(engine.dataset_path)
+    assert engine.size == size - 1
+
+
+def test_fully_tombstoned_snapshot_has_no_answer(make_engine) -> None:
+    engine = make_engine()
+    segments = engine._segments
+    # Only reachable through another process's deletes; delete() refuses the last entry
+    engine._segments = replace(segments, dead=np.arange(segments.rows))
+    result = engine.answer("binary search", "Computer Science")
+    assert (result.answer, result.confidence, result.sources) == (NO_ANSWER, 0.0, [])
+    assert engine.answer_many(["a", "b"], ["General", "Physics"])[1].answer == NO_ANSWER
+
+
+def test_the_last_entry_is_never_deleted(make_engine, tmp_path) -> None:
+    engine = make_engine()
+    questions = [(s.question, s.subject) for s in engine.answer("x", top_k=10).sources]
+    for question, subject in questions[:-1]:
+        assert engine.delete(question, subject)
+    with pytest.raises(ValueError):
+        engine.delete(*questions[-1])
+    engine.compact()
+    assert _questions(engine.dataset_path) == [questions[-1][0]]
+
+
+def test_compaction_to_an_empty_corpus_drops_the_delete(make_engine) -> None:
+    first, second = make_engine(), make_engine()
+    entries = [(e["question"], e["subject"]) for e in iter_entries(first.dataset_path)]
+    for question, subject in entries[:-1]:
+        first.delete(question, subject)
+    first.compact()
+    # The other process has not reloaded yet, so it may still delete the survivor
+    second.delete(*entries[-1])
+    second.compact()
+    assert _questions(second.dataset_path) == [entries[-1][0]]
+    assert second.size == 1
+    assert second.answer(entries[-1][0]).sources[0].question == entries[-1][0]
+
+
+def test_empty_dataset_is_refused_before_anything_is_saved(tmp_path) -> None:
+    dataset = tmp_path / "qa.json"
+    dataset.write_text("[]")
+    index_dir = tmp_path / "index"
+    with pytest.raises(ValueError):
+        QAEngine(str(dataset), index_dir=str(index_dir), compact_interval=None)
+    assert not index_dir.exists() or not os.listdir(index_dir)
+
+
+def test_workers_pick_up_another_workers_compaction(make_engine) -> None:
+    writer, reader = make_engine(), make_engine()
+    reader.upsert("What is a closure?", "A function with its captured scope.", "Programming")
+    writer.upsert("What is a monad?", "A monad wraps values with bind and unit.", "Programming")
+    writer.compact()
+
+    reader.answer("warm up")
+    reader.compact()  # Joins the reload the answer started
+    assert reader.answer("monad bind").sources[0].question == "What is a monad?"
+    # The reader's own unsaved write survives the reload and is merged into the file
+    assert reader.answer("closure captured scope").sources[0].question == "What is a closure?"
+    assert {"What is a monad?", "What is a closure?"} <= set(_questions(reader.dataset_path))
+
+
+def test_writes_are_compacted_after_the_interval(make_engine) -> None:
+    engine = make_engine(compact_interval=0.05)
+    engine.upsert("What is a monad?", "A monad wraps values with bind and unit.", "Programming")
+    deadline = time.monotonic() + 10
+    while "What is a monad?" not in _questions(engine.dataset_path):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    with open(engine.dataset_path, encoding="utf-8") as f:
+        assert len(json.load(f)) == engine.size
+
+
+def test_mapped_vocabulary_matches_the_fitted_one(tmp_path) -> None:
+    documents = ["Ünïcode café naïve résumé", "zebra apple über", "über alles 日本語 テキスト", "a b c"]
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2)).fit(documents)
+    MappedVocabulary.save(str(tmp_path), vectorizer.vocabulary_)
+    mapped = MappedVocabulary.load(str(tmp_path))
+    assert dict(mapped) == vectorizer.vocabulary_
+    assert "missing" not in mapped and "" not in mapped and "zzz" not in mapped
+    with pytest.raises(KeyError):
+        mapped["aaa"]
+
+
+def test_reloaded_index_answers_like_the_fitted_one(make_engine) -> None:
+    fitted = make_engine()
+    loaded = make_engine()
+    if loaded.features == "tfidf":
+        assert isinstance(loaded.vectorizer.vocabulary_, MappedVocabulary)
+    for question in ["binary search", "pythagorean triangle", "force mass", "essay thesis claim"]:
+        assert loaded.answer(question) == fitted.answer(question)
+
+
+def test_shards_are_loaded_from_the_saved_grouping(tmp_path) -> None:
+    dataset, index_dir = str(tmp_path / "qa.json"), str(tmp_path / "index")
+    fitted = QAEngine(dataset, index_dir=index_dir, shard_workers=2, compact_interval=None)
+    loaded = QAEngine(dataset, index_dir=index_dir, shard_workers=2, compact_interval=None)
+    assert glob.glob(os.path.join(index_dir, "*-tfidf", "grouped", "perm.npy"))
+    for shard in loaded._segments.shards:
+        # Views of the saved files, not private copies
+        assert _mapped(shard.matrix.data) and _mapped(shard.matrix.indices) and _mapped(shard.rows)
+    for question in ["binary search", "pythagorean triangle", "force mass"]:
+        assert loaded.answer(question, "Physics") == fitted.answer(question, "Physics")
+
+
+def _mapped(array: np.ndarray) -> bool:
+    while isinstance(array, np.ndarray) and not isinstance(array, np.memmap):
+        array = array.base
+    return isinstance(array, (np.memmap, mmap.mmap))